@@ -0,0 +1,488 @@
+"""
+Capa de mutaciones sobre la hoja de cálculo.
+
+En lugar de reescribir la hoja completa en cada guardado, los cambios se
+expresan como mutaciones por fila (agregar / parchear / borrar) y cada
+backend ("hoja") las traduce a las escrituras mínimas necesarias.
+
+Cada escritura sella las filas que toca con una revisión (`revision`,
+`updated_at`) y actualiza la revisión global de la hoja. Así otros clientes
+detectan cambios con una lectura de dos celdas y traen solo esas filas.
+"""
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from cuota import ESCRITURA, LECTURA
+from metricas import medido
+
+# --- TIPOS DE MUTACIÓN ---
+AGREGAR = 'agregar'
+PARCHEAR = 'parchear'
+BORRAR = 'borrar'
+
+
+@dataclass
+class Mutacion:
+    """
+    Cambio sobre una fila identificada por `id`.
+    - agregar: `cambios` es la fila completa.
+    - parchear: `cambios` contiene solo las columnas modificadas.
+    - borrar: `cambios` se ignora.
+    """
+    tipo: str
+    id: int
+    cambios: dict = field(default_factory=dict)
+
+
+class BloqueoSeguridad(Exception):
+    """La operación dejaría la hoja vacía."""
+
+
+# Hoja auxiliar con la revisión global (A1) y el sello de la última escritura (B1)
+HOJA_META = '_meta'
+
+
+# --- SECUENCIA DE IDS ---
+class SecuenciaIds:
+    """
+    Genera ids nuevos sin releer la hoja. Se alimenta con los ids que se van
+    viendo al cargar datos para no colisionar con filas agregadas por otros.
+    """
+    def __init__(self, ultimo=0):
+        self._ultimo = int(ultimo)
+        self._lock = threading.Lock()
+
+    def observar(self, ids):
+        ids = pd.to_numeric(pd.Series(ids, dtype=object), errors='coerce').dropna()
+        if ids.empty:
+            return
+        with self._lock:
+            self._ultimo = max(self._ultimo, int(ids.max()))
+
+    def siguiente(self):
+        with self._lock:
+            self._ultimo += 1
+            return self._ultimo
+
+    def reservar(self, n):
+        """Reserva `n` ids consecutivos y los devuelve como lista."""
+        with self._lock:
+            inicio = self._ultimo + 1
+            self._ultimo += n
+            return list(range(inicio, inicio + n))
+
+
+# --- UTILIDADES ---
+def _a_celda(valor):
+    """Convierte un valor de pandas/numpy a algo serializable para Sheets."""
+    if valor is None:
+        return ''
+    if isinstance(valor, bytes):
+        return valor.hex()
+    if hasattr(valor, 'item'):  # escalares numpy
+        valor = valor.item()
+    if isinstance(valor, float) and pd.isna(valor):
+        return ''
+    if valor is pd.NA or valor is pd.NaT:
+        return ''
+    return valor
+
+
+def _entero(valor):
+    try:
+        return int(float(valor))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _a1(fila, columna):
+    # Import diferido: gspread arrastra google-auth, y solo lo usa HojaGSheets
+    from gspread.utils import rowcol_to_a1
+    return rowcol_to_a1(fila, columna)
+
+
+def _letra_columna(n):
+    return _a1(1, n)[:-1]
+
+
+def sellar_mutaciones(mutaciones, revision, sello):
+    """Copia de `mutaciones` con `revision`/`updated_at` en cada alta y parche."""
+    marcas = {'revision': revision, 'updated_at': sello}
+    return [
+        Mutacion(m.tipo, m.id, m.cambios | marcas)
+        if m.tipo == AGREGAR or (m.tipo == PARCHEAR and m.cambios) else m
+        for m in mutaciones
+    ]
+
+
+def cambios_de_fila(actual, nuevos):
+    """
+    Devuelve solo las columnas de `nuevos` cuyo valor difiere de `actual`.
+    """
+    cambios = {}
+    for col, val in nuevos.items():
+        if col not in actual or str(_a_celda(actual[col])) != str(_a_celda(val)):
+            cambios[col] = val
+    return cambios
+
+
+@medido('hoja.escribir')
+def aplicar_mutaciones(hoja, mutaciones):
+    """
+    Envía un lote de mutaciones a la hoja agrupándolas por tipo:
+    una escritura para las altas, una para los parches y una para las bajas.
+    Devuelve las mutaciones selladas con la nueva revisión (tal como
+    quedaron en la hoja).
+    """
+    revision, _ = hoja.revision()
+    revision += 1
+    sello = datetime.now(timezone.utc).isoformat(timespec='microseconds')
+    mutaciones = sellar_mutaciones(mutaciones, revision, sello)
+
+    altas = [m.cambios | {'id': m.id} for m in mutaciones if m.tipo == AGREGAR]
+    parches = {}
+    for m in mutaciones:
+        if m.tipo == PARCHEAR and m.cambios:
+            parches.setdefault(m.id, {}).update(m.cambios)
+    bajas = [m.id for m in mutaciones if m.tipo == BORRAR]
+
+    try:
+        if altas:
+            hoja.agregar(altas)
+        if parches:
+            hoja.parchear(parches)
+        if bajas:
+            hoja.borrar(bajas)
+    finally:
+        # Aunque las bajas fallen, las altas/parches ya escritos deben verse
+        hoja.sellar(revision, sello)
+    return mutaciones
+
+
+def _tramos(mutaciones):
+    """Agrupa mutaciones consecutivas del mismo tipo (respetando el orden)."""
+    tramo = []
+    for m in mutaciones:
+        if tramo and tramo[-1].tipo != m.tipo:
+            yield tramo[0].tipo, tramo
+            tramo = []
+        tramo.append(m)
+    if tramo:
+        yield tramo[0].tipo, tramo
+
+
+def _alinear_categorias(df, filas):
+    """
+    Da a las columnas de `filas` el mismo tipo categórico que en `df`
+    (sumando los valores nuevos) para que el concat no las pase a object.
+    """
+    for col in filas.columns:
+        if col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype):
+            nuevas = pd.Index(filas[col].dropna().unique()).difference(df[col].cat.categories)
+            if len(nuevas):
+                df[col] = df[col].cat.add_categories(nuevas)
+            filas[col] = filas[col].astype(df[col].dtype)
+    return filas
+
+
+def aplicar_en_frame(df, mutaciones):
+    """
+    Aplica mutaciones sobre una copia de `df` y la devuelve. Las altas y
+    bajas consecutivas se aplican en bloque (un concat / un filtro).
+    """
+    df = df.copy()
+    for tipo, tramo in _tramos(mutaciones):
+        if tipo == AGREGAR:
+            filas = _alinear_categorias(df, pd.DataFrame([m.cambios | {'id': m.id} for m in tramo]))
+            df = filas if df.empty and not len(df.columns) else pd.concat([df, filas], ignore_index=True)
+        elif tipo == PARCHEAR:
+            ids = pd.Index(df['id'])
+            if ids.is_unique:
+                posiciones = ids.get_indexer([m.id for m in tramo])
+            else:
+                # Ids repetidos en la hoja: se parchea la primera aparición
+                primera = {i: n for n, i in reversed(list(enumerate(df['id'])))}
+                posiciones = [primera.get(m.id, -1) for m in tramo]
+            for m, pos in zip(tramo, posiciones):
+                if pos < 0:
+                    continue
+                for col, val in m.cambios.items():
+                    if col not in df.columns:
+                        df[col] = None
+                    try:
+                        df.iat[pos, df.columns.get_loc(col)] = val
+                    except (TypeError, ValueError):
+                        if isinstance(df[col].dtype, pd.CategoricalDtype) and isinstance(val, str):
+                            # Valor nuevo en una columna categórica: se suma a las categorías
+                            df[col] = df[col].cat.add_categories([val])
+                        else:
+                            # Tipo incompatible con la columna (p.ej. texto en int)
+                            df[col] = df[col].astype(object)
+                        df.iat[pos, df.columns.get_loc(col)] = val
+        elif tipo == BORRAR:
+            df = df[~df['id'].isin([m.id for m in tramo])]
+    return df.reset_index(drop=True)
+
+
+# --- BACKEND GOOGLE SHEETS ---
+class HojaGSheets:
+    """
+    Backend sobre `GSheetsConnection`. Las lecturas siguen pasando por
+    `conn.read`; las escrituras usan la hoja de gspread directamente para
+    tocar solo las filas/celdas afectadas.
+
+    Con `limitador` (un `LimitadorCuota`), cada llamada a la API espera su
+    turno dentro de la cuota y se reintenta ante 429 / errores transitorios.
+    """
+    def __init__(self, conn, limitador=None):
+        self.conn = conn
+        self.limitador = limitador
+        self._ws = None
+        self._ws_meta = None
+        self._encabezado = None
+
+    def _api(self, tipo, funcion, *args, **kwargs):
+        if self.limitador is None:
+            return funcion(*args, **kwargs)
+        return self.limitador.llamar(tipo, funcion, *args, **kwargs)
+
+    def _worksheet(self):
+        if self._ws is None:
+            # El cliente de cuenta de servicio expone la hoja de gspread
+            self._ws = self._api(LECTURA, self.conn.client._select_worksheet)
+        return self._ws
+
+    def _columnas(self, necesarias=()):
+        """Encabezado de la hoja, agregando las columnas que falten."""
+        ws = self._worksheet()
+        if self._encabezado is None:
+            self._encabezado = self._api(LECTURA, ws.row_values, 1)
+        faltantes = [c for c in necesarias if c not in self._encabezado]
+        if faltantes:
+            total = len(self._encabezado) + len(faltantes)
+            if ws.col_count < total:
+                self._api(ESCRITURA, ws.add_cols, total - ws.col_count)
+            inicio = len(self._encabezado) + 1
+            self._api(ESCRITURA, ws.batch_update, [{
+                'range': _a1(1, inicio + i),
+                'values': [[c]],
+            } for i, c in enumerate(faltantes)])
+            self._encabezado = self._encabezado + faltantes
+        return self._encabezado
+
+    def _filas_por_id(self):
+        """Mapa id -> número de fila (1-based, con encabezado en la fila 1)."""
+        col_id = self._columnas(['id']).index('id') + 1
+        valores = self._api(LECTURA, self._worksheet().col_values, col_id)[1:]
+        filas = {}
+        for n, v in enumerate(valores, start=2):
+            try:
+                filas[int(float(v))] = n
+            except (TypeError, ValueError):
+                continue
+        return filas
+
+    def _meta(self, crear=False):
+        import gspread
+        if self._ws_meta is None:
+            libro = self._worksheet().spreadsheet
+            try:
+                self._ws_meta = self._api(LECTURA, libro.worksheet, HOJA_META)
+            except gspread.WorksheetNotFound:
+                if not crear:
+                    return None
+                self._ws_meta = self._api(ESCRITURA, libro.add_worksheet, HOJA_META, rows=1, cols=2)
+        return self._ws_meta
+
+    def leer(self, ttl=600):
+        return self._api(LECTURA, self.conn.read, ttl=ttl)
+
+    def revision(self):
+        """(revisión, sello) de la última escritura: una lectura de 2 celdas."""
+        meta = self._meta()
+        if meta is None:
+            return 0, ''
+        valores = ((self._api(LECTURA, meta.get, 'A1:B1') or [[]])[0] + ['', ''])[:2]
+        return _entero(valores[0]), str(valores[1])
+
+    def sellar(self, revision, sello):
+        meta = self._meta(crear=True)
+        self._api(ESCRITURA, meta.update, range_name='A1:B1', values=[[revision, sello]], raw=True)
+
+    def versiones(self):
+        """
+        id -> (número de fila, revisión), leyendo solo las columnas `id` y
+        `revision` en una única llamada.
+        """
+        # Otro cliente pudo haber agregado columnas (p.ej. la primera vez que sella)
+        self._encabezado = None
+        encabezado = self._columnas(['id'])
+        rangos = [f"{_letra_columna(encabezado.index(c) + 1)}2:{_letra_columna(encabezado.index(c) + 1)}"
+                  for c in ('id', 'revision') if c in encabezado]
+        datos = self._api(LECTURA, self._worksheet().batch_get, rangos)
+        ids = [f[0] if f else '' for f in datos[0]]
+        revisiones = [f[0] if f else '' for f in datos[1]] if len(datos) > 1 else []
+        revisiones += [''] * (len(ids) - len(revisiones))
+
+        versiones = {}
+        for n, (i, rev) in enumerate(zip(ids, revisiones), start=2):
+            try:
+                versiones[int(float(i))] = (n, _entero(rev))
+            except (TypeError, ValueError):
+                continue
+        return versiones
+
+    def leer_filas(self, filas):
+        """Frame con las filas `filas` (números de fila de la hoja), en ese orden."""
+        encabezado = self._columnas()
+        if not filas:
+            return pd.DataFrame(columns=encabezado)
+        ultima = _letra_columna(len(encabezado))
+        datos = self._api(LECTURA, self._worksheet().batch_get, [f"A{n}:{ultima}{n}" for n in filas])
+        registros = [
+            ((d[0] if d else []) + [''] * len(encabezado))[:len(encabezado)]
+            for d in datos
+        ]
+        # Celdas vacías como None (igual que NaN en la lectura completa)
+        return pd.DataFrame(registros, columns=encabezado).replace('', None)
+
+    def agregar(self, filas):
+        encabezado = self._columnas(dict.fromkeys(c for f in filas for c in f))
+        valores = [[_a_celda(f.get(c)) for c in encabezado] for f in filas]
+        self._api(
+            ESCRITURA, self._worksheet().append_rows, valores,
+            value_input_option='RAW', table_range='A1'
+        )
+
+    def parchear(self, cambios_por_id):
+        encabezado = self._columnas(dict.fromkeys(c for cambios in cambios_por_id.values() for c in cambios))
+        filas = self._filas_por_id()
+        datos = []
+        for id_vino, cambios in cambios_por_id.items():
+            fila = filas.get(int(id_vino))
+            if fila is None:
+                continue
+            for col, val in cambios.items():
+                datos.append({
+                    'range': _a1(fila, encabezado.index(col) + 1),
+                    'values': [[_a_celda(val)]],
+                })
+        if datos:
+            self._api(ESCRITURA, self._worksheet().batch_update, datos, value_input_option='RAW')
+
+    def borrar(self, ids):
+        filas = self._filas_por_id()
+        a_borrar = sorted({filas[int(i)] for i in ids if int(i) in filas}, reverse=True)
+        if not a_borrar:
+            return
+        if len(a_borrar) >= len(filas):
+            raise BloqueoSeguridad('La operación dejaría la hoja vacía.')
+        ws = self._worksheet()
+        # De abajo hacia arriba para que los índices no se desplacen
+        self._api(ESCRITURA, ws.spreadsheet.batch_update, {'requests': [{
+            'deleteDimension': {
+                'range': {
+                    'sheetId': ws.id,
+                    'dimension': 'ROWS',
+                    'startIndex': fila - 1,
+                    'endIndex': fila,
+                }
+            }
+        } for fila in a_borrar]})
+
+
+# --- BACKEND LOCAL (PRUEBAS) ---
+class HojaEnMemoria:
+    """
+    Sustituto local de la hoja con la misma interfaz que `HojaGSheets`.
+    Registra cada llamada y las celdas enviadas para poder verificar
+    cuánto se escribe en cada operación.
+
+    `errores` es una lista de excepciones (p.ej. `ErrorHttp(429)`) que se
+    lanzan, una por llamada, antes de tocar los datos; sirve para probar
+    el `limitador` igual que con `HojaGSheets`.
+    """
+    def __init__(self, df=None, limitador=None, errores=()):
+        self.df = df.copy() if df is not None else pd.DataFrame(columns=['id'])
+        self.limitador = limitador
+        self.errores = list(errores)
+        self.llamadas = []
+        self.celdas_escritas = 0
+        self.meta = (0, '')
+
+    def _api(self, tipo, funcion, *args):
+        def llamada():
+            if self.errores:
+                raise self.errores.pop(0)
+            return funcion(*args)
+        if self.limitador is None:
+            return llamada()
+        return self.limitador.llamar(tipo, llamada)
+
+    def leer(self, ttl=None):
+        return self._api(LECTURA, self._leer)
+
+    def _leer(self):
+        self.llamadas.append(('leer', len(self.df)))
+        return self.df.copy()
+
+    def revision(self):
+        return self._api(LECTURA, self._revision)
+
+    def _revision(self):
+        self.llamadas.append(('revision', 1))
+        return self.meta
+
+    def sellar(self, revision, sello):
+        self._api(ESCRITURA, setattr, self, 'meta', (revision, sello))
+
+    def versiones(self):
+        return self._api(LECTURA, self._versiones)
+
+    def _versiones(self):
+        self.llamadas.append(('versiones', len(self.df)))
+        revisiones = self.df['revision'] if 'revision' in self.df.columns else [0] * len(self.df)
+        return {
+            _entero(i): (n, _entero(rev))
+            for n, (i, rev) in enumerate(zip(self.df['id'], revisiones), start=2)
+        }
+
+    def leer_filas(self, filas):
+        return self._api(LECTURA, self._leer_filas, filas)
+
+    def _leer_filas(self, filas):
+        self.llamadas.append(('leer_filas', len(filas)))
+        return self.df.iloc[[n - 2 for n in filas]].reset_index(drop=True)
+
+    def agregar(self, filas):
+        self._api(ESCRITURA, self._agregar, filas)
+
+    def _agregar(self, filas):
+        self.llamadas.append(('agregar', len(filas)))
+        self.celdas_escritas += sum(len(f) for f in filas)
+        self.df = aplicar_en_frame(self.df, [Mutacion(AGREGAR, f['id'], f) for f in filas])
+
+    def parchear(self, cambios_por_id):
+        self._api(ESCRITURA, self._parchear, cambios_por_id)
+
+    def _parchear(self, cambios_por_id):
+        self.llamadas.append(('parchear', len(cambios_por_id)))
+        self.celdas_escritas += sum(len(c) for c in cambios_por_id.values())
+        self.df = aplicar_en_frame(
+            self.df, [Mutacion(PARCHEAR, i, c) for i, c in cambios_por_id.items()]
+        )
+
+    def borrar(self, ids):
+        self._api(ESCRITURA, self._borrar, ids)
+
+    def _borrar(self, ids):
+        existentes = set(self.df['id']) & set(ids)
+        if not existentes:
+            return
+        if len(existentes) >= len(self.df):
+            raise BloqueoSeguridad('La operación dejaría la hoja vacía.')
+        self.llamadas.append(('borrar', len(existentes)))
+        self.df = self.df[~self.df['id'].isin(existentes)].reset_index(drop=True)
@@ -1,17 +1,29 @@
+import time
+inicio_script = time.perf_counter()
+
 import streamlit as st
 import pandas as pd
-from streamlit_gsheets import GSheetsConnection
-from duckduckgo_search import DDGS
-import requests
-from io import BytesIO
-import base64
-from PIL import Image
-import io
-import time
-import random
 from datetime import datetime
 import traceback
 
+from almacen import AGREGAR, PARCHEAR, BORRAR, Mutacion, BloqueoSeguridad, cambios_de_fila
+from imagenes import MIME, PERSISTENTE, procesar_lote, resumen_lote
+from importador import importar, OMITIR, FUSIONAR, DUPLICAR
+from sommelier import IndiceFacetas, PesosRecomendacion, recomendar
+from vocabulario import UVAS_BASE_ESTANDAR, limpiar_valor, partes_blend
+from consumo import ahora_iso, cambios_de_consumo, consumidos_recientes
+from paginado import TAMANOS_PAGINA, texto_busqueda, filtrar_texto, ordenar, pagina, reubicar_seleccion
+from escritor import PENDIENTE, ERROR
+from metricas import medido, tramo, iniciar_rerun, terminar_rerun
+from recursos import (
+    obtener_limitador, obtener_imagenes, obtener_pool_imagenes, obtener_secuencia, obtener_cliente_web,
+    obtener_replica, obtener_sincronizacion, obtener_inventario, obtener_escritor, precalentar
+)
+import arranque
+
+# Solo cuenta en el primer script del proceso (después los módulos ya están cargados)
+arranque.registrar('importaciones', (time.perf_counter() - inicio_script) * 1000)
+
 # --- CONFIGURACIÓN DE PÁGINA ---
 st.set_page_config(
     page_title="Mi Vinoteca V5.5",
@@ -19,6 +31,13 @@ st.set_page_config(
     layout="wide"
 )
 
+# --- MÉTRICAS ---
+# Descarta el registro de un rerun cortado por st.rerun / st.stop
+terminar_rerun()
+# Panel de tiempos: checkbox en la barra lateral o ?debug=1 en la URL
+panel_debug = st.session_state.get('panel_debug') or st.query_params.get('debug') == '1'
+registro_rerun = iniciar_rerun('app') if panel_debug else None
+
 # --- CONSTANTES ---
 UBICACIONES = [
     'Por Clasificar',
@@ -37,289 +56,461 @@ UBICACIONES = [
     'Consumido' # Ubicación especial para historial
 ]
 
-UVAS_BASE_ESTANDAR = [
-    'Malbec', 'Cabernet Sauvignon', 'Merlot', 'Syrah', 'Chardonnay', 
-    'Pinot Noir', 'Torrontés', 'Bonarda', 'Petit Verdot', 'Cabernet Franc', 
-    'Blend', 'Otro'
-]
-
 # --- BASE DE DATOS ---
-# --- BASE DE DATOS (GOOGLE SHEETS) ---
-def get_conn():
-    return st.connection("gsheets", type=GSheetsConnection)
+# Réplica, hoja, inventario y escritor son recursos del proceso (recursos.py)
+@medido('cargar_vinos')
+def obtener_instantanea():
+    """
+    Instantánea parseada compartida entre sesiones (frame + índice por id).
+    Todas las lecturas de un rerun pasan por aquí sin volver a la hoja.
+    """
+    try:
+        return obtener_inventario().obtener()
+    except Exception as e:
+        st.error(f"Error leyendo la réplica local: {e}")
+        return None
+
+def obtener_indice(nombre):
+    """Índice incremental del inventario (None si la hoja no se pudo leer)."""
+    try:
+        return obtener_inventario().indice(nombre)
+    except Exception:
+        return None
 
 def cargar_vinos():
-    conn = get_conn()
-    for attempt in range(3):
-        try:
-            # TTL=600 (10 min) para evitar error 429 Quota Exceeded
-            df = conn.read(ttl=600)
-            # Convertir a numérico
-            cols_num = ['id', 'anada', 'anio_limite', 'puntuacion']
-            for c in cols_num:
-                if c in df.columns:
-                    df[c] = pd.to_numeric(df[c], errors='coerce').fillna(0).astype(int)
-            
-            # Manejo de imágenes (Hex str -> Bytes)
-            if 'imagen_data' in df.columns:
-                 df['imagen_data'] = df['imagen_data'].apply(
-                     lambda x: bytes.fromhex(x) if isinstance(x, str) and x else None
-                 )
-                 
-            return df
-        except Exception as e:
-            if attempt < 2:
-                # Backoff progresivo: 2s, luego 5s
-                wait_time = 2 if attempt == 0 else 5
-                time.sleep(wait_time)
-                continue
-            else:
-                st.error(f"Error persistente leyendo Google Sheets: {e}")
-                return pd.DataFrame()
-    return pd.DataFrame()
+    snap = obtener_instantanea()
+    return snap.df if snap is not None else pd.DataFrame()
 
 
-def safe_update(df_to_save):
+@medido('safe_update')
+def safe_update(mutaciones, mensaje="✅ ¡Guardado correctamente!"):
     """
-    Función de guardado seguro que valida que el DataFrame no esté vacío
-    antes de enviar los datos a Google Sheets.
+    Función de guardado seguro: los cambios se ven en el acto (instantánea
+    en memoria) y el escritor de fondo los guarda en la réplica local, de
+    donde el sincronizador envía a la hoja solo las filas/celdas afectadas.
+    Bloquea cualquier lote que dejaría la hoja de Google Sheets vacía.
     """
-    if df_to_save is None or df_to_save.empty:
+    if not mutaciones:
+        return
+
+    try:
+        with tramo('escritor.enviar', mutaciones=len(mutaciones)):
+            ticket = obtener_escritor().enviar(mutaciones)
+    except BloqueoSeguridad:
         st.error('⛔ BLOQUEO DE SEGURIDAD: La app intentó borrar todos los datos. Operación cancelada.')
         st.stop()
-    
-    conn = get_conn()
-    conn.update(data=df_to_save)
-    st.cache_data.clear()
-    st.success("✅ ¡Guardado en la nube correctamente!")
-    time.sleep(2)
+
+    # El resultado se informa con un toast cuando el escritor termina
+    st.session_state.escrituras_pendientes.append((ticket, mensaje))
     st.rerun()
 
 
+@st.fragment(run_every=1)
+def estado_guardado():
+    """Sondea los guardados pendientes de esta sesión y avisa al terminar."""
+    escritor = obtener_escritor()
+    restantes = []
+    for ticket, mensaje in st.session_state.escrituras_pendientes:
+        estado, error = escritor.estado(ticket)
+        if estado == PENDIENTE:
+            restantes.append((ticket, mensaje))
+        elif estado == ERROR:
+            st.session_state.error_guardado = error
+        else:
+            st.toast(mensaje)
+    st.session_state.escrituras_pendientes = restantes
+
+    if st.session_state.error_guardado:
+        # La instantánea se invalidó: un rerun completo muestra lo que hay en la réplica
+        st.rerun(scope="app")
+    if restantes:
+        st.caption("☁️ Guardando cambios...")
+
 
 def guardar_vino(datos):
-    conn = get_conn()
-    df = cargar_vinos()
-    
     # Generar ID
-    new_id = 1
-    if not df.empty and 'id' in df.columns:
-        new_id = df['id'].max() + 1
+    new_id = obtener_secuencia().siguiente()
         
     # Desempaquetar datos
     (nombre, bodega, enologo, anada, uva_principal, composicion_blend, 
      gama, procedencia, detalle, nota_cata, ubicacion, anio_limite, 
      puntuacion, imagen_data, tipo_imagen) = datos
      
-    # Convertir imagen a hex para storage (CON COMPRESIÓN)
-    img_hex, mime_type = preparar_imagen_db(imagen_data)
-    # Si preparar_imagen_db devolvió None (por error o tamaño), se guarda None.
-    # Si devolvió algo, forzamos el tipo a 'image/jpeg' que es lo que devuelve la función.
-    final_tipo_imagen = mime_type if img_hex else None
-    
-    new_row = pd.DataFrame([{
-        'id': new_id,
+    new_row = {
         'nombre': nombre, 'bodega': bodega, 'enologo': enologo, 'anada': anada,
         'uva_principal': uva_principal, 'composicion_blend': composicion_blend,
         'gama': gama, 'procedencia': procedencia, 'detalle': detalle,
         'nota_cata': nota_cata, 'ubicacion': ubicacion, 'anio_limite': anio_limite,
-        'puntuacion': puntuacion, 'imagen_data': img_hex, 'tipo_imagen': final_tipo_imagen
-    }])
+        'puntuacion': puntuacion,
+    }
+    # Imagen al almacén local; en la hoja el hash (y la copia en Hex)
+    new_row |= preparar_imagen_db(imagen_data)
+    new_row |= cambios_de_consumo(None, ubicacion)
     
-    df_updated = pd.concat([df, new_row], ignore_index=True)
-    safe_update(df_updated)
+    safe_update([Mutacion(AGREGAR, new_id, new_row)])
 
 
 def actualizar_vino(id_vino, datos):
-    conn = get_conn()
-    df = cargar_vinos()
+    actual = obtener_vino_por_id(id_vino)
     
-    if not df.empty and 'id' in df.columns:
-        idx = df[df['id'] == id_vino].index
-        if not idx.empty:
-            i = idx[0]
-            # Desempaquetar
-            (nombre, bodega, enologo, anada, uva_principal, composicion_blend, 
-             gama, procedencia, detalle, nota_cata, ubicacion, anio_limite, 
-             puntuacion, imagen_data, tipo_imagen) = datos
-             
-            img_hex, mime_type = preparar_imagen_db(imagen_data)
-            final_tipo_imagen = mime_type if img_hex else None
-            
-            df.at[i, 'nombre'] = nombre
-            df.at[i, 'bodega'] = bodega
-            df.at[i, 'enologo'] = enologo
-            df.at[i, 'anada'] = anada
-            df.at[i, 'uva_principal'] = uva_principal
-            df.at[i, 'composicion_blend'] = composicion_blend
-            df.at[i, 'gama'] = gama
-            df.at[i, 'procedencia'] = procedencia
-            df.at[i, 'detalle'] = detalle
-            df.at[i, 'nota_cata'] = nota_cata
-            df.at[i, 'ubicacion'] = ubicacion
-            df.at[i, 'anio_limite'] = anio_limite
-            df.at[i, 'puntuacion'] = puntuacion
-            df.at[i, 'imagen_data'] = img_hex
-            df.at[i, 'tipo_imagen'] = final_tipo_imagen
-            
-            
-            safe_update(df)
+    if actual:
+        # Desempaquetar
+        (nombre, bodega, enologo, anada, uva_principal, composicion_blend, 
+         gama, procedencia, detalle, nota_cata, ubicacion, anio_limite, 
+         puntuacion, imagen_data, tipo_imagen) = datos
+         
+        nuevos = {
+            'nombre': nombre, 'bodega': bodega, 'enologo': enologo, 'anada': anada,
+            'uva_principal': uva_principal, 'composicion_blend': composicion_blend,
+            'gama': gama, 'procedencia': procedencia, 'detalle': detalle,
+            'nota_cata': nota_cata, 'ubicacion': ubicacion, 'anio_limite': anio_limite,
+            'puntuacion': puntuacion,
+        }
+        nuevos |= preparar_imagen_db(imagen_data)
+        if nuevos['imagen_hash'] is None and actual.get('imagen_hash'):
+            # Foto quitada: también su copia, o la migración la traería de vuelta
+            nuevos['imagen_data'] = ''
+        nuevos |= cambios_de_consumo(actual.get('ubicacion'), ubicacion)
+        
+        # Solo se envían las celdas que cambiaron
+        safe_update([Mutacion(PARCHEAR, id_vino, cambios_de_fila(actual, nuevos))])
+
+
+def _ids_existentes(ids):
+    snap = obtener_instantanea()
+    if snap is None:
+        return []
+    return [int(i) for i in ids if int(i) in snap.por_id]
+
+
+def mover_vinos(ids, ubicacion):
+    """
+    Cambia la ubicación de varias botellas en una sola escritura. Al
+    consumir se sella `fecha_consumo`; al restaurar se borra.
+    """
+    snap = obtener_instantanea()
+    fecha = ahora_iso()
+    mutaciones = []
+    for i in _ids_existentes(ids):
+        anterior = snap.df['ubicacion'].iat[snap.por_id[i]]
+        cambios = {'ubicacion': ubicacion} | cambios_de_consumo(anterior, ubicacion, fecha)
+        mutaciones.append(Mutacion(PARCHEAR, i, cambios))
+    safe_update(mutaciones)
+
+
+def borrar_vinos(ids):
+    safe_update([Mutacion(BORRAR, i) for i in _ids_existentes(ids)])
 
 
 def registrar_consumo(id_vino):
-    conn = get_conn()
-    df = cargar_vinos()
-    if not df.empty and 'id' in df.columns:
-        idx = df[df['id'] == id_vino].index
-        if not idx.empty:
-            df.at[idx[0], 'ubicacion'] = 'Consumido'
-            safe_update(df)
+    mover_vinos([id_vino], 'Consumido')
 
 
 def restaurar_vino(id_vino):
-    conn = get_conn()
-    df = cargar_vinos()
-    if not df.empty and 'id' in df.columns:
-        idx = df[df['id'] == id_vino].index
-        if not idx.empty:
-            df.at[idx[0], 'ubicacion'] = 'Por Clasificar'
-            safe_update(df)
+    mover_vinos([id_vino], 'Por Clasificar')
 
 
 def borrar_vino(id_vino):
-    conn = get_conn()
-    df = cargar_vinos()
-    if not df.empty and 'id' in df.columns:
-        df = df[df['id'] != id_vino]
-        safe_update(df)
+    borrar_vinos([id_vino])
 
 
 def borrar_por_clasificar():
-    conn = get_conn()
-    df = cargar_vinos()
-    if not df.empty and 'ubicacion' in df.columns:
-        len_before = len(df)
-        df = df[df['ubicacion'] != 'Por Clasificar']
-        len_after = len(df)
-        safe_update(df)
-
-        return len_before - len_after
-    return 0
+    # Consulta por el índice de ubicación de la réplica, sin filtrar el frame
+    ids = obtener_replica().ids_donde(ubicacion='Por Clasificar')
+    if ids:
+        safe_update([Mutacion(BORRAR, i) for i in ids])
+    return len(ids)
 
 def obtener_vino_por_id(id_vino):
-    df = cargar_vinos()
-    if not df.empty and 'id' in df.columns:
-        row = df[df['id'] == id_vino]
-        if not row.empty:
-            return row.iloc[0].to_dict()
+    snap = obtener_instantanea()
+    if snap is not None:
+        return snap.fila(id_vino)
     return None
 
-def obtener_uvas_unicas_bd():
-    df = cargar_vinos()
-    if not df.empty and 'uva_principal' in df.columns:
-        return [u for u in df['uva_principal'].dropna().unique() if u and str(u).strip()]
-    return []
+def opciones_campo(campo, actual=''):
+    """Valores ya usados en el campo (los más usados primero), sin releer el inventario."""
+    vocab = obtener_indice('vocabulario')
+    if vocab is not None:
+        opciones = vocab.valores(campo)
+    else:
+        opciones = list(UVAS_BASE_ESTANDAR) if campo == 'uva_principal' else []
+    if actual and actual not in opciones:
+        opciones.append(actual)
+    return opciones
+
+def normalizar_campo(campo, valor):
+    vocab = obtener_indice('vocabulario')
+    return vocab.normalizar(campo, valor) if vocab is not None else limpiar_valor(valor)
+
+def campo_autocompletado(etiqueta, campo, valor):
+    """
+    Selectbox que sugiere los valores ya usados y acepta uno nuevo. Lo
+    escrito se lleva a la forma existente ("malbec " -> "Malbec").
+    """
+    valor = limpiar_valor(valor)
+    opciones = opciones_campo(campo, valor)
+    elegido = st.selectbox(
+        etiqueta, opciones, index=opciones.index(valor) if valor else None,
+        accept_new_options=True, placeholder="Elegí o escribí uno nuevo"
+    )
+    if not elegido:
+        return ""
+    elegido = normalizar_campo(campo, elegido)
+    vocab = obtener_indice('vocabulario')
+    if vocab is not None and not vocab.conocido(campo, elegido):
+        # Valor nuevo: avisar si se parece a uno existente antes de partir la faceta
+        parecidos = [v for v in vocab.sugerir(campo, elegido[:3]) if v != elegido][:3]
+        if parecidos:
+            st.caption(f"¿Quisiste decir {', '.join(parecidos)}?")
+    return elegido
 
 # --- UTILIDADES ---
-def buscar_imagen_ddg(query):
+@medido('buscar_imagenes')
+def buscar_imagenes_ddg(query):
+    """
+    Busca varias imágenes y las descarga en paralelo. Devuelve solo las
+    candidatas que resultaron ser imágenes válidas.
+    """
     try:
-        with DDGS() as ddgs:
-            results = list(ddgs.images(query, max_results=3))
-            if results:
-                return results[0]['image']
+        return obtener_cliente_web().buscar_candidatas(query)
     except Exception as e:
         st.error(f"Error buscando imagen: {e}")
-    return None
+    return []
 
+@medido('buscar_enologo')
 def buscar_enologo_ddg(query):
     try:
-        with DDGS() as ddgs:
-            results = list(ddgs.text(query, max_results=1))
-            if results:
-                return results[0]['body']
+        results = obtener_cliente_web().buscar_texto(query, max_results=1)
+        if results:
+            return results[0]
     except Exception as e:
         return f"Error buscando enólogo: {e}"
     return "No encontrado"
 
-def descargar_imagen(url):
-    try:
-        response = requests.get(url, timeout=5)
-        if response.status_code == 200:
-            return response.content, response.headers['Content-Type']
-    except Exception as e:
-        st.error(f"Error descargando imagen: {e}")
-    return None, None
+def ids_seleccionados(df, event):
+    """Ids de las filas seleccionadas en un st.dataframe de `df`."""
+    return [int(i) for i in df['id'].iloc[event.selection.rows].tolist()]
 
-def blob_to_b64(blob, mime_type):
-    if blob:
-        b64 = base64.b64encode(blob).decode('utf-8')
-        return f"data:{mime_type};base64,{b64}"
-    return None
+def limpiar_seleccion(key_tabla):
+    # Tras una acción masiva las botellas seleccionadas ya no están en la tabla
+    st.session_state.pop(key_tabla, None)
+    st.session_state.pop(f"{key_tabla}_ids", None)
+    st.session_state.selected_id = None
+
+def etiqueta_columna(col):
+    config = column_config.get(col, col)
+    return config if isinstance(config, str) else config.get('label') or col
 
-def normalize_column_name(col_name):
-    return str(col_name).strip().lower()
+def tabla_paginada(df, key_tabla, texto, columnas=None):
+    """
+    Tabla con búsqueda, orden y paginado en el servidor: al navegador solo
+    viaja la página visible, con sus miniaturas. `texto` es el texto de
+    búsqueda de la instantánea. Devuelve los ids seleccionados.
+    """
+    cols_final = [c for c in (columnas or cols_order) if c in df.columns or c == 'imagen_visual']
+    c_buscar, c_orden, c_desc, c_filas, c_pagina = st.columns([4, 2, 1, 1, 1])
+    with c_buscar:
+        consulta = st.text_input(
+            "Buscar", key=f"{key_tabla}_buscar", label_visibility="collapsed",
+            placeholder="🔎 Buscar por nombre, bodega, uva, nota..."
+        )
+    with c_orden:
+        columna = st.selectbox(
+            "Ordenar por", [c for c in cols_final if c != 'imagen_visual'], key=f"{key_tabla}_orden",
+            format_func=etiqueta_columna, label_visibility="collapsed"
+        )
+    with c_desc:
+        descendente = st.toggle("↓ Desc.", key=f"{key_tabla}_desc")
+    with c_filas:
+        tamano = st.selectbox("Filas", TAMANOS_PAGINA, key=f"{key_tabla}_filas", label_visibility="collapsed")
 
-def get_column_value(row, possible_names, default=''):
-    for name in possible_names:
-        if name in row.index:
-            val = row[name]
-            if pd.notna(val):
-                return str(val).strip()
-    return default
+    with tramo('tabla.consulta', filas=len(df)) as t:
+        vista = ordenar(filtrar_texto(df, consulta, texto), columna, descendente)
+        t.anotar(coincidencias=len(vista))
 
-def comprimir_imagen(blob):
+    key_pagina = f"{key_tabla}_pagina"
+    total_paginas = max(1, -(-len(vista) // tamano))
+    # Si la búsqueda achicó la lista, la página guardada puede no existir ya
+    if st.session_state.get(key_pagina, 1) > total_paginas:
+        st.session_state[key_pagina] = total_paginas
+    with c_pagina:
+        numero = st.number_input(
+            "Página", min_value=1, max_value=total_paginas, key=key_pagina, label_visibility="collapsed"
+        )
+    filas, numero, total_paginas = pagina(vista, numero, tamano)
+
+    # La selección se guarda como ids: si cambia la búsqueda, el orden o la
+    # página se descarta; si solo cambiaron los datos (un guardado), las
+    # mismas botellas se vuelven a marcar en su nueva posición.
+    firma = (consulta, columna, descendente, tamano, numero)
+    key_ids = f"{key_tabla}_ids"
+    en_pagina = [int(i) for i in filas['id'].tolist()]
+    seleccion_previa = None
+    if st.session_state.get(f"{key_tabla}_vista") != firma:
+        st.session_state.pop(key_tabla, None)
+        st.session_state.pop(key_ids, None)
+        st.session_state[f"{key_tabla}_vista"] = firma
+    elif st.session_state.get(f"{key_tabla}_en_pagina") != en_pagina:
+        st.session_state.pop(key_tabla, None)
+        filas_previas = reubicar_seleccion(st.session_state.get(key_ids, []), en_pagina)
+        seleccion_previa = {'selection': {'rows': filas_previas}}
+    st.session_state[f"{key_tabla}_en_pagina"] = en_pagina
+
+    with tramo('tabla.pagina', tabla=key_tabla, filas=len(filas), columnas=len(cols_final)) as t:
+        datos_pagina = filas.assign(imagen_visual=columna_imagen(filas))[cols_final]
+        # Lo que viaja al navegador: el frame de la página, miniaturas incluidas
+        t.anotar(bytes=int(datos_pagina.memory_usage(deep=True).sum()))
+        event = st.dataframe(
+            datos_pagina,
+            column_config=column_config,
+            hide_index=True,
+            on_select="rerun",
+            selection_mode="multi-row",
+            selection_default=seleccion_previa,
+            key=key_tabla
+        )
+    st.caption(f"{len(vista)} de {len(df)} vinos · página {numero} de {total_paginas}")
+    st.session_state[key_ids] = ids_seleccionados(filas, event)
+    return st.session_state[key_ids]
+
+def mostrar_mapa_bodega(ocupacion, snap):
+    """Llenado de cada mueble (desde el índice de ocupación) y qué hay en el elegido."""
+    filas = ocupacion.ocupacion()
+    muebles = list(dict.fromkeys(f['mueble'] for f in filas))
+    for col, mueble in zip(st.columns(len(muebles)), muebles):
+        with col:
+            st.markdown(f"**{mueble}**")
+            for f in filas:
+                if f['mueble'] != mueble:
+                    continue
+                icono = "🔴" if f['libres'] == 0 else ("🟠" if f['llenado'] >= 0.8 else "🟢")
+                st.progress(
+                    f['llenado'],
+                    text=f"{icono} {f['ubicacion'].split(' - ', 1)[-1]}: {f['botellas']}/{f['capacidad']}"
+                )
+    
+    ver = st.selectbox(
+        "Ver qué hay en", [f['ubicacion'] for f in filas], index=None,
+        placeholder="Elegí un mueble", key="mapa_ubicacion"
+    )
+    if ver:
+        vinos = [snap.fila(i) for i in sorted(ocupacion.ids_en(ver))]
+        vinos = pd.DataFrame([v for v in vinos if v is not None])
+        if vinos.empty:
+            st.caption("Vacío.")
+        else:
+            st.dataframe(
+                vinos[[c for c in ['id', 'nombre', 'bodega', 'anada', 'uva_principal'] if c in vinos.columns]],
+                column_config=column_config, hide_index=True
+            )
+
+def mostrar_estadisticas_consumo(r):
+    m1, m2, m3, m4 = st.columns(4)
+    m1.metric("Botellas bebidas", r['total'])
+    m2.metric("Puntos promedio", f"{r['puntos_promedio']:.1f}" if r['puntos_promedio'] is not None else "-")
+    m3.metric("Antes del límite", r['a_tiempo'])
+    m4.metric("Pasadas de su límite", r['tarde'])
+    if r['por_mes']:
+        st.caption("Botellas por mes")
+        st.bar_chart(pd.Series(r['por_mes'], name="Botellas"))
+    if r['sin_fecha']:
+        st.caption(f"{r['sin_fecha']} botellas consumidas antes de registrar la fecha.")
+    c_uva, c_bodega = st.columns(2)
+    with c_uva:
+        st.caption("Por uva (top 10)")
+        st.bar_chart(pd.Series(dict(list(r['por_uva'].items())[:10]), name="Botellas"), horizontal=True)
+    with c_bodega:
+        st.caption("Por bodega (top 10)")
+        st.bar_chart(pd.Series(dict(list(r['por_bodega'].items())[:10]), name="Botellas"), horizontal=True)
+
+def mostrar_resultado_lote(resultados, fallas=()):
+    """Resumen (cantidades y tiempos) de un lote de imágenes y sus errores."""
+    r = resumen_lote(resultados)
+    st.caption(
+        f"🖼️ {r['ok']}/{r['total']} imágenes procesadas · "
+        f"p50 {r['segundos_p50'] * 1000:.0f} ms · máx {r['segundos_max'] * 1000:.0f} ms"
+    )
+    fallas = list(fallas) + [(x.clave, x.error) for x in resultados if x.error]
+    if fallas:
+        with st.expander(f"⚠️ {len(fallas)} imágenes con error"):
+            st.dataframe(pd.DataFrame(fallas, columns=['clave', 'error']), hide_index=True)
+
+@medido('importar.imagenes')
+def procesar_urls_imagen(urls_por_id, estado=None):
     """
-    Redimensiona a 150x150 max, convierte a JPEG quality=50.
-    Retorna bytes comprimidos.
+    Fotos de una importación: descarga en paralelo (hilos) y compresión en
+    un pool de procesos. Devuelve {id: hash} de las que salieron bien.
     """
-    try:
-        if not blob: return None
-        
-        # Abrir imagen desde bytes
-        img = Image.open(io.BytesIO(blob))
-        
-        # Convertir a RGB (necesario si viene de PNG con transparencia)
-        if img.mode in ('RGBA', 'P'):
-            img = img.convert('RGB')
-            
-        # Redimensionar (Thumbnail mantiene aspect ratio)
-        img.thumbnail((150, 150))
-        
-        # Guardar en buffer como JPEG
-        buffer = io.BytesIO()
-        img.save(buffer, format="JPEG", quality=50, optimize=True)
-        return buffer.getvalue()
-        
-    except Exception as e:
-        st.error(f"Error comprimiendo imagen: {e}")
-        return None
+    if estado:
+        estado.caption(f"Descargando {len(urls_por_id)} imágenes...")
+    descargas = obtener_cliente_web().descargar_varias(urls_por_id)
+    tareas = [(i, cand.blob) for i, (cand, _) in descargas.items() if cand is not None]
+    fallas = [(i, error) for i, (cand, error) in descargas.items() if cand is None]
+    resultados = procesar_lote(
+        obtener_imagenes(), tareas, pool=obtener_pool_imagenes(),
+        progreso=(lambda n, t: estado.caption(f"{n}/{t} imágenes procesadas...")) if estado else None
+    )
+    mostrar_resultado_lote(resultados, fallas)
+    return {x.clave: x.hash for x in resultados if not x.error}
 
-def preparar_imagen_db(imagen_blob):
+def agregar_copias_imagen(mutaciones):
+    """Altas con foto: su miniatura en Hex a `imagen_data` (ver `preparar_imagen_db`)."""
+    almacen_img = obtener_imagenes()
+    for m in mutaciones:
+        if m.tipo == AGREGAR and m.cambios.get('imagen_hash'):
+            m.cambios['imagen_data'] = almacen_img.copia_hex(m.cambios['imagen_hash']) or ''
+
+def columna_imagen(df):
     """
-    Comprime y convierte a Hex. Valida longitud < 45000 chars.
-    Retorna (hex_string, 'image/jpeg') o (None, None) si falla/excede.
+    Miniaturas para la tabla: URLs estables por hash que el navegador cachea.
+    Sin servidor de imágenes, data URIs memoizadas por hash.
     """
-    if not imagen_blob:
-        return None, None
-        
-    # 1. Comprimir
-    blob_comp = comprimir_imagen(imagen_blob)
-    if not blob_comp:
-        return None, None
-        
-    # 2. Convertir a Hex
-    img_hex = blob_comp.hex()
-    
-    # 3. Validar Longitud
-    if len(img_hex) > 45000:
-        st.warning("⚠️ La imagen es demasiado compleja para guardarse en la nube (límite excedido). Se guardará el vino SIN foto.")
-        return None, None
-        
-    return img_hex, 'image/jpeg'
+    almacen_img = obtener_imagenes()
+    with tramo('vista.miniaturas', filas=len(df), urls=almacen_img.sirve_urls) as t:
+        if almacen_img.sirve_urls:
+            columna = df['imagen_hash'].map(almacen_img.url)
+        else:
+            columna = df['imagen_hash'].map(lambda h: almacen_img.data_uri(h) if h else None)
+        # Caracteres que se mandan al navegador por las miniaturas (URLs o data URIs)
+        t.anotar(bytes=sum(len(x) for x in columna if isinstance(x, str)))
+    return columna
+
+@medido('preparar_imagen_db')
+def preparar_imagen_db(imagen):
+    """
+    Celdas de la foto para la hoja. `imagen` son bytes nuevos o el hash de
+    una foto ya guardada. Las fotos nuevas van al almacén local (varios
+    tamaños, JPEG) y, salvo almacén persistente, su miniatura en Hex a
+    `imagen_data`: la copia que sobrevive a un redeploy.
+    """
+    sin_foto = {'imagen_hash': None, 'tipo_imagen': None}
+    if not imagen:
+        return sin_foto
+    if isinstance(imagen, str):
+        # Foto existente: se conserva aunque falte el archivo (se reconstruye desde la hoja)
+        return {'imagen_hash': imagen, 'tipo_imagen': MIME}
+
+    almacen_img = obtener_imagenes()
+    try:
+        h = almacen_img.guardar(imagen)
+    except Exception as e:
+        st.error(f"Error comprimiendo imagen: {e}")
+        return sin_foto
+    copia = '' if PERSISTENTE else almacen_img.copia_hex(h)
+    if copia is None:
+        st.warning("⚠️ La miniatura no entra en la hoja: la foto queda solo en el almacén local.")
+    return {'imagen_hash': h, 'tipo_imagen': MIME, 'imagen_data': copia or ''}
 
 # --- INICIALIZACIÓN ---
+# Con `streamlit run servidor.py` ya arrancó junto con el servidor
+precalentar()
+
 # init_db() # Removed
 
+if 'escrituras_pendientes' not in st.session_state:
+    st.session_state.escrituras_pendientes = []
+if 'error_guardado' not in st.session_state:
+    st.session_state.error_guardado = None
 if 'selected_id' not in st.session_state:
     st.session_state.selected_id = None
 
@@ -327,11 +518,14 @@ if 'selected_id' not in st.session_state:
 st.title("🍷 Mi Vinoteca V5.5")
 
 # Cargar datos globales
-df_todos = cargar_vinos()
-if not df_todos.empty:
-    df_todos['imagen_visual'] = df_todos.apply(
-        lambda row: blob_to_b64(row['imagen_data'], row['tipo_imagen']), axis=1
-    )
+with st.spinner("Cargando la bodega..."):
+    snap = obtener_instantanea()
+df_todos = pd.DataFrame()
+texto_todos = None
+if snap is not None and not snap.vacia:
+    df_todos = snap.df
+    # Se calcula una vez por versión del inventario, no en cada rerun
+    texto_todos = snap.derivado('busqueda', texto_busqueda)
 
 # Configuración de Columnas Común
 column_config = {
@@ -347,14 +541,38 @@ column_config = {
     "enologo": "Enólogo",
     "ubicacion": "Ubicación",
     "detalle": "Detalle Técnico",
-    "nota_cata": "Nota Personal"
+    "nota_cata": "Nota Personal",
+    "fecha_consumo": "Bebido el"
 }
 
 cols_order = [
-    'id', 'nombre', 'bodega', 'uva_principal', 'composicion_blend', 'anada', 'anio_limite', 
+    'id', 'imagen_visual', 'nombre', 'bodega', 'uva_principal', 'composicion_blend', 'anada', 'anio_limite', 
     'gama', 'procedencia', 'enologo', 'ubicacion', 'detalle', 'nota_cata', 'puntuacion'
 ]
 
+# --- BÚSQUEDA LIBRE ---
+if not df_todos.empty:
+    consulta_libre = st.text_input(
+        "🔎 Buscar en toda la bodega", key="busqueda_libre",
+        placeholder="Ej: malbec gualtallary violetas (tolera errores de tipeo)"
+    )
+    if consulta_libre:
+        indice_texto = obtener_indice('texto')
+        with tramo('busqueda.texto') as t:
+            resultados = indice_texto.buscar(consulta_libre, limite=8) if indice_texto else []
+            t.anotar(resultados=len(resultados))
+        for id_vino, _ in resultados:
+            vino = snap.fila(id_vino)
+            if vino is None:
+                continue
+            c_vino, c_abrir = st.columns([6, 1])
+            c_vino.markdown(f"**{vino['nombre']}** · {vino['bodega']} {vino['anada']} · _{vino['ubicacion']}_")
+            if c_abrir.button("✏️ Editar", key=f"abrir_busqueda_{id_vino}", use_container_width=True):
+                st.session_state.selected_id = id_vino
+                st.rerun()
+        if not resultados:
+            st.caption("Sin resultados.")
+
 # --- TABS ---
 tab_bodega, tab_sommelier, tab_historial = st.tabs(['🍾 Bodega Activa', '🤖 Sommelier Virtual', '📜 Historial Bebido'])
 
@@ -367,25 +585,37 @@ with tab_bodega:
     if not df_todos.empty:
         df_activos = df_todos[df_todos['ubicacion'] != 'Consumido']
         
-        cols_final = [c for c in cols_order if c in df_activos.columns]
-        
-        event = st.dataframe(
-            df_activos[cols_final],
-            column_config=column_config,
-            height=500,
-            hide_index=True,
-            on_select="rerun",
-            selection_mode="single-row",
-            key="vinos_table_activos"
-        )
+        sel_activos = tabla_paginada(df_activos, "vinos_table_activos", texto_todos)
+        if len(sel_activos) == 1:
+            st.session_state.selected_id = sel_activos[0]
+        elif len(sel_activos) > 1:
+            # Acciones masivas: todas las filas en un único lote de mutaciones
+            st.session_state.selected_id = None
+            st.markdown(f"**{len(sel_activos)} botellas seleccionadas**")
+            col_m1, col_m2, col_m3, col_m4 = st.columns([1, 2, 1, 1])
+            with col_m1:
+                if st.button("🍷 Marcar bebidas", use_container_width=True):
+                    limpiar_seleccion("vinos_table_activos")
+                    mover_vinos(sel_activos, 'Consumido')
+            with col_m2:
+                destino = st.selectbox(
+                    "Mover a", [u for u in UBICACIONES if u != 'Consumido'],
+                    label_visibility="collapsed", key="destino_masivo"
+                )
+            with col_m3:
+                if st.button("📦 Mover", use_container_width=True):
+                    limpiar_seleccion("vinos_table_activos")
+                    mover_vinos(sel_activos, destino)
+            with col_m4:
+                if st.button("🗑️ Borrar", use_container_width=True, key="borrar_masivo_activos"):
+                    limpiar_seleccion("vinos_table_activos")
+                    borrar_vinos(sel_activos)
         
-        if event.selection.rows:
-            idx = event.selection.rows[0]
-            row_data = df_activos.iloc[idx]
-            st.session_state.selected_id = int(row_data['id'])
-        else:
-            # Si no hay selección en ESTA tabla, no hacemos nada para no romper el flujo
-            pass 
+        # Ocupación por mueble: índice mantenido con cada alta / movimiento / baja
+        indice_ocupacion = obtener_indice('ocupacion')
+        if indice_ocupacion is not None:
+            with st.expander("🗺️ Mapa de la bodega"):
+                mostrar_mapa_bodega(indice_ocupacion, snap)
             
     else:
         st.info("No hay vinos cargados.")
@@ -397,73 +627,87 @@ with tab_sommelier:
     st.subheader("🤖 Tu Sommelier Personal")
     
     if not df_todos.empty:
-        df_activos = df_todos[df_todos['ubicacion'] != 'Consumido']
+        # Facetas precalculadas una vez por versión del inventario
+        with tramo('sommelier.facetas'):
+            facetas = snap.derivado(
+                'facetas', lambda df: IndiceFacetas(df[df['ubicacion'] != 'Consumido'])
+            )
+        
+        # (columna, etiqueta, key) de cada filtro
+        filtros_def = {
+            'col_f1': [('uva_principal', "Uva / Corte", 'filtro_uva')],
+            'col_f2': [('bodega', "Bodega", 'filtro_bodega'), ('anada', "Añada", 'filtro_anada')],
+            'col_f3': [('procedencia', "Procedencia", 'filtro_proc'), ('gama', "Gama", 'filtro_gama'),
+                       ('enologo', "Enólogo", 'filtro_eno')],
+        }
+        
+        # Selecciones actuales (del rerun anterior) para contar opciones en vivo
+        anio_actual = datetime.now().year
+        anio_max = anio_actual if st.session_state.get('solo_vencer') else None
+        filtros = {
+            col: st.session_state.get(key, [])
+            for grupo in filtros_def.values() for col, _, key in grupo
+        }
+        
+        def multiselect_faceta(col, etiqueta, key):
+            conteos = facetas.conteos(col, filtros, anio_max)
+            return st.multiselect(
+                etiqueta, facetas.opciones(col), key=key,
+                format_func=lambda v: f"{v} ({conteos.get(v, 0)})"
+            )
         
         # Filtros Avanzados
         col_f1, col_f2, col_f3 = st.columns(3)
         
         with col_f1:
-            solo_vencer = st.checkbox("🚨 Mostrar solo vinos por vencer")
-            
-            uvas_disp = sorted(list(set(df_activos['uva_principal'].dropna().unique())))
-            filtro_uva = st.multiselect("Uva / Corte", uvas_disp)
+            solo_vencer = st.checkbox("🚨 Mostrar solo vinos por vencer", key='solo_vencer')
+            for col, etiqueta, key in filtros_def['col_f1']:
+                filtros[col] = multiselect_faceta(col, etiqueta, key)
             
         with col_f2:
-            bodegas_disp = sorted(list(set(df_activos['bodega'].dropna().unique())))
-            filtro_bodega = st.multiselect("Bodega", bodegas_disp)
-            
-            anios_disp = sorted(list(set(df_activos['anada'].dropna().unique())))
-            filtro_anada = st.multiselect("Añada", anios_disp)
+            for col, etiqueta, key in filtros_def['col_f2']:
+                filtros[col] = multiselect_faceta(col, etiqueta, key)
             
         with col_f3:
-            procedencias_disp = sorted(list(set(df_activos['procedencia'].dropna().unique())))
-            filtro_proc = st.multiselect("Procedencia", procedencias_disp)
-            
-            gamas_disp = sorted(list(set(df_activos['gama'].dropna().unique())))
-            filtro_gama = st.multiselect("Gama", gamas_disp)
+            for col, etiqueta, key in filtros_def['col_f3']:
+                filtros[col] = multiselect_faceta(col, etiqueta, key)
             
-            enos_disp = sorted(list(set(df_activos['enologo'].dropna().unique())))
-            filtro_eno = st.multiselect("Enólogo", enos_disp)
+        with st.expander("⚙️ Criterios del Sommelier"):
+            c_p1, c_p2, c_p3 = st.columns(3)
+            pesos = PesosRecomendacion(
+                urgencia=c_p1.slider("Urgencia de consumo", 0.0, 2.0, 1.0, 0.1),
+                puntuacion=c_p2.slider("Puntuación", 0.0, 2.0, 1.0, 0.1),
+                diversidad=c_p3.slider("Variar respecto de lo último bebido", 0.0, 2.0, 0.5, 0.1),
+            )
             
         st.markdown("---")
         
         if st.button("🎲 RECOMENDARME UN VINO", type="primary", use_container_width=True):
-            # Aplicar Filtros (AND Logic)
-            df_filtrado = df_activos.copy()
+            # Aplicar Filtros (AND Logic) sobre las máscaras del índice
+            mascara = facetas.mascara(filtros, anio_actual if solo_vencer else None)
             
-            if solo_vencer:
-                anio_actual = datetime.now().year
-                df_filtrado = df_filtrado[df_filtrado['anio_limite'] <= anio_actual]
-                
-            if filtro_uva:
-                df_filtrado = df_filtrado[df_filtrado['uva_principal'].isin(filtro_uva)]
+            # Lo bebido hace poco (por fecha de consumo) para no repetir uva/bodega
+            df_recientes = consumidos_recientes(df_todos, 10)
+            recientes = {c: df_recientes[c].dropna().tolist() for c in ('uva_principal', 'bodega')}
             
-            if filtro_bodega:
-                df_filtrado = df_filtrado[df_filtrado['bodega'].isin(filtro_bodega)]
-                
-            if filtro_anada:
-                df_filtrado = df_filtrado[df_filtrado['anada'].isin(filtro_anada)]
+            # Sorteo ponderado por urgencia, puntos y diversidad
+            with tramo('sommelier.recomendar', candidatas=int(mascara.sum())):
+                df_elegidos = recomendar(
+                    facetas, mascara, n=4, anio_actual=anio_actual, pesos=pesos, recientes=recientes
+                )
                 
-            if filtro_proc:
-                df_filtrado = df_filtrado[df_filtrado['procedencia'].isin(filtro_proc)]
-                
-            if filtro_gama:
-                df_filtrado = df_filtrado[df_filtrado['gama'].isin(filtro_gama)]
-                
-            if filtro_eno:
-                df_filtrado = df_filtrado[df_filtrado['enologo'].isin(filtro_eno)]
-                
-            if not df_filtrado.empty:
-                # Elegir Random
-                elegido = df_filtrado.sample(1).iloc[0]
+            if not df_elegidos.empty:
+                elegido = df_elegidos.iloc[0]
                 
                 st.success("¡El Sommelier ha elegido!")
                 st.markdown("---")
                 
                 c1, c2 = st.columns([1, 2])
                 with c1:
-                    if elegido['imagen_visual']:
-                        st.image(elegido['imagen_visual'], width=200)
+                    # Tamaño medio, leído de disco solo al mostrarlo (puede faltar tras un redeploy)
+                    foto = obtener_imagenes().leer(elegido['imagen_hash'], 'medio')
+                    if foto:
+                        st.image(foto, width=200)
                     else:
                         st.write("🍷 Sin foto")
                 with c2:
@@ -475,6 +719,11 @@ with tab_sommelier:
                         st.markdown(f"**Corte:** {elegido['composicion_blend']}")
                     st.markdown(f"**Ubicación:** {elegido['ubicacion']}")
                     st.markdown(f"**Procedencia:** {elegido['procedencia']}")
+                
+                if len(df_elegidos) > 1:
+                    st.markdown("##### También podrías abrir")
+                    for _, alt in df_elegidos.iloc[1:].iterrows():
+                        st.markdown(f"- **{alt['nombre']}** · {alt['bodega']} {int(alt['anada'])} · {alt['ubicacion']}")
                     
             else:
                 st.warning("No hay vinos que coincidan con TODOS tus criterios. ¡Prueba relajar los filtros!")
@@ -489,22 +738,30 @@ with tab_historial:
         df_consumidos = df_todos[df_todos['ubicacion'] == 'Consumido']
         
         if not df_consumidos.empty:
-            cols_final = [c for c in cols_order if c in df_consumidos.columns]
+            # Agregados mantenidos con cada consumo / restauración: no se reagrupa el historial
+            indice_consumo = obtener_indice('consumo')
+            if indice_consumo is not None:
+                with st.expander("📊 Estadísticas de consumo", expanded=True):
+                    mostrar_estadisticas_consumo(indice_consumo.resumen())
             
-            event_h = st.dataframe(
-                df_consumidos[cols_final],
-                column_config=column_config,
-                height=500,
-                hide_index=True,
-                on_select="rerun",
-                selection_mode="single-row",
-                key="vinos_table_historial"
+            cols_historial = cols_order[:2] + ['fecha_consumo'] + cols_order[2:]
+            sel_historial = tabla_paginada(
+                df_consumidos, "vinos_table_historial", texto_todos, columnas=cols_historial
             )
-            
-            if event_h.selection.rows:
-                idx = event_h.selection.rows[0]
-                row_data = df_consumidos.iloc[idx]
-                st.session_state.selected_id = int(row_data['id'])
+            if len(sel_historial) == 1:
+                st.session_state.selected_id = sel_historial[0]
+            elif len(sel_historial) > 1:
+                st.session_state.selected_id = None
+                st.markdown(f"**{len(sel_historial)} botellas seleccionadas**")
+                col_h1, col_h2 = st.columns(2)
+                with col_h1:
+                    if st.button("↩️ Restaurar", use_container_width=True):
+                        limpiar_seleccion("vinos_table_historial")
+                        mover_vinos(sel_historial, 'Por Clasificar')
+                with col_h2:
+                    if st.button("🗑️ Borrar", use_container_width=True, key="borrar_masivo_historial"):
+                        limpiar_seleccion("vinos_table_historial")
+                        borrar_vinos(sel_historial)
         else:
             st.info("Aún no has bebido ningún vino. ¡Salud!")
 
@@ -512,6 +769,17 @@ with tab_historial:
 # --- SIDEBAR (COMÚN) ---
 with st.sidebar:
     st.header("Gestión de Vinos")
+
+    if st.session_state.error_guardado:
+        st.error(f"❌ No se pudieron guardar los últimos cambios: {st.session_state.error_guardado}")
+        st.session_state.error_guardado = None
+    if st.session_state.escrituras_pendientes:
+        estado_guardado()
+    sync = obtener_sincronizacion().estado()
+    if sync['pendientes'] and sync['en_linea'] is False:
+        st.caption(f"📴 Sin conexión con Google Sheets: {sync['pendientes']} cambios guardados en este equipo, se enviarán al volver la red.")
+    elif sync['pendientes']:
+        st.caption(f"🔄 Sincronizando {sync['pendientes']} cambios con Google Sheets...")
     
     modo_edicion = st.session_state.selected_id is not None
     
@@ -567,7 +835,8 @@ with st.sidebar:
         def_puntuacion = int(vino_data['puntuacion']) if vino_data['puntuacion'] else 5
         
         if 'imagen_confirmada_blob' not in st.session_state:
-             st.session_state.imagen_confirmada_blob = vino_data['imagen_data']
+             # Foto ya guardada: se conserva su hash salvo que se elija otra
+             st.session_state.imagen_confirmada_blob = vino_data['imagen_hash']
              st.session_state.imagen_confirmada_mime = vino_data['tipo_imagen']
     else:
         def_nombre = ""
@@ -580,17 +849,19 @@ with st.sidebar:
         def_procedencia = ""
         def_detalle = ""
         def_nota_cata = ""
-        def_ubicacion = "Cava Eléctrica"
+        # Botella nueva: va al mueble con más lugar libre
+        indice_ocupacion = obtener_indice('ocupacion')
+        def_ubicacion = (indice_ocupacion.sugerir_lugar() if indice_ocupacion is not None else None) or "Cava Eléctrica"
         def_anio_limite = 2030
         def_puntuacion = 5
         
     nombre = st.text_input("Nombre", value=def_nombre)
-    bodega = st.text_input("Bodega", value=def_bodega)
-    gama = st.text_input("Gama / Calidad", value=def_gama)
+    bodega = campo_autocompletado("Bodega", 'bodega', def_bodega)
+    gama = campo_autocompletado("Gama / Calidad", 'gama', def_gama)
     
     col_eno_in, col_eno_btn = st.columns([3, 1])
     with col_eno_in:
-        enologo = st.text_input("Enólogo", value=def_enologo)
+        enologo = campo_autocompletado("Enólogo", 'enologo', def_enologo)
     with col_eno_btn:
         if st.button("🔍"):
             if enologo or (nombre and bodega):
@@ -601,12 +872,8 @@ with st.sidebar:
     anada = st.number_input("Añada", 1900, 2100, def_anada)
     
     # --- LÓGICA UNIFICADA DE LISTAS DE UVAS ---
-    uvas_bd = obtener_uvas_unicas_bd()
-    lista_maestra = sorted(list(set(uvas_bd + UVAS_BASE_ESTANDAR)))
-    
-    if def_uva_princ and def_uva_princ not in lista_maestra:
-        lista_maestra.append(def_uva_princ)
-        lista_maestra = sorted(lista_maestra)
+    # Vocabulario incremental: uvas estándar + las ya usadas, sin recorrer el inventario
+    lista_maestra = opciones_campo('uva_principal', limpiar_valor(def_uva_princ))
         
     try:
         idx_uva = lista_maestra.index(def_uva_princ)
@@ -623,7 +890,7 @@ with st.sidebar:
         opciones_blend = [u for u in lista_maestra if u not in ['Blend', 'Otro']]
         
         if modo_edicion and def_comp_blend:
-             parts = [x.strip() for x in def_comp_blend.split(',')]
+             parts = partes_blend(def_comp_blend)
              default_multiselect = [p for p in parts if p in opciones_blend]
         
         componentes = st.multiselect("Composición", opciones_blend, default=default_multiselect)
@@ -632,10 +899,18 @@ with st.sidebar:
     elif uva_sel == 'Otro':
         otra = st.text_input("Especifique", value="")
         if otra:
-            uva_final = otra
+            uva_final = normalizar_campo('uva_principal', otra)
             
     ubicacion = st.selectbox("Ubicación", UBICACIONES, index=UBICACIONES.index(def_ubicacion) if def_ubicacion in UBICACIONES else 0)
-    procedencia = st.text_input("Procedencia", value=def_procedencia)
+    indice_ocupacion = obtener_indice('ocupacion')
+    libres = indice_ocupacion.libres(ubicacion) if indice_ocupacion is not None else None
+    if libres is not None and (not modo_edicion or ubicacion != def_ubicacion):
+        if libres <= 0:
+            sugerido = indice_ocupacion.sugerir_lugar(excluir=[ubicacion])
+            st.warning(f"⚠️ {ubicacion} está lleno." + (f" Hay lugar en {sugerido}." if sugerido else ""))
+        else:
+            st.caption(f"💡 {libres} lugares libres en {ubicacion}.")
+    procedencia = campo_autocompletado("Procedencia", 'procedencia', def_procedencia)
     
     detalle = st.text_area("Detalle (Técnico)", value=def_detalle, height=100)
     nota_cata = st.text_area("Nota de Cata (Personal)", value=def_nota_cata, height=100)
@@ -647,18 +922,23 @@ with st.sidebar:
     st.markdown("### Imagen")
     if st.button("🔮 Buscar Auto"):
         with st.spinner("..."):
-            url = buscar_imagen_ddg(f"{nombre} {bodega} bottle")
-            if url:
-                st.session_state.imagen_candidata_url = url
+            candidatas = buscar_imagenes_ddg(f"{nombre} {bodega} bottle")
+            st.session_state.imagenes_candidatas = candidatas
+            if not candidatas:
+                st.warning("No se encontraron imágenes válidas.")
     
-    if st.session_state.get('imagen_candidata_url'):
-        st.image(st.session_state.imagen_candidata_url, width=100)
-        if st.button("✅ Usar"):
-            b, m = descargar_imagen(st.session_state.imagen_candidata_url)
-            if b:
-                st.session_state.imagen_confirmada_blob = b
-                st.session_state.imagen_confirmada_mime = m
-                st.session_state.imagen_candidata_url = None
+    # Galería: las candidatas ya están descargadas y validadas
+    candidatas = st.session_state.get('imagenes_candidatas') or []
+    for n in range(0, len(candidatas), 3):
+        cols_gal = st.columns(3)
+        for col, (i, cand) in zip(cols_gal, enumerate(candidatas[n:n + 3], start=n)):
+            with col:
+                st.image(cand.blob, width=80)
+                if st.button("✅ Usar", key=f"usar_img_{i}"):
+                    st.session_state.imagen_confirmada_blob = cand.blob
+                    st.session_state.imagen_confirmada_mime = cand.mime
+                    st.session_state.imagenes_candidatas = []
+                    st.rerun()
                 
     uploaded = st.file_uploader("Subir", type=['jpg','png'])
     if uploaded:
@@ -666,6 +946,15 @@ with st.sidebar:
         st.session_state.imagen_confirmada_mime = uploaded.type
         
     st.markdown("---")
+    
+    # Aviso de posible duplicado (búsqueda O(1) por huella nombre/bodega/añada)
+    indice_huellas = obtener_indice('huellas')
+    if nombre and bodega and indice_huellas is not None:
+        similares = indice_huellas.buscar(nombre, bodega, anada) - {st.session_state.selected_id}
+        if similares:
+            ids_txt = ", ".join(str(i) for i in sorted(similares)[:5])
+            st.warning(f"⚠️ Ya hay {len(similares)} botella(s) de '{nombre}' ({bodega}, {anada}) en la bodega. ID: {ids_txt}")
+    
     lbl_save = "💾 Actualizar" if modo_edicion else "💾 Guardar Nuevo"
     
     if st.button(lbl_save, type="primary"):
@@ -699,109 +988,43 @@ with st.sidebar:
     # --- IMPORTACIÓN / LIMPIEZA ---
     with st.expander("⚙️ Importar / Limpiar"):
         up_file = st.file_uploader("Excel/CSV", type=['xlsx','csv'])
+        opciones_dup = {
+            OMITIR: "Omitir los que ya están",
+            FUSIONAR: "Completar datos de los que ya están",
+            DUPLICAR: "Importar todo igual",
+        }
+        modo_dup = st.radio(
+            "Vinos repetidos (nombre + bodega + añada)", list(opciones_dup),
+            format_func=opciones_dup.get
+        )
         if up_file and st.button("Importar"):
             try:
-                # 1. Leer archivo
-                if up_file.name.endswith('.csv'):
-                    df_nuevo = pd.read_csv(up_file)
-                else:
-                    df_nuevo = pd.read_excel(up_file)
-                
-                # Normalizar columnas
-                df_nuevo.columns = [normalize_column_name(c) for c in df_nuevo.columns]
-                
-                # 2. Leer datos actuales
-                df_actual = cargar_vinos()
+                estado = st.empty()
                 
-                # 3. Calcular ID Inicial
-                ultimo_id = 0
-                if not df_actual.empty and 'id' in df_actual.columns:
-                    # Forzar conversión a int de IDs existentes
-                    try:
-                        ids_existentes = pd.to_numeric(df_actual['id'], errors='coerce').fillna(0).astype(int)
-                        if not ids_existentes.empty:
-                            ultimo_id = ids_existentes.max()
-                    except:
-                        ultimo_id = 0
+                # Lectura por lotes + limpieza columnar; ids desde la secuencia
+                with tramo('importar', archivo=up_file.name, bytes=up_file.size):
+                    nuevos_vinos, resumen = importar(
+                        up_file, up_file.name, obtener_secuencia(),
+                        progreso=lambda n: estado.caption(f"{n} filas procesadas..."),
+                        indice_huellas=obtener_indice('huellas'),
+                        vocabulario=obtener_indice('vocabulario'),
+                        modo_duplicados=modo_dup,
+                        fila_existente=obtener_vino_por_id,
+                        procesar_imagenes=lambda urls: procesar_urls_imagen(urls, estado)
+                    )
                 
-                nuevos_vinos = []
-                bar = st.progress(0)
-                tot = len(df_nuevo)
-                
-                # 4. Iteración con Sanitización TOTAL
-                for i, row in df_nuevo.iterrows():
-                    # Helpers de limpieza
-                    def clean_str(val):
-                        if pd.isna(val): return ""
-                        return str(val).strip()
-                    
-                    def clean_int(val, default):
-                        try:
-                            if pd.isna(val): return default
-                            return int(float(str(val)))
-                        except:
-                            return default
-                            
-                    # Extracción y Limpieza
-                    nom = clean_str(get_column_value(row, ['nombre','name'], 'Sin Nombre'))
-                    bod = clean_str(get_column_value(row, ['bodega','winery'], 'Desconocida'))
-                    eno = clean_str(get_column_value(row, ['enologo'], ''))
-                    
-                    ana = clean_int(get_column_value(row, ['anada','vintage','year'], 2023), 2023)
-                    
-                    # Uva
-                    var_raw = clean_str(get_column_value(row, ['variedad','uva','tipo','grape'], 'Otro'))
-                    if '/' in var_raw: 
-                        u_princ = 'Blend'
-                        c_blend = var_raw
-                    else:
-                        u_princ = var_raw
-                        c_blend = ''
-                        
-                    gam = clean_str(get_column_value(row, ['gama','calidad'], ''))
-                    pro = clean_str(get_column_value(row, ['procedencia','region'], ''))
-                    det = clean_str(get_column_value(row, ['detalle','notas','notes','description'], ''))
-                    
-                    anio_lim = clean_int(get_column_value(row, ['anio_limite','consumo'], 2030), 2030)
-                    pts = clean_int(get_column_value(row, ['puntuacion','puntos'], 5), 5)
-                    
-                    ultimo_id += 1
-                    
-                    # Construcción de Diccionario Seguro
-                    vino = {
-                        'id': int(ultimo_id),
-                        'nombre': str(nom),
-                        'bodega': str(bod),
-                        'enologo': str(eno),
-                        'anada': int(ana),
-                        'uva_principal': str(u_princ),
-                        'composicion_blend': str(c_blend),
-                        'gama': str(gam),
-                        'procedencia': str(pro),
-                        'detalle': str(det),
-                        'nota_cata': "",
-                        'ubicacion': "Por Clasificar",
-                        'anio_limite': int(anio_lim),
-                        'puntuacion': int(pts),
-                        'imagen_data': None,
-                        'tipo_imagen': None
-                    }
-                    nuevos_vinos.append(vino)
-                    bar.progress((i+1)/tot)
-                
-                # 5. Crear DataFrame Final
+                if not PERSISTENTE:
+                    agregar_copias_imagen(nuevos_vinos)
+
+                # Una sola escritura para todas las filas nuevas
                 if nuevos_vinos:
-                    df_to_add = pd.DataFrame(nuevos_vinos)
-                    
-                    # Concatenar
-                    df_final = pd.concat([df_actual, df_to_add], ignore_index=True)
-                    
-                    # Reemplazo final de NaN por si acaso
-                    df_final = df_final.fillna("")
-                    
-                    # Guardar
-                    safe_update(df_final)
+                    safe_update(nuevos_vinos, mensaje=(
+                        f"✅ Importados. Nuevos: {resumen['nuevos']} · Omitidos: {resumen['omitidos']} · "
+                        f"Completados: {resumen['fusionados']} · Fotos: {resumen['imagenes']}"
+                    ))
 
+                elif resumen['omitidos'] or resumen['fusionados']:
+                    st.info("Todos los vinos del archivo ya estaban en la bodega.")
                 else:
                     st.warning("No se encontraron datos para importar.")
                     
@@ -809,7 +1032,43 @@ with st.sidebar:
                 st.error(f"Ocurrió un error: {e}")
                 st.code(traceback.format_exc())
                 
+        # Regenera miniaturas desde los originales (p.ej. tras cambiar TAMANOS)
+        if st.button("🗜️ Recomprimir imágenes"):
+            hashes = df_todos['imagen_hash'].dropna().unique().tolist() if 'imagen_hash' in df_todos.columns else []
+            estado_img = st.empty()
+            resultados = procesar_lote(
+                obtener_imagenes(), [(h, h) for h in hashes], regenerar=True, pool=obtener_pool_imagenes(),
+                progreso=lambda n, t: estado_img.caption(f"{n}/{t} imágenes...")
+            )
+            mostrar_resultado_lote(resultados)
+
         if st.checkbox("Borrado Masivo"):
             if st.button("🗑️ Borrar 'Por Clasificar'"):
                 n = borrar_por_clasificar()
 
+    st.markdown("---")
+    st.checkbox("🐞 Panel de tiempos", key="panel_debug")
+
+
+# --- ARRANQUE ---
+if 'primera_pagina_ms' not in st.session_state:
+    # Desde que empezó el primer script de la sesión hasta que se terminó de armar la página
+    st.session_state.primera_pagina_ms = (time.perf_counter() - inicio_script) * 1000
+    arranque.registrar_primera_pagina(st.session_state.primera_pagina_ms)
+
+# --- PANEL DE TIEMPOS ---
+if registro_rerun is not None:
+    registro_rerun = terminar_rerun()
+    with st.expander(f"🐞 Tiempos de este rerun: {registro_rerun.ms_total:.0f} ms", expanded=True):
+        if registro_rerun.tramos:
+            st.dataframe(pd.DataFrame(registro_rerun.filas()), hide_index=True)
+        snap_debug = obtener_inventario()
+        st.json({
+            'inventario': {'version': snap_debug.version, 'filas': len(df_todos)},
+            'sheets': obtener_limitador().estadisticas(),
+            'cache_externos': obtener_cliente_web().cache.estadisticas(),
+            'escritor_ocupado': obtener_escritor().ocupado,
+            'replica': obtener_sincronizacion().estado(),
+            'arranque': arranque.resumen(),
+        }, expanded=False)
+
@@ -0,0 +1,89 @@
+"""
+Arranque en frío: tiempos de inicio y precalentamiento (sin Streamlit).
+
+`precalentar(pasos)` corre en un hilo de fondo lo caro de la primera visita
+(lectura y parseo del inventario, índices, sincronizador) al iniciar el
+servidor (`servidor.py`), o al correr el script por primera vez si se
+arrancó con `streamlit run app.py`, para que las sesiones no lo esperen.
+`resumen()` junta los tiempos medidos: inicio del proceso hasta el
+precalentamiento, importaciones, cada paso del precalentamiento y la
+latencia de la primera página de cada sesión.
+"""
+import os
+import threading
+import time
+
+from metricas import evento
+
+_IMPORTADO_EN = time.time()
+_lock = threading.Lock()
+_tiempos = {}
+_primeras_paginas = []
+
+
+def inicio_proceso():
+    """Epoch en que arrancó el proceso (Linux: /proc; si no, la importación de este módulo)."""
+    try:
+        with open('/proc/self/stat') as f:
+            # Campo 22 (starttime, en ticks desde el boot); el nombre puede tener espacios
+            ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - (uptime - ticks / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError, AttributeError):
+        return _IMPORTADO_EN
+
+
+def registrar(nombre, ms, **datos):
+    """Guarda la primera medición de `nombre` (las siguientes se ignoran)."""
+    with _lock:
+        if nombre in _tiempos:
+            return
+        _tiempos[nombre] = round(ms, 1)
+    evento('arranque', paso=nombre, ms=round(ms, 3), **datos)
+
+
+def registrar_primera_pagina(ms):
+    with _lock:
+        _primeras_paginas.append(ms)
+    if len(_primeras_paginas) == 1:
+        registrar('primera_pagina', ms)
+    evento('primera_pagina', ms=round(ms, 3), sesiones=len(_primeras_paginas))
+
+
+def precalentar(pasos):
+    """
+    Ejecuta `pasos` ([(nombre, función)]) en orden en un hilo daemon y mide
+    cada uno. Un paso que falla se anota y no corta los siguientes: la
+    sesión que lo necesite lo reintentará y mostrará el error.
+    """
+    registrar('proceso_a_precalentar', (time.time() - inicio_proceso()) * 1000)
+
+    def correr():
+        inicio_total = time.perf_counter()
+        for nombre, funcion in pasos:
+            inicio = time.perf_counter()
+            try:
+                funcion()
+                error = None
+            except Exception as e:
+                error = type(e).__name__
+            registrar(f'precalentar.{nombre}', (time.perf_counter() - inicio) * 1000,
+                      **({'error': error} if error else {}))
+        registrar('precalentar', (time.perf_counter() - inicio_total) * 1000)
+
+    hilo = threading.Thread(target=correr, daemon=True, name='precalentar')
+    hilo.start()
+    return hilo
+
+
+def resumen():
+    """Tiempos de arranque en ms y latencia de primera página por sesión."""
+    with _lock:
+        paginas = sorted(_primeras_paginas)
+        return {
+            **_tiempos,
+            'sesiones': len(paginas),
+            'primera_pagina_p50': round(paginas[len(paginas) // 2], 1) if paginas else None,
+            'primera_pagina_max': round(paginas[-1], 1) if paginas else None,
+        }
@@ -0,0 +1,341 @@
+"""
+Benchmarks reproducibles de la vinoteca sobre bodegas sintéticas.
+
+Corre contra `HojaEnMemoria` (sin red ni Streamlit) y mide carga/parseo,
+migración de fotos legado, imágenes, Sommelier, búsqueda, importación CSV/XLSX,
+cada camino de mutación y la réplica local (SQLite) con su sincronización. Los resultados van a un JSON para comparar
+corridas:
+
+    python benchmarks/bench_vinoteca.py --tamanos 1000,10000 --salida antes.json
+    python benchmarks/bench_vinoteca.py --tamanos 1000,10000 --comparar antes.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+from almacen import AGREGAR, BORRAR, PARCHEAR, HojaEnMemoria, Mutacion, SecuenciaIds, aplicar_mutaciones
+from imagenes import AlmacenImagenes, procesar_lote
+from busqueda import IndiceTexto
+from importador import importar
+from inventario import IndiceHuellas, Inventario, migrar_imagenes_legado
+from replica import ReplicaLocal, SincronizadorReplica
+from sommelier import IndiceFacetas, recomendar
+
+SEMILLA = 20240601
+TAMANOS = [1_000, 10_000, 100_000]
+
+UBICACIONES = [
+    'Por Clasificar', 'Cava Eléctrica', 'Mueble Norte - Botelleros', 'Mueble Norte - Bandejas',
+    'Mueble Este - Bandejas', 'Mueble Este - Cajonera', 'Mueble Sur - X Izquierda', 'Consumido',
+]
+UVAS = ['Malbec', 'Cabernet Sauvignon', 'Merlot', 'Syrah', 'Pinot Noir', 'Bonarda',
+        'Cabernet Franc', 'Chardonnay', 'Torrontés', 'Blend']
+PROCEDENCIAS = ['Mendoza', 'Salta', 'Neuquén', 'San Juan', 'Patagonia', 'Rioja', 'Burdeos']
+GAMAS = ['Entrada', 'Media', 'Alta', 'Premium', 'Ícono']
+
+
+# --- DATOS SINTÉTICOS ---
+def _jpeg(rng, lado=64):
+    pixeles = rng.integers(0, 255, size=(lado, lado, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixeles).save(buffer, format='JPEG', quality=80)
+    return buffer.getvalue()
+
+
+def bodega_sintetica(n, con_imagenes=False, semilla=SEMILLA):
+    """
+    Inventario de `n` botellas con la forma en que llega de la hoja.
+    Con `con_imagenes`, 1 de cada 10 trae la foto legado en Hex (`imagen_data`).
+    """
+    rng = np.random.default_rng(semilla)
+    bodegas = np.array([f"Bodega {i}" for i in range(max(10, n // 50))])
+    anada = rng.integers(1995, 2024, n)
+    df = pd.DataFrame({
+        'id': np.arange(1, n + 1),
+        'nombre': [f"Vino {i}" for i in rng.integers(0, n, n)],
+        'bodega': bodegas[rng.integers(0, len(bodegas), n)],
+        'enologo': np.array([f"Enólogo {i}" for i in range(40)])[rng.integers(0, 40, n)],
+        'anada': anada,
+        'uva_principal': np.array(UVAS)[rng.integers(0, len(UVAS), n)],
+        'composicion_blend': '',
+        'gama': np.array(GAMAS)[rng.integers(0, len(GAMAS), n)],
+        'procedencia': np.array(PROCEDENCIAS)[rng.integers(0, len(PROCEDENCIAS), n)],
+        'detalle': 'Notas de frutos rojos, buena acidez.',
+        'nota_cata': '',
+        'ubicacion': np.array(UBICACIONES)[rng.integers(0, len(UBICACIONES), n)],
+        'anio_limite': anada + rng.integers(3, 15, n),
+        'puntuacion': rng.integers(1, 11, n),
+        'imagen_hash': None,
+        'tipo_imagen': None,
+    })
+    if con_imagenes:
+        fotos = [_jpeg(rng).hex() for _ in range(20)]
+        imagen_data = np.full(n, '', dtype=object)
+        con_foto = np.arange(0, n, 10)
+        imagen_data[con_foto] = [fotos[i % len(fotos)] for i in range(len(con_foto))]
+        df['imagen_data'] = imagen_data
+    return df
+
+
+def planilla_importacion(n, semilla=SEMILLA):
+    """Planilla "de usuario" con alias de columnas (name, winery, vintage...)."""
+    df = bodega_sintetica(n, semilla=semilla + 1)
+    return pd.DataFrame({
+        'Name': df['nombre'], 'Winery': df['bodega'], 'Vintage': df['anada'],
+        'Uva': np.where(np.arange(n) % 7 == 0, 'Malbec/Cabernet', df['uva_principal']),
+        'Region': df['procedencia'], 'Notas': df['detalle'], 'Puntos': df['puntuacion'],
+    })
+
+
+# --- MEDICIÓN ---
+def medir(funcion, repeticiones, preparar=None):
+    """Tiempos en ms de `funcion(preparar())` (la preparación no se mide)."""
+    tiempos = []
+    for _ in range(repeticiones):
+        arg = preparar() if preparar else None
+        inicio = time.perf_counter()
+        funcion(arg) if preparar else funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return tiempos
+
+
+class Corrida:
+    def __init__(self, repeticiones):
+        self.repeticiones = repeticiones
+        self.resultados = []
+
+    def caso(self, nombre, n, funcion, preparar=None, repeticiones=None, **extra):
+        tiempos = medir(funcion, repeticiones or self.repeticiones, preparar)
+        fila = {
+            'caso': nombre, 'n': n, 'repeticiones': len(tiempos),
+            'ms_min': round(min(tiempos), 3), 'ms_mediana': round(statistics.median(tiempos), 3),
+            **extra,
+        }
+        self.resultados.append(fila)
+        print(f"{nombre:<32} n={n:>7}  min {fila['ms_min']:>10.2f} ms  mediana {fila['ms_mediana']:>10.2f} ms",
+              flush=True)
+
+
+# --- CASOS ---
+def bench_carga(corrida, n, con_imagenes, dir_imagenes):
+    crudo = bodega_sintetica(n, con_imagenes)
+    sufijo = '+imagen_data' if con_imagenes else ''
+
+    def cargar():
+        hoja = HojaEnMemoria(crudo)
+        return Inventario(hoja.leer, indices={'huellas': IndiceHuellas}).obtener()
+    memoria = int(cargar().df.memory_usage(deep=True).sum())
+    corrida.caso(f'carga.parseo{sufijo}', n, cargar, bytes_frame=memoria)
+
+    if con_imagenes:
+        def migrar(df):
+            migrar_imagenes_legado(df, AlmacenImagenes(tempfile.mkdtemp(dir=dir_imagenes)))
+        corrida.caso('carga.migrar_imagenes', n, migrar, preparar=crudo.copy, repeticiones=1)
+
+
+def bench_sommelier(corrida, n):
+    hoja = HojaEnMemoria(bodega_sintetica(n))
+    snap = Inventario(hoja.leer).obtener()
+    activos = snap.df[snap.df['ubicacion'] != 'Consumido']
+    corrida.caso('sommelier.facetas', n, lambda: IndiceFacetas(activos))
+    facetas = IndiceFacetas(activos)
+    filtros = {'uva_principal': ['Malbec', 'Syrah'], 'procedencia': ['Mendoza']}
+    corrida.caso('sommelier.mascara', n, lambda: facetas.mascara(filtros, anio_limite_max=2026))
+    corrida.caso('sommelier.conteos', n, lambda: [facetas.conteos(c, filtros) for c in filtros])
+    mascara = facetas.mascara(filtros)
+    corrida.caso('sommelier.recomendar', n, lambda: recomendar(facetas, mascara, n=4, semilla=1))
+    corrida.caso('filtro.ubicacion', n, lambda: snap.df[snap.df['ubicacion'] != 'Consumido'])
+
+
+def bench_busqueda(corrida, n):
+    snap = Inventario(HojaEnMemoria(bodega_sintetica(n)).leer).obtener()
+    corrida.caso('busqueda.construir', n, lambda: IndiceTexto().construir(snap.df), repeticiones=1)
+    indice = IndiceTexto().construir(snap.df)
+    corrida.caso('busqueda.exacta', n, lambda: indice.buscar('bodega 17 mendoza'))
+    corrida.caso('busqueda.con_errores', n, lambda: indice.buscar('malbek mendosa frutos'))
+    fila = snap.fila(int(snap.df['id'].iloc[0]))
+    cambiada = dict(fila, nota_cata='Violetas, Gualtallary')
+    corrida.caso('busqueda.actualizar', n, lambda: indice.actualizar(int(fila['id']), fila, cambiada))
+
+
+def bench_mutaciones(corrida, n):
+    base = bodega_sintetica(n)
+    ids = base['id'].to_numpy()
+    lote = ids[np.linspace(0, n - 1, min(100, n), dtype=int)].tolist()
+
+    def preparar():
+        hoja = HojaEnMemoria(base)
+        inventario = Inventario(hoja.leer, indices={'huellas': IndiceHuellas})
+        inventario.obtener()
+        return hoja, inventario
+
+    def aplicar(mutaciones):
+        def correr(estado):
+            hoja, inventario = estado
+            inventario.aplicar(aplicar_mutaciones(hoja, mutaciones))
+        return correr
+
+    nuevos = [Mutacion(AGREGAR, n + 1 + i, {'nombre': f"Nuevo {i}", 'bodega': 'Nueva', 'anada': 2022})
+              for i in range(100)]
+    casos = {
+        'mutacion.parchear_1': [Mutacion(PARCHEAR, lote[0], {'ubicacion': 'Consumido'})],
+        'mutacion.parchear_100': [Mutacion(PARCHEAR, i, {'ubicacion': 'Consumido'}) for i in lote],
+        'mutacion.agregar_100': nuevos,
+        'mutacion.borrar_100': [Mutacion(BORRAR, i) for i in lote],
+    }
+    for nombre, mutaciones in casos.items():
+        corrida.caso(nombre, n, aplicar(mutaciones), preparar=preparar, mutaciones=len(mutaciones))
+
+
+def bench_replica(corrida, n):
+    base = bodega_sintetica(n)
+    ids = base['id'].to_numpy()
+    lote = ids[np.linspace(0, n - 1, min(100, n), dtype=int)].tolist()
+
+    def vacia():
+        replica, hoja = ReplicaLocal(':memory:'), HojaEnMemoria(base)
+        return replica, SincronizadorReplica(replica, hoja, iniciar=False), hoja
+
+    def cargada():
+        estado = vacia()
+        estado[1].traer_inicial()
+        return estado
+
+    corrida.caso('replica.traer_inicial', n, lambda e: e[1].traer_inicial(), preparar=vacia, repeticiones=1)
+    replica = cargada()[0]
+    corrida.caso('replica.leer', n, replica.leer)
+    corrida.caso('replica.ids_donde', n, lambda: replica.ids_donde(ubicacion='Por Clasificar'))
+
+    parches = [Mutacion(PARCHEAR, i, {'ubicacion': 'Consumido'}) for i in lote]
+    corrida.caso('replica.escribir_100', n, lambda e: aplicar_mutaciones(e[0], parches),
+                 preparar=cargada, mutaciones=len(parches))
+
+    def con_bandeja():
+        estado = cargada()
+        aplicar_mutaciones(estado[0], parches)
+        return estado
+    corrida.caso('replica.enviar_100', n, lambda e: e[1].sincronizar(), preparar=con_bandeja,
+                 mutaciones=len(parches))
+
+    def con_cambios_remotos():
+        estado = cargada()
+        # Otro cliente cambia 50 filas
+        aplicar_mutaciones(estado[2], [Mutacion(PARCHEAR, i, {'puntuacion': 10}) for i in lote[:50]])
+        return estado
+    corrida.caso('replica.traer_50', n, lambda e: e[1].sincronizar(), preparar=con_cambios_remotos)
+
+
+def bench_importacion(corrida, n, formatos):
+    planilla = planilla_importacion(n)
+    archivos = {}
+    if 'csv' in formatos:
+        archivos['csv'] = planilla.to_csv(index=False).encode('utf-8')
+    if 'xlsx' in formatos:
+        buffer = io.BytesIO()
+        planilla.to_excel(buffer, index=False)
+        archivos['xlsx'] = buffer.getvalue()
+
+    indice = IndiceHuellas().construir(Inventario(HojaEnMemoria(bodega_sintetica(n)).leer).obtener().df)
+    for formato, datos in archivos.items():
+        corrida.caso(
+            f'importar.{formato}', n,
+            lambda: importar(io.BytesIO(datos), f"planilla.{formato}", SecuenciaIds(), indice_huellas=indice),
+            repeticiones=1 if formato == 'xlsx' else None, bytes=len(datos),
+        )
+
+
+def bench_imagenes(corrida, cantidad, dir_imagenes):
+    rng = np.random.default_rng(SEMILLA)
+    fotos = [_jpeg(rng, lado=1600) for _ in range(cantidad)]
+    almacen = lambda: AlmacenImagenes(tempfile.mkdtemp(dir=dir_imagenes))
+    corrida.caso('imagenes.guardar_1', 1, lambda a: a.guardar(fotos[0]), preparar=almacen)
+    corrida.caso(
+        'imagenes.lote_procesos', cantidad,
+        lambda a: procesar_lote(a, list(enumerate(fotos))), preparar=almacen, repeticiones=1,
+    )
+
+
+# --- SALIDA ---
+def metadatos(args):
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'argumentos': vars(args),
+    }
+
+
+def comparar(actuales, ruta_anterior, umbral=0.10):
+    """Imprime la variación de la mediana respecto de una corrida anterior."""
+    anteriores = {(r['caso'], r['n']): r for r in json.loads(Path(ruta_anterior).read_text())['resultados']}
+    print(f"\nComparación con {ruta_anterior} (umbral ±{umbral:.0%}):")
+    for r in actuales:
+        previo = anteriores.get((r['caso'], r['n']))
+        if not previo or not previo['ms_mediana']:
+            continue
+        cambio = r['ms_mediana'] / previo['ms_mediana'] - 1
+        marca = '  ⚠️ más lento' if cambio > umbral else ('  ✅ más rápido' if cambio < -umbral else '')
+        print(f"{r['caso']:<32} n={r['n']:>7}  {previo['ms_mediana']:>10.2f} -> {r['ms_mediana']:>10.2f} ms "
+              f"({cambio:+.1%}){marca}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--tamanos', default=','.join(map(str, TAMANOS)),
+                        help="Cantidad de botellas por bodega sintética (separadas por coma)")
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--imagenes', type=int, default=16, help="Fotos para el benchmark de imágenes")
+    parser.add_argument('--formatos', default='csv,xlsx')
+    parser.add_argument('--salida', default=str(RAIZ / 'benchmarks' / 'resultados.json'))
+    parser.add_argument('--comparar', help="JSON de una corrida anterior")
+    args = parser.parse_args()
+
+    tamanos = [int(t) for t in args.tamanos.split(',') if t]
+    formatos = [f for f in args.formatos.split(',') if f]
+    corrida = Corrida(args.repeticiones)
+    with tempfile.TemporaryDirectory() as dir_imagenes:
+        for n in tamanos:
+            bench_carga(corrida, n, False, dir_imagenes)
+            bench_carga(corrida, n, True, dir_imagenes)
+            bench_sommelier(corrida, n)
+            bench_busqueda(corrida, n)
+            bench_mutaciones(corrida, n)
+            bench_replica(corrida, n)
+            bench_importacion(corrida, n, formatos)
+        if args.imagenes:
+            bench_imagenes(corrida, args.imagenes, dir_imagenes)
+
+    salida = {'meta': metadatos(args), 'resultados': corrida.resultados}
+    Path(args.salida).write_text(json.dumps(salida, indent=2, ensure_ascii=False))
+    print(f"\nResultados en {args.salida}")
+    if args.comparar:
+        comparar(corrida.resultados, args.comparar)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""
+Búsqueda de texto libre sobre el inventario (sin Streamlit).
+
+`IndiceTexto` es un índice invertido palabra -> {id: peso} sobre nombre,
+bodega, enólogo, uva, procedencia, detalle y nota de cata, sin acentos ni
+mayúsculas. Las palabras de la consulta que no están tal cual en el
+vocabulario se resuelven por trigramas contra las palabras conocidas, así
+"gualtalari" encuentra "Gualtallary" y "viol" encuentra "violetas".
+
+Es un `IndiceIncremental`: se construye una vez por lectura completa y
+después se mantiene fila a fila con cada mutación.
+"""
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+
+from inventario import IndiceIncremental, normalizar_serie, normalizar_texto
+
+# Campo -> peso de una coincidencia en él
+CAMPOS = {
+    'nombre': 3.0,
+    'bodega': 2.0,
+    'enologo': 2.0,
+    'uva_principal': 1.5,
+    'composicion_blend': 1.5,
+    'procedencia': 1.5,
+    'detalle': 1.0,
+    'nota_cata': 1.0,
+}
+LARGO_MINIMO = 2
+# Similitud de trigramas (Jaccard) mínima para aceptar una palabra parecida
+SIMILITUD_MINIMA = 0.4
+# Palabras del vocabulario que se prueban por cada palabra de la consulta
+MAX_VARIANTES = 8
+MAX_RESULTADOS = 20
+ESCALA = 1e6
+
+_PALABRA = re.compile(r'[a-z0-9]+')
+
+
+def palabras(texto):
+    """Palabras normalizadas de `texto` (sin acentos, minúsculas, 2+ letras)."""
+    return [p for p in _PALABRA.findall(normalizar_texto(texto)) if len(p) >= LARGO_MINIMO]
+
+
+def trigramas(palabra):
+    p = f" {palabra} "
+    return {p[i:i + 3] for i in range(len(p) - 2)}
+
+
+def _pesos_de_fila(fila):
+    """palabra -> peso del campo más importante en el que aparece."""
+    pesos = {}
+    for campo, peso in CAMPOS.items():
+        for p in palabras(fila.get(campo)):
+            if pesos.get(p, 0) < peso:
+                pesos[p] = peso
+    return pesos
+
+
+class IndiceTexto(IndiceIncremental):
+    """
+    `buscar(consulta)` -> [(id, puntaje)] ordenado: primero las botellas que
+    cubren más palabras de la consulta, después por puntaje (peso del campo
+    x similitud x rareza de la palabra).
+    """
+    def __init__(self):
+        self._postings = {}     # palabra -> {id: peso}
+        self._por_id = {}       # id -> {palabra: peso}
+        self._trigramas = {}    # trigrama -> palabras del vocabulario
+        self._lock = threading.Lock()
+
+    def construir(self, df):
+        if df.empty or 'id' not in df.columns:
+            return self
+        presentes = [c for c in CAMPOS if c in df.columns]
+        # Una normalización vectorizada por columna y un split por texto distinto
+        textos = [normalizar_serie(df[c]).tolist() for c in presentes]
+        pesos_campo = [CAMPOS[c] for c in presentes]
+        partidos = {}
+        for n, id_vino in enumerate(df['id'].tolist()):
+            pesos = {}
+            for columna, peso in zip(textos, pesos_campo):
+                texto = columna[n]
+                if texto not in partidos:
+                    partidos[texto] = [p for p in _PALABRA.findall(texto) if len(p) >= LARGO_MINIMO]
+                for p in partidos[texto]:
+                    if pesos.get(p, 0) < peso:
+                        pesos[p] = peso
+            self._indexar(int(id_vino), pesos)
+        return self
+
+    def actualizar(self, id_vino, antes, despues):
+        with self._lock:
+            self._desindexar(id_vino)
+            if despues is not None:
+                self._indexar(id_vino, _pesos_de_fila(despues))
+
+    def _indexar(self, id_vino, pesos):
+        self._por_id[id_vino] = pesos
+        for p, peso in pesos.items():
+            if p not in self._postings:
+                self._postings[p] = {}
+                for t in trigramas(p):
+                    self._trigramas.setdefault(t, set()).add(p)
+            self._postings[p][id_vino] = peso
+
+    def _desindexar(self, id_vino):
+        for p in self._por_id.pop(id_vino, {}):
+            ids = self._postings[p]
+            ids.pop(id_vino, None)
+            if not ids:
+                # Palabra que ya no está en ninguna botella: sale del vocabulario
+                del self._postings[p]
+                for t in trigramas(p):
+                    self._trigramas[t].discard(p)
+                    if not self._trigramas[t]:
+                        del self._trigramas[t]
+
+    def variantes(self, palabra):
+        """[(palabra del vocabulario, similitud)] para una palabra de la consulta."""
+        propios = trigramas(palabra)
+        compartidos = Counter()
+        for t in propios:
+            compartidos.update(self._trigramas.get(t, ()))
+        candidatas = []
+        for p, n in compartidos.items():
+            similitud = n / (len(propios) + len(trigramas(p)) - n)
+            if p == palabra:
+                similitud = 1.0
+            elif len(palabra) >= 3 and p.startswith(palabra):
+                # Prefijo: la palabra se está terminando de escribir
+                similitud = max(similitud, 0.8)
+            if similitud >= SIMILITUD_MINIMA:
+                candidatas.append((p, similitud))
+        candidatas.sort(key=lambda x: -x[1])
+        return candidatas[:MAX_VARIANTES]
+
+    def buscar(self, consulta, limite=MAX_RESULTADOS):
+        terminos = list(dict.fromkeys(palabras(consulta)))
+        if not terminos:
+            return []
+        with self._lock:
+            total = max(1, len(self._por_id))
+            # Variantes de cada término, del más raro al más común
+            por_termino = []
+            for termino in terminos:
+                variantes = [(self._postings[p], similitud) for p, similitud in self.variantes(termino)]
+                por_termino.append((sum(len(ids) for ids, _ in variantes), variantes))
+            por_termino.sort(key=lambda x: x[0])
+
+            puntajes = {}
+            cubiertas = {}
+            for tamano, variantes in por_termino:
+                # Un término común solo puntúa las botellas que ya trajeron los más raros
+                candidatas = puntajes if puntajes and tamano > len(puntajes) else None
+                # Mejor coincidencia de este término en cada botella
+                mejor = {}
+                for ids, similitud in variantes:
+                    factor = similitud * math.log(1 + total / len(ids))
+                    if candidatas is None and not mejor:
+                        mejor = {i: peso * factor for i, peso in ids.items()}
+                        continue
+                    if candidatas is None:
+                        pares = ids.items()
+                    else:
+                        pares = ((i, ids[i]) for i in candidatas if i in ids)
+                    for id_vino, peso in pares:
+                        valor = peso * factor
+                        if valor > mejor.get(id_vino, 0):
+                            mejor[id_vino] = valor
+                if not puntajes:
+                    puntajes, cubiertas = mejor, dict.fromkeys(mejor, 1)
+                    continue
+                for id_vino, valor in mejor.items():
+                    puntajes[id_vino] = puntajes.get(id_vino, 0) + valor
+                    cubiertas[id_vino] = cubiertas.get(id_vino, 0) + 1
+        # Cubrir más términos pesa más que cualquier puntaje (un término suma < ESCALA)
+        orden = {i: cubiertas[i] * ESCALA + v for i, v in puntajes.items()}
+        ranking = heapq.nlargest(limite, orden, key=orden.get)
+        return [(i, round(puntajes[i], 3)) for i in ranking]
@@ -0,0 +1,102 @@
+"""
+Caché persistente en disco (SQLite) para consultas externas.
+
+Guarda resultados de búsqueda y descargas entre reinicios de la app, con
+vencimiento por entrada (TTL) y expulsión LRU cuando se supera el tamaño
+máximo. Es segura entre hilos y entre procesos (SQLite con WAL).
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+RUTA_POR_DEFECTO = os.environ.get(
+    'VINOTECA_CACHE', str(Path(__file__).parent / '.cache' / 'externos.sqlite')
+)
+TTL_POR_DEFECTO = 7 * 24 * 3600
+TAMANO_MAXIMO = 256 * 1024 * 1024
+
+
+class CacheDisco:
+    """
+    clave (str) -> valor (cualquier objeto serializable con pickle).
+    `obtener` devuelve None si no está o venció.
+    """
+    def __init__(self, ruta=RUTA_POR_DEFECTO, ttl=TTL_POR_DEFECTO, tamano_maximo=TAMANO_MAXIMO):
+        self.ruta = Path(ruta)
+        self.ttl = ttl
+        self.tamano_maximo = tamano_maximo
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+        self._lock = threading.Lock()
+        if str(ruta) != ':memory:':
+            self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(ruta), check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            ' clave TEXT PRIMARY KEY, valor BLOB, tamano INTEGER,'
+            ' vence REAL, accedido REAL)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS cache_accedido ON cache (accedido)')
+
+    def obtener(self, clave):
+        ahora = time.time()
+        with self._lock:
+            fila = self._db.execute(
+                'SELECT valor, vence FROM cache WHERE clave = ?', (clave,)
+            ).fetchone()
+            if fila is None or fila[1] < ahora:
+                self.fallos += 1
+                return None
+            self._db.execute('UPDATE cache SET accedido = ? WHERE clave = ?', (ahora, clave))
+            self.aciertos += 1
+        return pickle.loads(fila[0])
+
+    def guardar(self, clave, valor, ttl=None):
+        datos = pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL)
+        ahora = time.time()
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)',
+                (clave, datos, len(datos), ahora + (self.ttl if ttl is None else ttl), ahora),
+            )
+            self._expulsar(ahora)
+
+    def _expulsar(self, ahora):
+        """Borra lo vencido y, si aún sobra, lo usado hace más tiempo."""
+        self.expulsiones += self._db.execute('DELETE FROM cache WHERE vence < ?', (ahora,)).rowcount
+        total = self._db.execute('SELECT COALESCE(SUM(tamano), 0) FROM cache').fetchone()[0]
+        if total <= self.tamano_maximo:
+            return
+        sobrante = total - self.tamano_maximo
+        claves = []
+        for clave, tamano in self._db.execute('SELECT clave, tamano FROM cache ORDER BY accedido'):
+            if sobrante <= 0:
+                break
+            claves.append((clave,))
+            sobrante -= tamano
+        self._db.executemany('DELETE FROM cache WHERE clave = ?', claves)
+        self.expulsiones += len(claves)
+
+    def vaciar(self):
+        with self._lock:
+            self._db.execute('DELETE FROM cache')
+
+    def estadisticas(self):
+        with self._lock:
+            entradas, tamano = self._db.execute(
+                'SELECT COUNT(*), COALESCE(SUM(tamano), 0) FROM cache'
+            ).fetchone()
+        consultas = self.aciertos + self.fallos
+        return {
+            'aciertos': self.aciertos,
+            'fallos': self.fallos,
+            'tasa_aciertos': self.aciertos / consultas if consultas else 0.0,
+            'expulsiones': self.expulsiones,
+            'entradas': entradas,
+            'bytes': tamano,
+        }
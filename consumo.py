@@ -0,0 +1,143 @@
+"""
+Historial de consumo (sin Streamlit).
+
+Al marcar una botella como consumida se guarda `fecha_consumo`; al
+restaurarla se borra. `IndiceConsumo` mantiene agregados del historial
+(botellas por mes, por uva y por bodega, puntaje promedio y si se bebió
+antes o después de `anio_limite`) que se actualizan con cada
+consumo / restauración en lugar de reagrupar todo el historial.
+"""
+import threading
+from collections import Counter
+from datetime import datetime
+
+import pandas as pd
+
+from almacen import _entero
+from inventario import IndiceIncremental
+
+CONSUMIDO = 'Consumido'
+SIN_FECHA = 'Sin fecha'
+
+
+def ahora_iso():
+    return datetime.now().isoformat(timespec='seconds')
+
+
+def cambios_de_consumo(ubicacion_anterior, ubicacion_nueva, fecha=None):
+    """
+    Celdas extra de un cambio de ubicación: la fecha al entrar en
+    'Consumido' y None al salir. Mover entre consumidos no la toca.
+    """
+    if ubicacion_nueva == CONSUMIDO and ubicacion_anterior != CONSUMIDO:
+        return {'fecha_consumo': fecha or ahora_iso()}
+    if ubicacion_anterior == CONSUMIDO and ubicacion_nueva != CONSUMIDO:
+        return {'fecha_consumo': None}
+    return {}
+
+
+def consumidos_recientes(df, n=10):
+    """
+    Las últimas `n` botellas consumidas según `fecha_consumo` (las más
+    recientes al final). Las consumidas antes de que existiera la fecha
+    cuentan como las más viejas.
+    """
+    if 'ubicacion' not in df.columns:
+        return df.iloc[:0]
+    consumidos = df[df['ubicacion'] == CONSUMIDO]
+    if 'fecha_consumo' in consumidos.columns:
+        # Orden estable: a igual fecha queda el orden de la hoja
+        consumidos = consumidos.sort_values(
+            'fecha_consumo', key=lambda s: s.astype(str).where(s.notna()),
+            na_position='first', kind='stable'
+        )
+    return consumidos.tail(n)
+
+
+def _mes(fecha):
+    return fecha[:7] if isinstance(fecha, str) and len(fecha) >= 7 else SIN_FECHA
+
+
+def _plazo(fecha, anio_limite):
+    """'a_tiempo' / 'tarde' según el año de consumo y el límite (None si falta alguno)."""
+    if not isinstance(fecha, str) or len(fecha) < 4 or not anio_limite:
+        return None
+    return 'a_tiempo' if _entero(fecha[:4]) <= anio_limite else 'tarde'
+
+
+def _restar(contador, clave, n):
+    contador[clave] += n
+    if contador[clave] <= 0:
+        del contador[clave]
+
+
+class IndiceConsumo(IndiceIncremental):
+    def __init__(self):
+        self.por_mes = Counter()
+        self.por_uva = Counter()
+        self.por_bodega = Counter()
+        self.plazos = Counter()
+        self.total = 0
+        self.puntos_suma = 0
+        self.puntos_n = 0
+        self._lock = threading.Lock()
+
+    def construir(self, df):
+        if df.empty or 'ubicacion' not in df.columns:
+            return self
+        consumidos = df[df['ubicacion'] == CONSUMIDO]
+        fechas = consumidos['fecha_consumo'] if 'fecha_consumo' in consumidos.columns \
+            else pd.Series(None, index=consumidos.index, dtype=object)
+        limites = consumidos['anio_limite'] if 'anio_limite' in consumidos.columns \
+            else pd.Series(0, index=consumidos.index)
+        puntos = consumidos['puntuacion'] if 'puntuacion' in consumidos.columns \
+            else pd.Series(0, index=consumidos.index)
+
+        self.total = len(consumidos)
+        self.por_mes = Counter(fechas.map(_mes).value_counts().to_dict())
+        for col, contador in (('uva_principal', self.por_uva), ('bodega', self.por_bodega)):
+            if col in consumidos.columns:
+                contador.update({k: int(n) for k, n in consumidos[col].value_counts().items() if n})
+        self.plazos = Counter(
+            p for p in map(_plazo, fechas.tolist(), limites.tolist()) if p is not None
+        )
+        con_puntos = puntos[puntos > 0]
+        self.puntos_suma = int(con_puntos.sum())
+        self.puntos_n = len(con_puntos)
+        return self
+
+    def _sumar(self, fila, n):
+        self.total += n
+        _restar(self.por_mes, _mes(fila.get('fecha_consumo')), n)
+        for col, contador in (('uva_principal', self.por_uva), ('bodega', self.por_bodega)):
+            valor = fila.get(col)
+            if isinstance(valor, str) and valor:
+                _restar(contador, valor, n)
+        plazo = _plazo(fila.get('fecha_consumo'), _entero(fila.get('anio_limite')))
+        if plazo is not None:
+            _restar(self.plazos, plazo, n)
+        puntos = _entero(fila.get('puntuacion'))
+        if puntos > 0:
+            self.puntos_suma += n * puntos
+            self.puntos_n += n
+
+    def actualizar(self, id_vino, antes, despues):
+        with self._lock:
+            if antes is not None and antes.get('ubicacion') == CONSUMIDO:
+                self._sumar(antes, -1)
+            if despues is not None and despues.get('ubicacion') == CONSUMIDO:
+                self._sumar(despues, 1)
+
+    def resumen(self):
+        """Copia de los agregados para graficar (meses en orden cronológico)."""
+        with self._lock:
+            return {
+                'total': self.total,
+                'puntos_promedio': self.puntos_suma / self.puntos_n if self.puntos_n else None,
+                'a_tiempo': self.plazos['a_tiempo'],
+                'tarde': self.plazos['tarde'],
+                'sin_fecha': self.por_mes[SIN_FECHA],
+                'por_mes': {m: self.por_mes[m] for m in sorted(self.por_mes) if m != SIN_FECHA},
+                'por_uva': dict(self.por_uva.most_common()),
+                'por_bodega': dict(self.por_bodega.most_common()),
+            }
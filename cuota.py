@@ -0,0 +1,134 @@
+"""
+Control de cuota para la API de Google Sheets.
+
+Un `LimitadorCuota` compartido por todas las sesiones reparte las llamadas
+con una cubeta de tokens por tipo (lectura / escritura) dimensionada a la
+cuota por minuto, y reintenta con backoff exponencial con jitter solo los
+errores de cuota (429) y los transitorios (5xx, red).
+"""
+import random
+import threading
+import time
+
+LECTURA = 'lectura'
+ESCRITURA = 'escritura'
+
+# Cuota de Sheets por usuario: 60 lecturas y 60 escrituras por minuto
+POR_MINUTO = 60
+# Ráfaga máxima permitida antes de empezar a espaciar llamadas
+RAFAGA = 10
+
+CODIGOS_REINTENTABLES = {408, 429, 500, 502, 503, 504}
+
+
+class ErrorHttp(Exception):
+    """Error con código HTTP (lo usan los backends locales para simular fallos)."""
+    def __init__(self, status_code, mensaje=''):
+        super().__init__(mensaje or f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def codigo_http(error):
+    """Código HTTP de un error de gspread / requests / ErrorHttp (o None)."""
+    respuesta = getattr(error, 'response', None)
+    codigo = getattr(respuesta, 'status_code', None) or getattr(error, 'status_code', None)
+    if codigo is None and hasattr(error, 'code'):  # gspread.APIError
+        codigo = error.code
+    try:
+        return int(codigo)
+    except (TypeError, ValueError):
+        return None
+
+
+def es_reintentable(error):
+    # requests solo hace falta cuando algo falla: no pesa en el arranque
+    import requests
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    return codigo_http(error) in CODIGOS_REINTENTABLES
+
+
+def _retry_after(error):
+    respuesta = getattr(error, 'response', None)
+    try:
+        return float(respuesta.headers.get('Retry-After'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class CubetaTokens:
+    """`capacidad` tokens que se reponen a `por_segundo`."""
+    def __init__(self, capacidad, por_segundo, reloj=time.monotonic):
+        self.capacidad = capacidad
+        self.por_segundo = por_segundo
+        self._reloj = reloj
+        self._tokens = float(capacidad)
+        self._ultimo = reloj()
+        self._lock = threading.Lock()
+
+    def reservar(self):
+        """Toma un token y devuelve cuántos segundos hay que esperar para usarlo."""
+        with self._lock:
+            ahora = self._reloj()
+            self._tokens = min(self.capacidad, self._tokens + (ahora - self._ultimo) * self.por_segundo)
+            self._ultimo = ahora
+            self._tokens -= 1
+            # En negativo: la llamada queda en cola detrás de las ya reservadas
+            return max(0.0, -self._tokens / self.por_segundo)
+
+
+class LimitadorCuota:
+    """
+    Punto único por el que pasan las llamadas a la hoja:
+    `llamar(tipo, funcion, *args)` espera su turno, llama y reintenta si
+    corresponde. `estadisticas()` expone los contadores.
+    """
+    def __init__(self, por_minuto=POR_MINUTO, rafaga=RAFAGA, reintentos=5,
+                 espera_base=1.0, espera_maxima=32.0, dormir=time.sleep, reloj=time.monotonic):
+        self._cubetas = {
+            tipo: CubetaTokens(rafaga, por_minuto / 60, reloj) for tipo in (LECTURA, ESCRITURA)
+        }
+        self.reintentos = reintentos
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self._dormir = dormir
+        self._lock = threading.Lock()
+        self._contadores = {
+            'llamadas': 0, 'demoradas': 0, 'reintentadas': 0, 'fallidas': 0, 'segundos_espera': 0.0,
+        }
+
+    def _contar(self, clave, n=1):
+        with self._lock:
+            self._contadores[clave] += n
+
+    def _esperar(self, segundos):
+        if segundos > 0:
+            self._contar('segundos_espera', segundos)
+            self._dormir(segundos)
+
+    def espera_reintento(self, intento, error=None):
+        """Backoff exponencial con jitter completo (respeta Retry-After)."""
+        sugerida = _retry_after(error) if error is not None else None
+        if sugerida is not None:
+            return min(sugerida, self.espera_maxima)
+        return random.uniform(0, min(self.espera_maxima, self.espera_base * 2 ** intento))
+
+    def llamar(self, tipo, funcion, *args, **kwargs):
+        for intento in range(self.reintentos + 1):
+            espera = self._cubetas[tipo].reservar()
+            if espera > 0:
+                self._contar('demoradas')
+                self._esperar(espera)
+            self._contar('llamadas')
+            try:
+                return funcion(*args, **kwargs)
+            except Exception as e:
+                if not es_reintentable(e) or intento == self.reintentos:
+                    self._contar('fallidas')
+                    raise
+                self._contar('reintentadas')
+                self._esperar(self.espera_reintento(intento, e))
+
+    def estadisticas(self):
+        with self._lock:
+            return dict(self._contadores)
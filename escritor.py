@@ -0,0 +1,123 @@
+"""
+Escritura diferida (write-behind) a la hoja.
+
+Las mutaciones se aplican en el acto a la instantánea en memoria (la UI ve
+el cambio sin esperar) y un único hilo escritor por proceso las envía a la
+hoja en segundo plano, juntando las ráfagas en un solo lote. Cada envío
+devuelve un ticket para consultar si terminó bien o falló.
+"""
+import threading
+import time
+
+from almacen import AGREGAR, BORRAR, PARCHEAR, BloqueoSeguridad, Mutacion, aplicar_mutaciones
+
+PENDIENTE = 'pendiente'
+OK = 'ok'
+ERROR = 'error'
+
+# Segundos que se espera para juntar mutaciones que llegan seguidas
+ESPERA_RAFAGA = 0.3
+# Resultados que se recuerdan para consultar por ticket
+MAX_RESULTADOS = 1000
+
+
+def marcas_de_revision(selladas):
+    """Parches con solo `revision`/`updated_at` de lo que quedó escrito."""
+    borradas = {m.id for m in selladas if m.tipo == BORRAR}
+    return [
+        Mutacion(PARCHEAR, m.id, {c: m.cambios[c] for c in ('revision', 'updated_at')})
+        for m in selladas
+        if m.tipo in (AGREGAR, PARCHEAR) and 'revision' in m.cambios and m.id not in borradas
+    ]
+
+
+class EscritorDiferido:
+    """
+    Único escritor de `hoja` en el proceso (compartido vía cache_resource).
+    `inventario` es el `Inventario` cuya instantánea se actualiza de forma
+    optimista; si la escritura falla se invalida para volver a la hoja.
+    """
+    def __init__(self, hoja, inventario, espera=ESPERA_RAFAGA):
+        self._hoja = hoja
+        self._inventario = inventario
+        self.espera = espera
+        self._pendientes = []
+        self._resultados = {}
+        self._ticket = 0
+        self._escribiendo = False
+        self._cond = threading.Condition()
+        self._hilo = threading.Thread(target=self._bucle, daemon=True, name='escritor-hoja')
+        self._hilo.start()
+
+    @property
+    def ocupado(self):
+        """True mientras haya mutaciones aplicadas en memoria y no en la hoja."""
+        with self._cond:
+            return bool(self._pendientes) or self._escribiendo
+
+    def _verificar_bajas(self, mutaciones):
+        # Mismo bloqueo que la hoja, pero antes de tocar la instantánea
+        bajas = {int(m.id) for m in mutaciones if m.tipo == BORRAR}
+        if not bajas:
+            return
+        actual = self._inventario.obtener()
+        if actual.por_id and bajas >= set(actual.por_id):
+            raise BloqueoSeguridad('La operación dejaría la hoja vacía.')
+
+    def enviar(self, mutaciones):
+        """
+        Aplica `mutaciones` en memoria y las encola para la hoja. Devuelve
+        el ticket. Lanza BloqueoSeguridad sin aplicar nada si el lote
+        borraría todas las filas.
+        """
+        mutaciones = list(mutaciones)
+        self._verificar_bajas(mutaciones)
+        with self._cond:
+            self._ticket += 1
+            ticket = self._ticket
+            # Dentro del lock: el orden en memoria es el mismo que en la cola
+            self._inventario.aplicar(mutaciones)
+            self._pendientes.append((ticket, mutaciones))
+            self._resultados[ticket] = (PENDIENTE, '')
+            self._cond.notify_all()
+        return ticket
+
+    def estado(self, ticket):
+        """(PENDIENTE | OK | ERROR, mensaje de error)."""
+        with self._cond:
+            return self._resultados.get(ticket, (OK, ''))
+
+    def esperar(self, timeout=None):
+        """Bloquea hasta que no quede nada por escribir. False si venció `timeout`."""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self._pendientes and not self._escribiendo, timeout
+            )
+
+    def _bucle(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pendientes)
+            time.sleep(self.espera)
+            with self._cond:
+                lote, self._pendientes = self._pendientes, []
+                self._escribiendo = True
+
+            tickets = [t for t, _ in lote]
+            try:
+                # Todo el lote en una escritura agrupada (altas, parches, bajas)
+                selladas = aplicar_mutaciones(self._hoja, [m for _, ms in lote for m in ms])
+                self._inventario.aplicar(marcas_de_revision(selladas))
+                resultado = (OK, '')
+            except Exception as e:
+                # La instantánea tiene cambios que no llegaron a la hoja: se descarta
+                self._inventario.invalidar()
+                resultado = (ERROR, str(e) or type(e).__name__)
+
+            with self._cond:
+                for t in tickets:
+                    self._resultados[t] = resultado
+                for t in list(self._resultados)[:-MAX_RESULTADOS]:
+                    del self._resultados[t]
+                self._escribiendo = False
+                self._cond.notify_all()
@@ -0,0 +1,222 @@
+"""
+Búsquedas web (DuckDuckGo) y descarga de imágenes candidatas.
+
+Un único `ClienteWeb` por proceso reutiliza la sesión HTTP (pool de
+conexiones keep-alive) y el cliente de DDGS. Las candidatas se descargan en
+paralelo con un tiempo total acotado: un servidor lento se descarta en vez
+de bloquear la barra lateral.
+
+Con una `CacheDisco`, las búsquedas y descargas repetidas (p.ej. al volver
+a editar la misma botella) se responden desde disco sin tocar la red.
+
+DDGS, PIL y requests se importan recién la primera vez que se crea el
+cliente, se busca o se valida una imagen: no pesan en el arranque de la app.
+"""
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
+
+from inventario import normalizar_texto
+
+# Segundos por conexión/lectura y para el lote completo de candidatas
+TIMEOUT = 5
+TIMEOUT_TOTAL = 8
+MAX_CANDIDATAS = 6
+# Bytes máximos por imagen (evita descargar archivos gigantes)
+TAMANO_MAXIMO = 8 * 1024 * 1024
+# Vigencia en caché: los resultados de búsqueda cambian, las imágenes no
+TTL_BUSQUEDAS = 7 * 24 * 3600
+TTL_DESCARGAS = 30 * 24 * 3600
+# Una búsqueda sin resultados (o un rate limit silencioso) se reintenta pronto
+TTL_VACIOS = 3600
+
+CABECERAS = {
+    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120 Safari/537.36',
+    'Accept': 'image/avif,image/webp,image/png,image/jpeg,image/*;q=0.8',
+}
+
+
+class ImagenInvalida(Exception):
+    """La URL no devolvió una imagen decodificable."""
+
+
+@dataclass
+class Candidata:
+    url: str
+    blob: bytes
+    mime: str
+
+
+def validar_imagen(blob, tipo_contenido=''):
+    """
+    Comprueba que `blob` sea una imagen que PIL puede abrir y devuelve su
+    MIME real. Se descarta lo que el servidor declara como no-imagen (p.ej.
+    páginas HTML de error con código 200).
+    """
+    tipo = (tipo_contenido or '').split(';')[0].strip().lower()
+    if tipo and not tipo.startswith('image/') and tipo != 'application/octet-stream':
+        raise ImagenInvalida(f"Tipo de contenido no válido: {tipo}")
+    from PIL import Image
+
+    try:
+        with Image.open(io.BytesIO(blob)) as img:
+            formato = img.format
+            img.verify()
+    except Exception as e:
+        raise ImagenInvalida(f"No se pudo decodificar: {e}") from e
+    return Image.MIME.get(formato, tipo or 'application/octet-stream')
+
+
+def clave_busqueda(metodo, query, max_results):
+    """Misma clave para consultas que solo difieren en mayúsculas/acentos/espacios."""
+    return f"{metodo}:{max_results}:{normalizar_texto(query)}"
+
+
+def clave_url(url):
+    """Sin espacios ni fragmento (#...), que no llega al servidor."""
+    return 'url:' + url.strip().split('#')[0]
+
+
+class ClienteWeb:
+    """
+    Sesión HTTP y cliente DDGS compartidos + pool de hilos para descargas.
+    Pensado para vivir en `st.cache_resource` (uno por proceso).
+    `cache` (opcional) es una `CacheDisco` para búsquedas y descargas.
+    """
+    def __init__(self, hilos=MAX_CANDIDATAS, timeout=TIMEOUT, cache=None):
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.timeout = timeout
+        self.cache = cache
+        self.sesion = requests.Session()
+        self.sesion.headers.update(CABECERAS)
+        adaptador = HTTPAdapter(pool_connections=hilos * 2, pool_maxsize=hilos * 2)
+        self.sesion.mount('http://', adaptador)
+        self.sesion.mount('https://', adaptador)
+        self._pool = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='descargas')
+        self._ddgs = None
+        # DDGS no es seguro entre hilos: las búsquedas se serializan
+        self._lock_ddgs = threading.Lock()
+
+    def _cacheado(self, clave, ttl, calcular):
+        if self.cache is None:
+            return calcular()
+        valor = self.cache.obtener(clave)
+        if valor is None:
+            valor = calcular()
+            self.cache.guardar(clave, valor, ttl if valor else min(ttl, TTL_VACIOS))
+        return valor
+
+    def _buscar(self, metodo, query, max_results):
+        return self._cacheado(
+            clave_busqueda(metodo, query, max_results), TTL_BUSQUEDAS,
+            lambda: self._consultar(metodo, query, max_results),
+        )
+
+    def _consultar(self, metodo, query, max_results):
+        with self._lock_ddgs:
+            if self._ddgs is None:
+                from duckduckgo_search import DDGS
+                self._ddgs = DDGS(timeout=self.timeout)
+            try:
+                return list(getattr(self._ddgs, metodo)(query, max_results=max_results))
+            except Exception:
+                # Cliente en mal estado (rate limit, conexión cerrada): se recrea
+                self._ddgs = None
+                raise
+
+    def buscar_imagenes(self, query, max_results=MAX_CANDIDATAS):
+        """URLs de imágenes (sin duplicados, en el orden de DDG)."""
+        resultados = self._buscar('images', query, max_results)
+        return list(dict.fromkeys(r['image'] for r in resultados if r.get('image')))
+
+    def buscar_texto(self, query, max_results=1):
+        return [r['body'] for r in self._buscar('text', query, max_results) if r.get('body')]
+
+    def descargar(self, url):
+        """Devuelve (bytes, content-type) de `url`, desde la caché si está."""
+        return self._cacheado(clave_url(url), TTL_DESCARGAS, lambda: self._descargar_red(url))
+
+    def _descargar_red(self, url):
+        """Descarga `url` en streaming."""
+        with self.sesion.get(url, timeout=self.timeout, stream=True) as r:
+            r.raise_for_status()
+            if int(r.headers.get('Content-Length') or 0) > TAMANO_MAXIMO:
+                raise ImagenInvalida("Imagen demasiado grande")
+            partes, total = [], 0
+            for parte in r.iter_content(64 * 1024):
+                total += len(parte)
+                if total > TAMANO_MAXIMO:
+                    raise ImagenInvalida("Imagen demasiado grande")
+                partes.append(parte)
+            return b''.join(partes), r.headers.get('Content-Type', '')
+
+    def descargar_validada(self, url):
+        blob, tipo = self.descargar(url)
+        return Candidata(url, blob, validar_imagen(blob, tipo))
+
+    def candidatas(self, urls, timeout_total=TIMEOUT_TOTAL):
+        """
+        Descarga y valida `urls` en paralelo. Devuelve solo las que
+        terminaron bien dentro de `timeout_total`, en el orden original.
+        """
+        futuros = [self._pool.submit(self.descargar_validada, u) for u in urls]
+        wait(futuros, timeout=timeout_total)
+        validas = []
+        for f in futuros:
+            if not f.done():
+                # Sigue en segundo plano hasta su propio timeout; se ignora
+                f.cancel()
+                continue
+            if f.exception() is None:
+                validas.append(f.result())
+        return validas
+
+    def descargar_varias(self, urls_por_clave):
+        """
+        Descarga y valida en paralelo {clave: url}. Devuelve
+        {clave: (Candidata o None, error)}; cada descarga tiene su propio
+        timeout, así que un servidor caído no frena al resto.
+        """
+        futuros = {
+            clave: self._pool.submit(self.descargar_validada, url)
+            for clave, url in urls_por_clave.items()
+        }
+        resultados = {}
+        for clave, f in futuros.items():
+            try:
+                resultados[clave] = (f.result(), '')
+            except Exception as e:
+                resultados[clave] = (None, f"{type(e).__name__}: {e}")
+        return resultados
+
+    def buscar_candidatas(self, query, n=MAX_CANDIDATAS, timeout_total=TIMEOUT_TOTAL):
+        """Búsqueda de imágenes + descarga concurrente de las candidatas."""
+        return self.candidatas(self.buscar_imagenes(query, n), timeout_total)
+
+
+# --- CLIENTE LOCAL (PRUEBAS) ---
+class ClienteLocal(ClienteWeb):
+    """
+    Sustituto sin red de `ClienteWeb`: responde con los resultados y
+    archivos cargados en `busquedas` ({query: [resultado, ...]}) y
+    `archivos` ({url: (bytes, content-type)}). Registra cada acceso a la
+    "red" en `llamadas` para verificar qué resolvió la caché.
+    """
+    def __init__(self, busquedas=None, archivos=None, cache=None):
+        super().__init__(hilos=2, cache=cache)
+        self.busquedas = dict(busquedas or {})
+        self.archivos = dict(archivos or {})
+        self.llamadas = []
+
+    def _consultar(self, metodo, query, max_results):
+        self.llamadas.append((metodo, query))
+        return list(self.busquedas.get(query, []))[:max_results]
+
+    def _descargar_red(self, url):
+        self.llamadas.append(('descargar', url))
+        if url not in self.archivos:
+            import requests
+            raise requests.HTTPError(f"404: {url}")
+        return self.archivos[url]
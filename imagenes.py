@@ -0,0 +1,362 @@
+"""
+Almacén local de imágenes direccionado por contenido.
+
+Cada foto se guarda una sola vez bajo el hash de sus bytes de origen, en
+varios tamaños. La hoja guarda solo el hash y las imágenes se leen de disco
+recién cuando hay que mostrarlas.
+
+Como los nombres de archivo dependen del contenido, las URLs de las
+miniaturas son estables y el navegador puede cachearlas para siempre.
+
+`procesar_lote` guarda o regenera muchas imágenes en un pool de procesos
+(importaciones con URLs de fotos, recomprimir todo el almacén). El pool
+(`PoolImagenes`) se levanta una vez por proceso y se reutiliza.
+"""
+import base64
+import functools
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+
+# Dentro de static/ para que Streamlit lo sirva en app/static/imagenes
+RAIZ_POR_DEFECTO = os.environ.get(
+    'VINOTECA_IMAGENES', str(Path(__file__).parent / 'static' / 'imagenes')
+)
+URL_POR_DEFECTO = os.environ.get('VINOTECA_URL_IMAGENES', 'app/static/imagenes')
+# El servidor de miniaturas escucha solo en el equipo (detrás de un proxy)
+HOST_POR_DEFECTO = os.environ.get('VINOTECA_HOST_IMAGENES', '127.0.0.1')
+# static/ no sobrevive a un redeploy: solo con la raíz en un volumen
+# persistente se puede dejar el almacén como única copia de las fotos
+PERSISTENTE = os.environ.get('VINOTECA_IMAGENES_PERSISTENTES', '') not in ('', '0')
+# Sheets admite 50.000 caracteres por celda
+LIMITE_CELDA = 45000
+CACHE_INMUTABLE = 'public, max-age=31536000, immutable'
+
+# Lado máximo (px) y calidad JPEG de cada tamaño
+TAMANOS = {
+    'original': (1200, 85),
+    'medio': (400, 80),
+    'mini': (150, 70),
+}
+MIME = 'image/jpeg'
+LADO_MAXIMO = max(lado for lado, _ in TAMANOS.values())
+
+# Con el pool ya levantado, lotes más chicos se procesan en el mismo proceso
+MINIMO_POOL = 4
+# Levantar el pool (spawn: un intérprete nuevo por worker) cuesta segundos:
+# sin uno en marcha solo se justifica para lotes grandes
+MINIMO_POOL_NUEVO = 64
+
+
+def redimensionar_jpeg(img, lado, calidad):
+    """Thumbnail (mantiene aspect ratio) y re-codificación a JPEG."""
+    img = img.copy()
+    img.thumbnail((lado, lado))
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=calidad, optimize=True)
+    return buffer.getvalue()
+
+
+def abrir_rgb(blob, lado=LADO_MAXIMO):
+    """
+    Abre `blob` en RGB. Los JPEG se decodifican en modo draft, ya reducidos
+    (1/2, 1/4 u 1/8) al menor tamaño que sigue cubriendo `lado`: una foto de
+    4000px nunca se decodifica entera.
+    """
+    # PIL se carga recién con la primera imagen (no en el arranque de la app)
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(blob))
+    if lado and img.format == 'JPEG':
+        img.draft('RGB', (lado, lado))
+    # Convertir a RGB (necesario si viene de PNG con transparencia)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    return img
+
+
+def hash_de(blob):
+    return hashlib.sha256(blob).hexdigest()
+
+
+def url_estatica(raiz, estatico=Path(__file__).parent / 'static'):
+    """URL base de `raiz` en el static serving de Streamlit (None si está fuera de static/)."""
+    raiz, estatico = Path(raiz).resolve(), Path(estatico).resolve()
+    if not raiz.is_relative_to(estatico):
+        return None
+    return '/'.join(('app/static',) + raiz.relative_to(estatico).parts)
+
+
+class AlmacenImagenes:
+    """
+    Estructura en disco: <raiz>/<2 primeros chars>/<hash>_<tamaño>.jpg
+    Los archivos nunca cambian una vez escritos.
+    """
+    def __init__(self, raiz=RAIZ_POR_DEFECTO, url_base=URL_POR_DEFECTO):
+        self.raiz = Path(raiz)
+        self.url_base = url_base.rstrip('/')
+        # Memo por hash: el mismo archivo nunca se codifica dos veces
+        self.data_uri = functools.lru_cache(maxsize=4096)(self._data_uri)
+
+    def ruta(self, h, tamano='mini'):
+        return self.raiz / h[:2] / f"{h}_{tamano}.jpg"
+
+    def url(self, h, tamano='mini'):
+        """URL estable (depende solo del hash) para mostrar en el navegador."""
+        if not isinstance(h, str) or not h:
+            return None
+        return f"{self.url_base}/{h[:2]}/{h}_{tamano}.jpg"
+
+    def _data_uri(self, h, tamano='mini'):
+        blob = self.leer(h, tamano)
+        if not blob:
+            return None
+        return f"data:{MIME};base64,{base64.b64encode(blob).decode('utf-8')}"
+
+    def existe(self, h, tamano='mini'):
+        return isinstance(h, str) and bool(h) and self.ruta(h, tamano).exists()
+
+    def guardar(self, blob):
+        """
+        Guarda `blob` en todos los tamaños y devuelve su hash. Si ya estaba
+        guardado no se vuelve a decodificar.
+        """
+        h = hash_de(blob)
+        if all(self.existe(h, t) for t in TAMANOS):
+            return h
+
+        self._escribir_tamanos(h, abrir_rgb(blob), TAMANOS)
+        return h
+
+    def restaurar(self, h, blob):
+        """
+        Vuelve a escribir los tamaños que falten de `h` a partir de una copia
+        (la miniatura guardada en la hoja), p.ej. tras un redeploy.
+        """
+        if not all(self.existe(h, t) for t in TAMANOS):
+            self._escribir_tamanos(h, abrir_rgb(blob), TAMANOS)
+        return h
+
+    def copia_hex(self, h):
+        """Miniatura de `h` en Hex para la hoja (None si no está o no entra en una celda)."""
+        blob = self.leer(h, 'mini')
+        if blob is None or len(blob) * 2 > LIMITE_CELDA:
+            return None
+        return blob.hex()
+
+    def regenerar(self, h, tamanos=('medio', 'mini')):
+        """
+        Vuelve a generar `tamanos` a partir del original guardado (p.ej. tras
+        cambiar TAMANOS). El hash no cambia y el original no se re-codifica.
+        """
+        blob = self.leer(h, 'original')
+        if blob is None:
+            raise FileNotFoundError(f"No existe el original de {h}")
+        lado = max(TAMANOS[t][0] for t in tamanos)
+        self._escribir_tamanos(h, abrir_rgb(blob, lado), tamanos)
+        return h
+
+    def _escribir_tamanos(self, h, img, tamanos):
+        # De mayor a menor: cada tamaño parte del anterior
+        for tamano, (lado, calidad) in TAMANOS.items():
+            if tamano not in tamanos:
+                continue
+            img.thumbnail((lado, lado))
+            self._escribir(self.ruta(h, tamano), redimensionar_jpeg(img, lado, calidad))
+
+    def leer(self, h, tamano='mini'):
+        if not h:
+            return None
+        try:
+            return self.ruta(h, tamano).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def _escribir(self, ruta, datos):
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        # Escritura atómica: otra sesión nunca ve un archivo a medias
+        tmp = ruta.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(datos)
+        os.replace(tmp, ruta)
+
+
+# --- PROCESAMIENTO POR LOTES ---
+@dataclass
+class ResultadoImagen:
+    """Resultado de una imagen del lote. `error` vacío si salió bien."""
+    clave: object
+    hash: str = None
+    segundos: float = 0.0
+    error: str = ''
+
+
+def _guardar_en(raiz, clave, blob):
+    inicio = time.perf_counter()
+    try:
+        h = AlmacenImagenes(raiz).guardar(blob)
+        return ResultadoImagen(clave, h, time.perf_counter() - inicio)
+    except Exception as e:
+        return ResultadoImagen(clave, None, time.perf_counter() - inicio, f"{type(e).__name__}: {e}")
+
+
+def _regenerar_en(raiz, clave, h):
+    inicio = time.perf_counter()
+    try:
+        AlmacenImagenes(raiz).regenerar(h)
+        return ResultadoImagen(clave, h, time.perf_counter() - inicio)
+    except Exception as e:
+        return ResultadoImagen(clave, h, time.perf_counter() - inicio, f"{type(e).__name__}: {e}")
+
+
+class PoolImagenes:
+    """
+    Pool de procesos para `procesar_lote` que se reutiliza entre lotes
+    (uno por proceso, vía st.cache_resource): levantar los workers se paga
+    una sola vez. Si un worker muere, el pool se descarta y el próximo
+    lote levanta otro.
+    """
+    def __init__(self, procesos=None):
+        self.procesos = procesos
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def activo(self):
+        return self._pool is not None
+
+    def ejecutor(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn: el proceso de Streamlit tiene hilos y fork no es seguro con ellos
+                contexto = multiprocessing.get_context('spawn')
+                self._pool = ProcessPoolExecutor(self.procesos, mp_context=contexto)
+            return self._pool
+
+    def cerrar(self, esperar=False):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=esperar, cancel_futures=True)
+
+
+def procesar_lote(almacen, tareas, regenerar=False, procesos=None, progreso=None, pool=None):
+    """
+    Procesa `tareas` [(clave, blob)] guardando cada blob en el almacén, o
+    [(clave, hash)] regenerando sus tamaños si `regenerar`. Devuelve un
+    `ResultadoImagen` por tarea, en el mismo orden; una imagen que falla
+    queda con `error` y no frena al resto.
+    `progreso(hechas, total)` se llama a medida que van terminando.
+
+    `pool` (PoolImagenes) es el pool compartido del proceso; sin él, los
+    lotes grandes levantan uno propio de `procesos` workers.
+    """
+    tareas = list(tareas)
+    funcion = _regenerar_en if regenerar else _guardar_en
+    raiz = str(almacen.raiz)
+    resultados = {}
+
+    minimo = MINIMO_POOL if pool is not None and pool.activo else MINIMO_POOL_NUEVO
+    if len(tareas) < minimo:
+        for n, (clave, dato) in enumerate(tareas):
+            resultados[n] = funcion(raiz, clave, dato)
+            if progreso:
+                progreso(n + 1, len(tareas))
+        return [resultados[n] for n in range(len(tareas))]
+
+    propio = pool is None
+    if propio:
+        pool = PoolImagenes(procesos)
+    roto = False
+    try:
+        ejecutor = pool.ejecutor()
+        try:
+            futuros = {ejecutor.submit(funcion, raiz, clave, dato): n for n, (clave, dato) in enumerate(tareas)}
+        except BrokenProcessPool:
+            roto = True
+            raise
+        for hechas, f in enumerate(as_completed(futuros), start=1):
+            n = futuros[f]
+            try:
+                resultados[n] = f.result()
+            except Exception as e:  # p.ej. un worker que murió
+                roto = roto or isinstance(e, BrokenProcessPool)
+                resultados[n] = ResultadoImagen(tareas[n][0], error=f"{type(e).__name__}: {e}")
+            if progreso:
+                progreso(hechas, len(tareas))
+    finally:
+        if propio or roto:
+            pool.cerrar(esperar=propio)
+    return [resultados[n] for n in range(len(tareas))]
+
+
+def resumen_lote(resultados):
+    """Totales y tiempos de un lote (para mostrar o registrar)."""
+    tiempos = sorted(r.segundos for r in resultados)
+    fallidas = [r for r in resultados if r.error]
+    return {
+        'total': len(resultados),
+        'ok': len(resultados) - len(fallidas),
+        'fallidas': len(fallidas),
+        'segundos_total': sum(tiempos),
+        'segundos_p50': tiempos[len(tiempos) // 2] if tiempos else 0.0,
+        'segundos_max': tiempos[-1] if tiempos else 0.0,
+    }
+
+
+# --- SERVIDOR DE MINIATURAS ---
+class _ManejadorMiniaturas(BaseHTTPRequestHandler):
+    almacen = None
+
+    def do_GET(self):
+        # /<2 chars>/<hash>_<tamaño>.jpg
+        partes = self.path.split('?')[0].strip('/').split('/')
+        nombre = partes[-1] if len(partes) == 2 else ''
+        h, _, tamano = nombre.removesuffix('.jpg').rpartition('_')
+        if tamano not in TAMANOS or not h.isalnum() or partes[0] != h[:2]:
+            self.send_error(404)
+            return
+
+        etag = f'"{h}_{tamano}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', CACHE_INMUTABLE)
+            self.end_headers()
+            return
+
+        blob = self.almacen.leer(h, tamano)
+        if blob is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', MIME)
+        self.send_header('Content-Length', str(len(blob)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', CACHE_INMUTABLE)
+        self.end_headers()
+        self.wfile.write(blob)
+
+    def log_message(self, *args):
+        pass
+
+
+def iniciar_servidor_miniaturas(almacen, puerto, host=HOST_POR_DEFECTO):
+    """
+    Sirve el almacén por HTTP con `Cache-Control: immutable` en un hilo
+    aparte, para publicarlo con otro origen (un proxy o CDN). Por defecto
+    escucha solo en localhost; la URL pública es `almacen.url_base`.
+    """
+    manejador = type('ManejadorMiniaturas', (_ManejadorMiniaturas,), {'almacen': almacen})
+    servidor = ThreadingHTTPServer((host, puerto), manejador)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
@@ -0,0 +1,244 @@
+"""
+Importación columnar de planillas Excel/CSV.
+
+Los alias de columnas se resuelven una sola vez por archivo y la limpieza,
+la detección de cortes ('/') y la asignación de ids se hacen sobre columnas
+completas. Los CSV se leen por lotes para no cargar archivos enormes enteros.
+
+Las filas que ya existen en el inventario (misma huella nombre/bodega/añada)
+se omiten o se usan para completar los datos de la botella existente.
+
+Si la planilla trae una columna con URLs de fotos, las imágenes se
+descargan y procesan en lote al final (`procesar_imagenes`).
+"""
+import numpy as np
+import pandas as pd
+
+from almacen import AGREGAR, PARCHEAR, Mutacion
+from imagenes import MIME
+from inventario import huellas_de
+
+TAM_LOTE = 5000
+
+# Campo destino -> nombres posibles en la planilla (en orden de prioridad)
+ALIAS = {
+    'nombre': ['nombre', 'name'],
+    'bodega': ['bodega', 'winery'],
+    'enologo': ['enologo'],
+    'anada': ['anada', 'vintage', 'year'],
+    'variedad': ['variedad', 'uva', 'tipo', 'grape'],
+    'gama': ['gama', 'calidad'],
+    'procedencia': ['procedencia', 'region'],
+    'detalle': ['detalle', 'notas', 'notes', 'description'],
+    'anio_limite': ['anio_limite', 'consumo'],
+    'puntuacion': ['puntuacion', 'puntos'],
+    'imagen_url': ['imagen_url', 'image_url', 'imagen', 'foto', 'image'],
+}
+
+POR_DEFECTO = {
+    'nombre': 'Sin Nombre',
+    'bodega': 'Desconocida',
+    'enologo': '',
+    'anada': 2023,
+    'variedad': 'Otro',
+    'gama': '',
+    'procedencia': '',
+    'detalle': '',
+    'anio_limite': 2030,
+    'puntuacion': 5,
+    'imagen_url': '',
+}
+
+CAMPOS_INT = ['anada', 'anio_limite', 'puntuacion']
+
+# Qué hacer con filas que ya están en el inventario
+OMITIR = 'omitir'
+FUSIONAR = 'fusionar'
+DUPLICAR = 'duplicar'
+
+# Campos que una fila duplicada puede completar si en la botella están vacíos
+CAMPOS_FUSION = ['enologo', 'gama', 'procedencia', 'detalle', 'composicion_blend']
+
+
+def normalize_column_name(col_name):
+    return str(col_name).strip().lower()
+
+
+# --- LECTURA POR LOTES ---
+def leer_en_lotes(archivo, nombre_archivo, tam_lote=TAM_LOTE):
+    """
+    Genera DataFrames de hasta `tam_lote` filas con columnas normalizadas.
+    CSV con `chunksize`; Excel en modo read_only de openpyxl (fila a fila).
+    """
+    if nombre_archivo.endswith('.csv'):
+        # Todo como texto: la conversión se hace después, columna a columna
+        for lote in pd.read_csv(archivo, chunksize=tam_lote, dtype=str):
+            lote.columns = [normalize_column_name(c) for c in lote.columns]
+            yield lote
+        return
+
+    from openpyxl import load_workbook
+    wb = load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        filas = wb.active.iter_rows(values_only=True)
+        encabezado = [normalize_column_name(c) for c in next(filas, [])]
+        buffer = []
+        for fila in filas:
+            buffer.append(fila)
+            if len(buffer) >= tam_lote:
+                yield pd.DataFrame(buffer, columns=encabezado)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=encabezado)
+    finally:
+        wb.close()
+
+
+# --- NORMALIZACIÓN COLUMNAR ---
+def resolver_columnas(columnas):
+    """Campo destino -> columnas presentes en la planilla, en orden de alias."""
+    presentes = set(columnas)
+    return {campo: [a for a in alias if a in presentes] for campo, alias in ALIAS.items()}
+
+
+def _coalescer(df, columnas):
+    """Primer valor no nulo entre `columnas`, fila a fila."""
+    if not columnas:
+        return pd.Series(np.nan, index=df.index, dtype=object)
+    resultado = df[columnas[0]].astype(object)
+    for c in columnas[1:]:
+        resultado = resultado.where(resultado.notna(), df[c])
+    return resultado
+
+
+def _texto(serie):
+    """str(valor).strip() para los no nulos; los nulos quedan como NaN."""
+    validos = serie.dropna()
+    if validos.empty:
+        return pd.Series(np.nan, index=serie.index, dtype=object)
+    return validos.map(str).str.strip().reindex(serie.index)
+
+
+def normalizar_lote(df, resueltas):
+    """
+    Devuelve un frame con el esquema del inventario (sin `id`) a partir de
+    un lote crudo de la planilla.
+    """
+    campos = {}
+    for campo in ALIAS:
+        texto = _texto(_coalescer(df, resueltas[campo]))
+        if campo in CAMPOS_INT:
+            numeros = pd.to_numeric(texto, errors='coerce')
+            campos[campo] = np.trunc(numeros).fillna(POR_DEFECTO[campo]).astype(int)
+        else:
+            campos[campo] = texto.fillna(POR_DEFECTO[campo]).astype(object)
+
+    variedad = campos.pop('variedad')
+    es_blend = variedad.str.contains('/', regex=False)
+
+    salida = pd.DataFrame({
+        'nombre': campos['nombre'],
+        'bodega': campos['bodega'],
+        'enologo': campos['enologo'],
+        'anada': campos['anada'],
+        'uva_principal': variedad.where(~es_blend, 'Blend'),
+        'composicion_blend': variedad.where(es_blend, ''),
+        'gama': campos['gama'],
+        'procedencia': campos['procedencia'],
+        'detalle': campos['detalle'],
+        'nota_cata': '',
+        'ubicacion': 'Por Clasificar',
+        'anio_limite': campos['anio_limite'],
+        'puntuacion': campos['puntuacion'],
+        'imagen_hash': None,
+        'tipo_imagen': None,
+        # No se guarda en la hoja: `importar` la reemplaza por `imagen_hash`
+        'imagen_url': campos['imagen_url'],
+    }, index=df.index)
+    # Filas completamente vacías en la planilla (típico en Excel)
+    return salida[df.notna().any(axis=1)]
+
+
+def _fusionar(existente, nueva, parche):
+    """Completa en `parche` los campos vacíos de `existente` con los de `nueva`."""
+    for campo in CAMPOS_FUSION:
+        valor = nueva.get(campo)
+        actual = parche.get(campo, existente.get(campo))
+        if valor and (actual is None or not str(actual).strip() or pd.isna(actual)):
+            parche[campo] = valor
+
+
+def _asignar_imagenes(altas, procesar_imagenes, resumen):
+    """Quita `imagen_url` de las altas y asigna el hash de las que se procesaron."""
+    urls = {}
+    for m in altas:
+        url = m.cambios.pop('imagen_url', '')
+        if isinstance(url, str) and url.startswith(('http://', 'https://')):
+            urls[m.id] = url
+    if not urls or procesar_imagenes is None:
+        return
+    hashes = procesar_imagenes(urls)
+    for m in altas:
+        if hashes.get(m.id):
+            m.cambios['imagen_hash'] = hashes[m.id]
+            m.cambios['tipo_imagen'] = MIME
+    resumen['imagenes'] = sum(1 for h in hashes.values() if h)
+    resumen['imagenes_fallidas'] = len(urls) - resumen['imagenes']
+
+
+def importar(archivo, nombre_archivo, secuencia, tam_lote=TAM_LOTE, progreso=None,
+             indice_huellas=None, modo_duplicados=OMITIR, fila_existente=None,
+             procesar_imagenes=None, vocabulario=None):
+    """
+    Lee, normaliza y asigna ids a toda la planilla. Devuelve
+    (mutaciones, resumen) para confirmarlas en una única escritura.
+    `progreso(filas_procesadas)` se llama después de cada lote.
+
+    Con `indice_huellas`, las filas que ya están en el inventario se omiten
+    (OMITIR) o completan la botella existente (FUSIONAR; requiere
+    `fila_existente(id) -> dict`). Con DUPLICAR se agregan igual.
+
+    `procesar_imagenes({id: url}) -> {id: hash}` recibe las URLs de fotos de
+    las filas nuevas; las que no traen hash quedan sin imagen.
+
+    Con `vocabulario` (IndiceVocabulario), bodega, uva, enólogo, etc. se
+    llevan a la forma que ya usa el inventario antes de buscar duplicados.
+    """
+    altas = []
+    parches = {}
+    resumen = {'nuevos': 0, 'omitidos': 0, 'fusionados': 0, 'imagenes': 0, 'imagenes_fallidas': 0}
+    resueltas = None
+    total = 0
+    for lote in leer_en_lotes(archivo, nombre_archivo, tam_lote):
+        if resueltas is None:
+            resueltas = resolver_columnas(lote.columns)
+        nuevos = normalizar_lote(lote, resueltas)
+        if vocabulario is not None:
+            nuevos = vocabulario.normalizar_frame(nuevos)
+
+        if indice_huellas is not None and modo_duplicados != DUPLICAR and not nuevos.empty:
+            existentes = huellas_de(nuevos).map(indice_huellas.buscar_huella)
+            duplicado = existentes.map(bool)
+            if modo_duplicados == FUSIONAR and fila_existente is not None:
+                filas_dup = nuevos[duplicado].drop(columns=['imagen_url']).to_dict('records')
+                for ids_previos, fila in zip(existentes[duplicado], filas_dup):
+                    id_previo = min(ids_previos)
+                    _fusionar(fila_existente(id_previo) or {}, fila, parches.setdefault(id_previo, {}))
+                resumen['fusionados'] += int(duplicado.sum())
+            else:
+                resumen['omitidos'] += int(duplicado.sum())
+            nuevos = nuevos[~duplicado]
+
+        ids = secuencia.reservar(len(nuevos))
+        altas.extend(
+            Mutacion(AGREGAR, i, fila)
+            for i, fila in zip(ids, nuevos.to_dict('records'))
+        )
+        resumen['nuevos'] += len(nuevos)
+        total += len(lote)
+        if progreso:
+            progreso(total)
+
+    _asignar_imagenes(altas, procesar_imagenes, resumen)
+    mutaciones = altas + [Mutacion(PARCHEAR, i, c) for i, c in parches.items() if c]
+    return mutaciones, resumen
@@ -0,0 +1,356 @@
+"""
+Instantánea versionada del inventario, compartida entre sesiones.
+
+La réplica local se lee y se parsea una sola vez; las lecturas de cada
+rerun usan la instantánea y las escrituras la actualizan en memoria
+subiendo la versión, sin necesidad de volver a leer todo.
+
+Los cambios hechos por otros clientes llegan por el hook `sincronizar`
+del `Inventario`: el `SincronizadorReplica` (replica.py) los trae de la
+hoja a la réplica y el sondeo aplica solo esas filas.
+"""
+import re
+import threading
+import time
+import unicodedata
+from abc import ABC, abstractmethod
+
+import numpy as np
+import pandas as pd
+
+from almacen import AGREGAR, PARCHEAR, BORRAR, aplicar_en_frame, Mutacion
+from imagenes import MIME, hash_de
+from metricas import medido
+
+# --- ESQUEMA ---
+# Enteros chicos: una añada o un puntaje no necesitan 8 bytes por fila
+ENTEROS = {
+    'id': 'int64',
+    'revision': 'int64',
+    'anada': 'int16',
+    'anio_limite': 'int16',
+    'puntuacion': 'int8',
+}
+# Pocos valores repetidos en miles de filas: un código por fila + la lista de valores
+CATEGORIAS = ['ubicacion', 'uva_principal', 'bodega', 'procedencia', 'gama', 'enologo', 'tipo_imagen']
+COLS_NUM = list(ENTEROS)
+
+# Con más filas afectadas que esto, reconstruir los índices es más barato
+UMBRAL_RECONSTRUIR = 500
+
+
+# --- PARSEO ---
+def _texto_o_none(x):
+    return x.strip() if isinstance(x, str) and x.strip() else None
+
+
+def tipar(df):
+    """
+    Lleva las columnas presentes a los tipos de ENTEROS / CATEGORIAS. Las
+    que ya tienen su tipo no se tocan (tras una mutación solo se convierte
+    lo que el concat o un parche dejaron como object / int64).
+    """
+    for c, tipo in ENTEROS.items():
+        if c in df.columns and df[c].dtype != tipo:
+            df[c] = pd.to_numeric(df[c], errors='coerce').fillna(0).astype(tipo)
+    for c in CATEGORIAS:
+        if c in df.columns and not isinstance(df[c].dtype, pd.CategoricalDtype):
+            df[c] = df[c].astype('category')
+    return df
+
+
+@medido('inventario.parsear')
+def parsear_inventario(df):
+    """
+    Aplica el esquema (enteros chicos y categorías). Las imágenes ya no
+    viajan en la hoja: solo su hash (`imagen_hash`) en el almacén de imágenes.
+    """
+    tipar(df)
+
+    if 'imagen_hash' not in df.columns:
+        df['imagen_hash'] = None
+    df['imagen_hash'] = pd.Series(
+        [_texto_o_none(x) for x in df['imagen_hash']], index=df.index, dtype=object
+    )
+
+    return df.drop(columns=['imagen_data'], errors='ignore')
+
+
+def migrar_imagenes_legado(df, imagenes, vaciar=False):
+    """
+    Pasa las fotos guardadas como Hex en `imagen_data` al almacén de
+    imágenes. Completa `imagen_hash` en `df` y devuelve los parches para
+    la hoja.
+
+    Mientras el almacén esté en disco efímero, `imagen_data` es la única
+    copia durable: la hoja conserva el Hex junto al hash y, si tras un
+    redeploy faltan los archivos, se vuelven a generar desde ahí con el
+    mismo hash. Puede ser una foto legado (su hash es el del Hex) o la
+    miniatura que la app guarda junto a cada foto nueva (hash de la foto
+    original). Solo con `vaciar=True` (almacén persistente) se borra el Hex.
+    """
+    if 'imagen_data' not in df.columns:
+        return []
+    if 'imagen_hash' not in df.columns:
+        df['imagen_hash'] = None
+
+    mutaciones = []
+    legado = df['imagen_data'].map(lambda x: isinstance(x, str) and bool(x.strip()))
+    for i in df.index[legado]:
+        try:
+            blob = bytes.fromhex(df.at[i, 'imagen_data'])
+        except ValueError:
+            continue
+        h = hash_de(blob)
+        actual = _texto_o_none(df.at[i, 'imagen_hash'])
+        try:
+            # Si los archivos ya están no se decodifica nada
+            if actual in (None, h):
+                imagenes.guardar(blob)
+            else:
+                imagenes.restaurar(actual, blob)
+        except Exception:
+            continue
+        cambios = {}
+        if actual is None:
+            df.at[i, 'imagen_hash'] = h
+            cambios = {'imagen_hash': h, 'tipo_imagen': MIME}
+        if vaciar:
+            cambios['imagen_data'] = ''
+        if cambios:
+            mutaciones.append(Mutacion(PARCHEAR, int(float(df.at[i, 'id'])), cambios))
+    return mutaciones
+
+
+def _parsear_cambios(cambios):
+    """Mismo parseo que `parsear_inventario`, pero para una fila suelta."""
+    cambios = dict(cambios)
+    for c in COLS_NUM:
+        if c in cambios:
+            try:
+                cambios[c] = int(float(cambios[c]))
+            except (TypeError, ValueError):
+                cambios[c] = 0
+    if 'imagen_hash' in cambios:
+        cambios['imagen_hash'] = _texto_o_none(cambios['imagen_hash'])
+    cambios.pop('imagen_data', None)
+    return cambios
+
+
+# --- NORMALIZACIÓN DE TEXTO ---
+def normalizar_texto(texto):
+    """Minúsculas, sin acentos y con espacios colapsados."""
+    if not isinstance(texto, str):
+        texto = '' if texto is None or pd.isna(texto) else str(texto)
+    texto = unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'\s+', ' ', texto.lower()).strip()
+
+
+def normalizar_serie(serie):
+    """Versión vectorizada de `normalizar_texto`."""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        # Se normalizan solo los valores distintos y se expanden por código
+        valores = normalizar_serie(pd.Series(serie.cat.categories, dtype=object)).to_numpy()
+        codigos = serie.cat.codes.to_numpy()
+        return pd.Series(
+            np.where(codigos >= 0, valores[codigos] if len(valores) else '', ''),
+            index=serie.index, dtype=object
+        )
+    return (
+        serie.astype(object).fillna('').astype(str)
+        .str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('ascii')
+        .str.lower().str.replace(r'\s+', ' ', regex=True).str.strip()
+    )
+
+
+def huella(nombre, bodega, anada):
+    """Clave de duplicado: nombre + bodega + añada, sin acentos ni mayúsculas."""
+    try:
+        anada = int(float(anada))
+    except (TypeError, ValueError):
+        anada = 0
+    return f"{normalizar_texto(nombre)}|{normalizar_texto(bodega)}|{anada}"
+
+
+def huellas_de(df):
+    """`huella` para todas las filas de `df` de una vez."""
+    anada = pd.to_numeric(df['anada'], errors='coerce').fillna(0).astype(int).astype(str)
+    return normalizar_serie(df['nombre']) + '|' + normalizar_serie(df['bodega']) + '|' + anada
+
+
+# --- ÍNDICES INCREMENTALES ---
+class IndiceIncremental(ABC):
+    """
+    Estructura derivada del inventario que se mantiene al día fila a fila.
+    """
+    @abstractmethod
+    def construir(self, df):
+        """Arma el índice desde un frame completo y devuelve `self`."""
+
+    @abstractmethod
+    def actualizar(self, id_vino, antes, despues):
+        """Fila antes y después de una mutación (None si no existía / fue borrada)."""
+
+
+class IndiceHuellas(IndiceIncremental):
+    """huella -> ids con ese nombre/bodega/añada. Búsqueda O(1)."""
+    def __init__(self):
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def construir(self, df):
+        ids = {}
+        if not df.empty and {'id', 'nombre', 'bodega', 'anada'} <= set(df.columns):
+            for h, i in zip(huellas_de(df).tolist(), df['id'].tolist()):
+                ids.setdefault(h, set()).add(int(i))
+        self._ids = ids
+        return self
+
+    def actualizar(self, id_vino, antes, despues):
+        with self._lock:
+            if antes is not None:
+                h = huella(antes.get('nombre'), antes.get('bodega'), antes.get('anada'))
+                self._ids.get(h, set()).discard(id_vino)
+                if not self._ids.get(h, True):
+                    del self._ids[h]
+            if despues is not None:
+                h = huella(despues.get('nombre'), despues.get('bodega'), despues.get('anada'))
+                self._ids.setdefault(h, set()).add(id_vino)
+
+    def buscar(self, nombre, bodega, anada):
+        return set(self._ids.get(huella(nombre, bodega, anada), ()))
+
+    def buscar_huella(self, h):
+        return set(self._ids.get(h, ()))
+
+
+# --- INSTANTÁNEA ---
+class Instantanea:
+    """Frame parseado + índice id -> posición. No se modifica nunca."""
+    def __init__(self, df, version):
+        self.df = df
+        self.version = version
+        self._derivados = {}
+        self._lock = threading.Lock()
+        self.por_id = {}
+        if 'id' in df.columns:
+            self.por_id = {int(i): n for n, i in enumerate(df['id'].tolist())}
+
+    @property
+    def vacia(self):
+        return self.df.empty
+
+    def derivado(self, clave, fabrica):
+        """
+        Estructura calculada a partir de esta versión del frame. Se calcula
+        una sola vez y la comparten todas las sesiones hasta la próxima versión.
+        """
+        with self._lock:
+            if clave not in self._derivados:
+                self._derivados[clave] = fabrica(self.df)
+            return self._derivados[clave]
+
+    def fila(self, id_vino):
+        pos = self.por_id.get(int(id_vino))
+        if pos is None:
+            return None
+        return self.df.iloc[pos].to_dict()
+
+
+class Inventario:
+    """
+    Contenedor de la instantánea vigente. `cargador` devuelve el frame crudo
+    (de la réplica o de una hoja); se vuelve a llamar solo si la instantánea fue invalidada o
+    superó `ttl` segundos.
+
+    Con `sincronizar(df) -> mutaciones | None`, cada `intervalo_sondeo`
+    segundos se buscan cambios hechos fuera de la app y se aplican como
+    delta (None pide una lectura completa).
+    """
+    def __init__(self, cargador, ttl=600, indices=None, sincronizar=None, intervalo_sondeo=10):
+        self._cargador = cargador
+        self._ttl = ttl
+        self._sincronizar = sincronizar
+        self._intervalo_sondeo = intervalo_sondeo
+        self._sondeada_en = 0.0
+        # nombre -> fábrica de IndiceIncremental
+        self._fabricas = dict(indices or {})
+        self._indices = {}
+        self._actual = None
+        self._cargada_en = 0.0
+        self._version = 0
+        self._lock = threading.RLock()
+
+    @property
+    def version(self):
+        return self._version
+
+    def indice(self, nombre):
+        """Índice incremental `nombre`, al día con la instantánea vigente."""
+        self.obtener()
+        return self._indices[nombre]
+
+    def _vigente(self, ahora):
+        return (
+            self._actual is not None and ahora - self._cargada_en < self._ttl
+            and (self._sincronizar is None or ahora - self._sondeada_en < self._intervalo_sondeo)
+        )
+
+    def obtener(self):
+        actual = self._actual
+        if self._vigente(time.monotonic()):
+            return actual
+        with self._lock:
+            # Otra sesión pudo haberla recargado mientras esperábamos
+            ahora = time.monotonic()
+            if self._vigente(ahora):
+                return self._actual
+            if self._actual is not None and ahora - self._cargada_en < self._ttl:
+                self._sondeada_en = ahora
+                try:
+                    cambios = self._sincronizar(self._actual.df)
+                except Exception:
+                    # Sin red se sigue sirviendo la réplica; se reintenta en el próximo sondeo
+                    return self._actual
+                if cambios is not None:
+                    if cambios:
+                        self.aplicar(cambios)
+                    return self._actual
+
+            df = parsear_inventario(self._cargador())
+            self._publicar(df)
+            self._cargada_en = self._sondeada_en = time.monotonic()
+            return self._actual
+
+    def aplicar(self, mutaciones):
+        """Refleja en memoria un lote ya escrito en la hoja."""
+        with self._lock:
+            if self._actual is None:
+                return
+            mutaciones = [
+                Mutacion(m.tipo, m.id, _parsear_cambios(m.cambios))
+                if m.tipo in (AGREGAR, PARCHEAR) else m
+                for m in mutaciones
+            ]
+            self._publicar(tipar(aplicar_en_frame(self._actual.df, mutaciones)), mutaciones)
+
+    def invalidar(self):
+        with self._lock:
+            self._actual = None
+
+    def _publicar(self, df, mutaciones=None):
+        anterior = self._actual
+        self._version += 1
+        nueva = Instantanea(df, self._version)
+
+        ids = {int(m.id) for m in mutaciones} if mutaciones is not None else None
+        if anterior is None or ids is None or len(ids) > UMBRAL_RECONSTRUIR:
+            # Índices nuevos: las sesiones que leen los viejos no ven cambios a medias
+            self._indices = {n: f().construir(df) for n, f in self._fabricas.items()}
+        else:
+            for id_vino in ids:
+                antes, despues = anterior.fila(id_vino), nueva.fila(id_vino)
+                for indice in self._indices.values():
+                    indice.actualizar(id_vino, antes, despues)
+
+        self._actual = nueva
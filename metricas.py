@@ -0,0 +1,156 @@
+"""
+Medición liviana de tiempos (tramos) en los caminos calientes.
+
+`tramo("nombre")` (context manager) y `@medido("nombre")` (decorador) miden
+solo si hay algo que los recoja:
+- un registro por rerun (`iniciar_rerun`), que alimenta el panel de debug;
+- logs JSON (variable de entorno VINOTECA_LOG_JSON=1), una línea por tramo.
+Si no, el costo es una lectura de ContextVar por llamada.
+"""
+import contextvars
+import functools
+import json
+import logging
+import os
+import time
+
+LOG_JSON = os.environ.get('VINOTECA_LOG_JSON', '') not in ('', '0')
+
+logger = logging.getLogger('vinoteca.metricas')
+if LOG_JSON and not logger.handlers:
+    _manejador = logging.StreamHandler()
+    _manejador.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_manejador)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+_registro = contextvars.ContextVar('vinoteca_metricas', default=None)
+
+
+class RegistroRerun:
+    """Tramos medidos durante una ejecución del script (en orden de cierre)."""
+    def __init__(self, etiqueta=''):
+        self.etiqueta = etiqueta
+        self.inicio = time.perf_counter()
+        self.tramos = []
+        self._profundidad = 0
+
+    @property
+    def ms_total(self):
+        return (time.perf_counter() - self.inicio) * 1000
+
+    def filas(self):
+        """Una fila por tramo: nombre (indentado por anidamiento), ms y datos."""
+        return [
+            {'tramo': '· ' * t['nivel'] + t['nombre'], 'ms': round(t['ms'], 2),
+             'detalle': ', '.join(f"{k}={v}" for k, v in t['datos'].items())}
+            for t in self.tramos
+        ]
+
+
+class _Tramo:
+    __slots__ = ('nombre', 'datos', 'registro', 'inicio', 'nivel')
+
+    def __init__(self, nombre, datos, registro):
+        self.nombre = nombre
+        self.datos = datos
+        self.registro = registro
+
+    def anotar(self, **datos):
+        """Agrega datos al tramo (filas, bytes, aciertos de caché...)."""
+        self.datos.update(datos)
+
+    def __enter__(self):
+        if self.registro is not None:
+            self.nivel = self.registro._profundidad
+            self.registro._profundidad += 1
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo, error, tb):
+        ms = (time.perf_counter() - self.inicio) * 1000
+        # st.rerun / st.stop son BaseException: cortan el rerun, no son fallas
+        if isinstance(error, Exception):
+            self.datos['error'] = type(error).__name__
+        if self.registro is not None:
+            self.registro._profundidad -= 1
+            self.registro.tramos.append(
+                {'nombre': self.nombre, 'ms': ms, 'nivel': self.nivel, 'datos': self.datos}
+            )
+        if LOG_JSON:
+            logger.info(json.dumps(
+                {'evento': 'tramo', 'nombre': self.nombre, 'ms': round(ms, 3),
+                 'ts': time.time(), **self.datos},
+                default=str, ensure_ascii=False
+            ))
+        return False
+
+
+class _TramoNulo:
+    """Lo que devuelve `tramo` cuando no se mide nada."""
+    __slots__ = ()
+
+    def anotar(self, **datos):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULO = _TramoNulo()
+
+
+def activo():
+    return LOG_JSON or _registro.get() is not None
+
+
+def tramo(nombre, **datos):
+    registro = _registro.get()
+    if registro is None and not LOG_JSON:
+        return _NULO
+    return _Tramo(nombre, datos, registro)
+
+
+def medido(nombre=None):
+    """Decorador: mide cada llamada a la función como un tramo."""
+    def decorar(funcion):
+        etiqueta = nombre or funcion.__qualname__
+
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            if _registro.get() is None and not LOG_JSON:
+                return funcion(*args, **kwargs)
+            with _Tramo(etiqueta, {}, _registro.get()):
+                return funcion(*args, **kwargs)
+        return envoltura
+    return decorar
+
+
+def evento(nombre, **datos):
+    """Línea de log JSON suelta (arranque, primera página...), si los logs están activos."""
+    if LOG_JSON:
+        logger.info(json.dumps(
+            {'evento': nombre, 'ts': time.time(), **datos}, default=str, ensure_ascii=False
+        ))
+
+
+def iniciar_rerun(etiqueta=''):
+    """Empieza a registrar los tramos del hilo actual (un rerun de Streamlit)."""
+    registro = RegistroRerun(etiqueta)
+    _registro.set(registro)
+    return registro
+
+
+def terminar_rerun():
+    registro = _registro.get()
+    _registro.set(None)
+    if registro is not None and LOG_JSON:
+        logger.info(json.dumps(
+            {'evento': 'rerun', 'etiqueta': registro.etiqueta, 'ms': round(registro.ms_total, 3),
+             'tramos': len(registro.tramos), 'ts': time.time()},
+            ensure_ascii=False
+        ))
+    return registro
@@ -0,0 +1,78 @@
+"""
+Paginado del lado del servidor para las tablas del inventario (sin Streamlit).
+
+La búsqueda, el orden y el corte de página se hacen sobre la instantánea en
+memoria; al navegador solo viaja la página visible y sus miniaturas.
+"""
+import numpy as np
+import pandas as pd
+
+from inventario import normalizar_serie, normalizar_texto
+
+TAMANOS_PAGINA = [25, 50, 100, 200]
+COLUMNAS_BUSQUEDA = [
+    'nombre', 'bodega', 'uva_principal', 'composicion_blend', 'anada', 'gama',
+    'procedencia', 'enologo', 'ubicacion', 'detalle', 'nota_cata',
+]
+
+
+def texto_busqueda(df, columnas=COLUMNAS_BUSQUEDA):
+    """Una cadena normalizada por fila con todos los campos buscables."""
+    presentes = [c for c in columnas if c in df.columns]
+    if not presentes:
+        return pd.Series('', index=df.index, dtype=object)
+    texto = normalizar_serie(df[presentes[0]])
+    for c in presentes[1:]:
+        texto = texto + ' ' + normalizar_serie(df[c])
+    return texto
+
+
+def filtrar_texto(df, consulta, texto):
+    """
+    Filas de `df` que contienen todas las palabras de `consulta` (sin
+    acentos ni mayúsculas). `texto` es `texto_busqueda` del frame completo
+    del que `df` es un subconjunto.
+    """
+    palabras = normalizar_texto(consulta).split()
+    if not palabras:
+        return df
+    texto = texto.reindex(df.index)
+    mascara = np.ones(len(df), dtype=bool)
+    for p in palabras:
+        mascara &= texto.str.contains(p, regex=False).to_numpy()
+    return df[mascara]
+
+
+def ordenar(df, columna, descendente=False):
+    """Orden estable por `columna`, con los vacíos siempre al final."""
+    if not columna or columna not in df.columns:
+        return df
+    serie = df[columna]
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        # Orden alfabético aunque las categorías agregadas en caliente queden al final
+        categorias = serie.cat.categories
+        rangos = np.empty(len(categorias))
+        rangos[np.argsort(categorias.to_numpy(dtype=str), kind='stable')] = np.arange(len(categorias))
+        codigos = serie.cat.codes.to_numpy()
+        serie = pd.Series(np.where(codigos >= 0, rangos[codigos] if len(rangos) else np.nan, np.nan))
+    else:
+        serie = serie.reset_index(drop=True)
+    orden = serie.sort_values(ascending=not descendente, kind='stable', na_position='last').index
+    return df.iloc[orden.to_numpy()]
+
+
+def pagina(df, numero, tamano):
+    """(filas de la página `numero` (desde 1), número acotado, total de páginas)."""
+    total = max(1, -(-len(df) // tamano))
+    numero = min(max(1, int(numero)), total)
+    inicio = (numero - 1) * tamano
+    return df.iloc[inicio:inicio + tamano], numero, total
+
+
+def reubicar_seleccion(ids_seleccionados, ids_en_pagina):
+    """
+    Posiciones en la página de las botellas seleccionadas. La selección se
+    guarda por id: tras un guardado las filas pueden cambiar de lugar.
+    """
+    previos = set(ids_seleccionados)
+    return [n for n, i in enumerate(ids_en_pagina) if i in previos]
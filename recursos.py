@@ -0,0 +1,171 @@
+"""
+Recursos compartidos por todas las sesiones del proceso (st.cache_resource).
+
+Conexión y cuota de la hoja, réplica local y su sincronizador, inventario
+con sus índices, escritor diferido, almacén de imágenes y cliente web.
+Viven fuera de app.py para que `servidor.py` los pueda precalentar al
+iniciar el servidor, antes de la primera sesión: la clave de
+`st.cache_resource` es la función de este módulo, así que la app recibe
+los mismos objetos.
+"""
+import logging
+import os
+
+import streamlit as st
+
+from almacen import HojaGSheets, SecuenciaIds, aplicar_mutaciones
+from inventario import Inventario, IndiceHuellas, migrar_imagenes_legado
+from replica import ReplicaLocal, SincronizadorReplica
+from imagenes import AlmacenImagenes, PERSISTENTE, PoolImagenes, iniciar_servidor_miniaturas, url_estatica
+from busqueda import IndiceTexto
+from vocabulario import IndiceVocabulario, UVAS_BASE_ESTANDAR
+from consumo import IndiceConsumo
+from ubicaciones import IndiceOcupacion
+from externos import ClienteWeb
+from cache_disco import CacheDisco
+from cuota import LimitadorCuota
+from escritor import EscritorDiferido
+from metricas import medido, tramo
+import arranque
+
+logger = logging.getLogger('vinoteca.recursos')
+
+# --- BASE DE DATOS (GOOGLE SHEETS) ---
+def get_conn():
+    # Import diferido: streamlit_gsheets (y google-auth) es lo más lento de cargar
+    from streamlit_gsheets import GSheetsConnection
+    return st.connection("gsheets", type=GSheetsConnection)
+
+@st.cache_resource
+def obtener_limitador():
+    # Uno por proceso: todas las sesiones comparten la cuota de Sheets
+    return LimitadorCuota()
+
+@st.cache_resource
+def obtener_hoja():
+    return HojaGSheets(get_conn(), limitador=obtener_limitador())
+
+@st.cache_resource
+def obtener_imagenes():
+    almacen_img = AlmacenImagenes()
+    # Con VINOTECA_PUERTO_IMAGENES se levanta un servidor propio, que solo
+    # sirve si el navegador lo alcanza en VINOTECA_URL_IMAGENES.
+    puerto = os.environ.get('VINOTECA_PUERTO_IMAGENES')
+    if puerto and 'VINOTECA_URL_IMAGENES' in os.environ:
+        try:
+            iniciar_servidor_miniaturas(almacen_img, int(puerto))
+        except OSError:
+            pass  # Ya lo levantó otro proceso sobre el mismo almacén
+        almacen_img.sirve_urls = True
+        return almacen_img
+    if puerto:
+        logger.warning('VINOTECA_PUERTO_IMAGENES sin VINOTECA_URL_IMAGENES; no se levanta el servidor')
+
+    # Si no, el static serving de Streamlit (.streamlit/config.toml; servidor.py
+    # agrega Cache-Control: immutable), que solo alcanza lo que está en static/.
+    # Un almacén fuera de ahí (p.ej. un volumen persistente) va en data URIs.
+    url = url_estatica(almacen_img.raiz)
+    almacen_img.sirve_urls = url is not None and bool(st.get_option('server.enableStaticServing'))
+    if almacen_img.sirve_urls:
+        almacen_img.url_base = url
+    return almacen_img
+
+@st.cache_resource
+def obtener_pool_imagenes():
+    # Los workers (spawn) tardan segundos en arrancar: se levantan una vez por proceso
+    return PoolImagenes()
+
+@st.cache_resource
+def obtener_secuencia():
+    # Compartida entre sesiones: los ids nuevos salen de aquí y no de df['id'].max()
+    return SecuenciaIds()
+
+@st.cache_resource
+def obtener_cliente_web():
+    # Sesión HTTP con pool de conexiones y cliente DDGS reutilizados.
+    # La caché en disco evita repetir búsquedas/descargas (y gastar rate limit).
+    return ClienteWeb(cache=CacheDisco())
+
+@st.cache_resource
+def obtener_replica():
+    # Réplica local en SQLite: la app lee y escribe acá, sin esperar a la red
+    return ReplicaLocal()
+
+@st.cache_resource
+def obtener_sincronizacion():
+    # Un hilo por proceso sincroniza la réplica con la hoja (la hoja se crea
+    # recién en ese hilo: sin red la app arranca igual)
+    return SincronizadorReplica(obtener_replica(), obtener_hoja, secuencia=obtener_secuencia())
+
+@medido('replica.lectura_completa')
+def leer_replica():
+    # Sin caché de Streamlit: la instantánea del inventario ya hace de caché
+    if not obtener_replica().sincronizada:
+        # Primer arranque: se trae la hoja antes de mostrar una bodega vacía
+        with tramo('replica.traer_inicial'):
+            obtener_sincronizacion().traer_inicial()
+    with tramo('replica.leer') as t:
+        df = obtener_replica().leer()
+        t.anotar(filas=len(df), columnas=len(df.columns))
+
+    if 'id' in df.columns:
+        obtener_secuencia().observar(df['id'])
+
+    # Fotos viejas en Hex dentro de la hoja -> almacén de imágenes. El Hex
+    # solo se borra de la hoja con VINOTECA_IMAGENES_PERSISTENTES=1.
+    pendientes = migrar_imagenes_legado(df, obtener_imagenes(), vaciar=PERSISTENTE)
+    if pendientes:
+        try:
+            aplicar_mutaciones(obtener_replica(), pendientes)
+        except Exception:
+            pass  # Se reintenta en la próxima carga; los hashes no cambian
+
+    return df
+
+@medido('replica.sincronizar')
+def sincronizar_replica(df):
+    """Filas que el sincronizador trajo de la hoja (o selló) desde el último sondeo."""
+    if obtener_escritor().ocupado:
+        # La instantánea tiene cambios propios que aún no están en la réplica
+        return []
+    cambios = obtener_sincronizacion().cambios(df)
+    if cambios:
+        obtener_secuencia().observar([m.id for m in cambios])
+    return cambios
+
+@st.cache_resource
+def obtener_inventario():
+    # El sondeo es local (lo que el sincronizador dejó en la réplica): cada 2s.
+    # La lectura completa de la réplica queda como red de seguridad (1 hora).
+    return Inventario(
+        leer_replica, ttl=3600, indices={
+            'huellas': IndiceHuellas,
+            'texto': IndiceTexto,
+            'vocabulario': lambda: IndiceVocabulario(base={'uva_principal': UVAS_BASE_ESTANDAR}),
+            'consumo': IndiceConsumo,
+            'ocupacion': IndiceOcupacion,
+        },
+        sincronizar=sincronizar_replica, intervalo_sondeo=2
+    )
+
+@st.cache_resource
+def obtener_escritor():
+    # Un solo escritor por proceso: las sesiones nunca escriben a la vez.
+    # Escribe en la réplica; a la hoja lo lleva el sincronizador.
+    return EscritorDiferido(obtener_replica(), obtener_inventario())
+
+
+# --- PRECALENTAMIENTO ---
+@st.cache_resource
+def precalentar():
+    """
+    Una vez por proceso, en segundo plano: lectura + parseo del inventario
+    desde la réplica, índices y el hilo que sincroniza con la hoja. Lo
+    llama `servidor.py` al iniciar el servidor (y app.py por si se corre
+    directo); las sesiones que llegan mientras tanto esperan la misma
+    carga (el lock del inventario) en vez de repetirla.
+    """
+    return arranque.precalentar([
+        ('inventario', lambda: obtener_inventario().obtener()),
+        ('sincronizacion', obtener_sincronizacion),
+    ])
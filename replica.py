@@ -0,0 +1,544 @@
+"""
+Réplica local del inventario en SQLite (sin Streamlit).
+
+La app lee y escribe en `ReplicaLocal`, que tiene la misma interfaz de
+escritura que las hojas (`revision`, `agregar`, `parchear`, `borrar`,
+`sellar`): el `EscritorDiferido` y `aplicar_mutaciones` la usan sin
+cambios. Cada escritura local queda además en una bandeja de salida
+(`pendientes`) en la misma transacción.
+
+`SincronizadorReplica` es un hilo de fondo que trae de la hoja las filas
+que cambiaron y después envía la bandeja. Los conflictos se resuelven por
+revisión de fila:
+- una fila cuya revisión en la hoja no es la última vista se trae; si la
+  local tiene cambios sin enviar, se les vuelven a aplicar encima (las
+  celdas locales ganan y al enviarse reciben una revisión nueva);
+- una fila borrada en la hoja se borra también acá y se descartan sus
+  cambios pendientes;
+- si otro cliente usó para otra botella el id de un alta local sin
+  enviar, el alta local recibe un id nuevo y se envía como alta.
+Sin conexión la app sigue funcionando sobre la réplica; la bandeja se
+envía cuando vuelve la red.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+
+from almacen import (
+    AGREGAR, BORRAR, PARCHEAR, BloqueoSeguridad, Mutacion, SecuenciaIds, _entero, aplicar_mutaciones
+)
+from escritor import marcas_de_revision
+
+RUTA_POR_DEFECTO = os.environ.get(
+    'VINOTECA_REPLICA', str(Path(__file__).parent / '.cache' / 'replica.sqlite')
+)
+# Columnas con índice propio en SQLite (además de `id`)
+COLUMNAS_INDEXADAS = ('ubicacion', 'uva_principal')
+# Segundos entre sincronizaciones; sin red se espera cada vez más hasta ESPERA_MAXIMA
+INTERVALO = 10
+ESPERA_MAXIMA = 300
+# Cada cuántos segundos se comparan las versiones aunque la hoja no haya cambiado
+# (dos escrituras simultáneas pueden sellar la misma revisión)
+COMPARACION_COMPLETA = 300
+# Mutaciones de la bandeja que se envían por lote
+LOTE_ENVIO = 500
+# Con más filas cambiadas que esto, conviene una lectura completa
+UMBRAL_DELTA = 200
+# Celdas que pone la hoja al sellar (no cuentan al comparar filas)
+MARCAS = ('revision', 'updated_at')
+
+
+def _valor(valor):
+    """Valor de pandas/numpy -> JSON (NaN / NA -> None)."""
+    if valor is None or valor is pd.NA or valor is pd.NaT:
+        return None
+    if isinstance(valor, bytes):
+        return valor.hex()
+    if hasattr(valor, 'item'):  # escalares numpy
+        valor = valor.item()
+    if isinstance(valor, float) and valor != valor:
+        return None
+    return valor
+
+
+def _a_json(fila):
+    return {str(c): _valor(v) for c, v in fila.items()}
+
+
+def _celda_igual(a, b):
+    a, b = ('' if v is None else v for v in (a, b))
+    try:
+        return float(a) == float(b)
+    except (TypeError, ValueError):
+        return str(a) == str(b)
+
+
+def _misma_fila(local, remota):
+    """True si `remota` tiene las celdas de `local` (la hoja devuelve 2019 como 2019.0)."""
+    return all(_celda_igual(v, remota.get(c)) for c, v in local.items() if c not in MARCAS)
+
+
+def _filas_de_frame(df):
+    """{id: fila} de un frame leído de la hoja (se saltean filas sin id)."""
+    if df.empty or 'id' not in df.columns:
+        return {}
+    return {
+        _entero(f['id']): _a_json(f) for f in df.to_dict('records') if _entero(f['id'])
+    }
+
+
+class ReplicaLocal:
+    """
+    Tablas:
+    - vinos: una fila por vino (JSON en `datos`) y la revisión de la hoja
+      con la que se vio por última vez (NULL: alta aún no enviada).
+    - pendientes: bandeja de salida, en orden de escritura.
+    - meta: revisión/sello locales, última revisión vista de la hoja y
+      orden de columnas.
+    """
+    def __init__(self, ruta=RUTA_POR_DEFECTO):
+        self.ruta = Path(ruta)
+        # Se llama (sin argumentos) al terminar cada lote de escrituras locales
+        self.al_escribir = None
+        self._lock = threading.RLock()
+        if str(ruta) != ':memory:':
+            self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(ruta), check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS vinos ('
+            ' id INTEGER PRIMARY KEY, ubicacion TEXT, uva_principal TEXT,'
+            ' revision_remota INTEGER, datos TEXT NOT NULL)'
+        )
+        for col in COLUMNAS_INDEXADAS:
+            self._db.execute(f'CREATE INDEX IF NOT EXISTS vinos_{col} ON vinos ({col})')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS pendientes ('
+            ' seq INTEGER PRIMARY KEY AUTOINCREMENT, tipo TEXT NOT NULL,'
+            ' id INTEGER NOT NULL, cambios TEXT)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS pendientes_id ON pendientes (id)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor TEXT)')
+
+    @contextmanager
+    def _transaccion(self):
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+            self._db.execute('COMMIT')
+
+    # --- META ---
+    def meta(self, clave, defecto=None):
+        with self._lock:
+            fila = self._db.execute('SELECT valor FROM meta WHERE clave = ?', (clave,)).fetchone()
+        return defecto if fila is None else json.loads(fila[0])
+
+    def _guardar_meta(self, db, clave, valor):
+        db.execute(
+            'INSERT OR REPLACE INTO meta (clave, valor) VALUES (?, ?)', (clave, json.dumps(valor))
+        )
+
+    def _registrar_columnas(self, db, filas):
+        columnas = self.meta('columnas', [])
+        nuevas = [c for f in filas for c in f if c not in columnas]
+        if nuevas:
+            self._guardar_meta(db, 'columnas', columnas + list(dict.fromkeys(nuevas)))
+
+    @property
+    def sincronizada(self):
+        """True si ya se trajo la hoja al menos una vez."""
+        return self.meta('revision_hoja') is not None
+
+    # --- FILAS ---
+    def _fila(self, db, id_vino):
+        fila = db.execute(
+            'SELECT datos, revision_remota FROM vinos WHERE id = ?', (id_vino,)
+        ).fetchone()
+        return (None, None) if fila is None else (json.loads(fila[0]), fila[1])
+
+    def _guardar_fila(self, db, fila, revision_remota):
+        indexadas = [fila.get(c) if isinstance(fila.get(c), str) else None for c in COLUMNAS_INDEXADAS]
+        db.execute(
+            'INSERT OR REPLACE INTO vinos (id, ubicacion, uva_principal, revision_remota, datos)'
+            ' VALUES (?, ?, ?, ?, ?)',
+            (int(fila['id']), *indexadas, revision_remota, json.dumps(fila, ensure_ascii=False)),
+        )
+
+    def leer(self):
+        """Frame con todas las filas, con las columnas en el orden de la hoja."""
+        with self._lock:
+            filas = [json.loads(d) for (d,) in self._db.execute('SELECT datos FROM vinos ORDER BY id')]
+        return pd.DataFrame(filas, columns=self.meta('columnas') or ['id'])
+
+    def filas(self, ids):
+        """{id: fila} de los `ids` que existen."""
+        with self._lock:
+            return {i: f for i in ids for f in [self._fila(self._db, int(i))[0]] if f is not None}
+
+    def ids_donde(self, **filtros):
+        """Ids por igualdad en columnas indexadas, sin armar el frame: ids_donde(ubicacion='Otro')."""
+        if not filtros or set(filtros) - set(COLUMNAS_INDEXADAS):
+            raise ValueError(f'Solo se filtra por {", ".join(COLUMNAS_INDEXADAS)}')
+        condicion = ' AND '.join(f'{c} = ?' for c in filtros)
+        with self._lock:
+            return [i for (i,) in self._db.execute(
+                f'SELECT id FROM vinos WHERE {condicion} ORDER BY id', tuple(filtros.values())
+            )]
+
+    # --- ESCRITURA LOCAL (interfaz de hoja) ---
+    def revision(self):
+        return self.meta('revision', 0), self.meta('sello', '')
+
+    def sellar(self, revision, sello):
+        with self._transaccion() as db:
+            self._guardar_meta(db, 'revision', revision)
+            self._guardar_meta(db, 'sello', sello)
+        if self.al_escribir is not None:
+            self.al_escribir()
+
+    def _encolar(self, db, tipo, id_vino, cambios=None):
+        db.execute(
+            'INSERT INTO pendientes (tipo, id, cambios) VALUES (?, ?, ?)',
+            (tipo, int(id_vino), None if cambios is None else json.dumps(cambios, ensure_ascii=False)),
+        )
+
+    def agregar(self, filas):
+        filas = [_a_json(f) for f in filas]
+        with self._transaccion() as db:
+            for fila in filas:
+                self._guardar_fila(db, fila, None)
+                self._encolar(db, AGREGAR, fila['id'], fila)
+            self._registrar_columnas(db, filas)
+
+    def parchear(self, cambios_por_id):
+        with self._transaccion() as db:
+            vistos = []
+            for id_vino, cambios in cambios_por_id.items():
+                fila, revision_remota = self._fila(db, int(id_vino))
+                if fila is None:
+                    continue
+                cambios = _a_json(cambios)
+                fila.update(cambios)
+                self._guardar_fila(db, fila, revision_remota)
+                self._encolar(db, PARCHEAR, id_vino, cambios)
+                vistos.append(cambios)
+            self._registrar_columnas(db, vistos)
+
+    def borrar(self, ids):
+        with self._transaccion() as db:
+            existentes = [i for i in dict.fromkeys(int(i) for i in ids) if self._fila(db, i)[0] is not None]
+            if not existentes:
+                return
+            if len(existentes) >= db.execute('SELECT COUNT(*) FROM vinos').fetchone()[0]:
+                raise BloqueoSeguridad('La operación dejaría la hoja vacía.')
+            for i in existentes:
+                db.execute('DELETE FROM vinos WHERE id = ?', (i,))
+                self._encolar(db, BORRAR, i)
+
+    # --- BANDEJA DE SALIDA ---
+    def cantidad_pendientes(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM pendientes').fetchone()[0]
+
+    def pendientes(self, limite=LOTE_ENVIO):
+        """[(seq, Mutacion)] de la bandeja, en el orden en que se escribieron."""
+        with self._lock:
+            filas = self._db.execute(
+                'SELECT seq, tipo, id, cambios FROM pendientes ORDER BY seq LIMIT ?', (limite,)
+            ).fetchall()
+        return [
+            (seq, Mutacion(tipo, id_vino, json.loads(cambios) if cambios else {}))
+            for seq, tipo, id_vino, cambios in filas
+        ]
+
+    def confirmar(self, seqs, selladas):
+        """
+        Saca `seqs` de la bandeja y anota en cada fila la revisión con que
+        quedó en la hoja. Devuelve los ids tocados.
+        """
+        marcas = marcas_de_revision(selladas)
+        with self._transaccion() as db:
+            db.executemany('DELETE FROM pendientes WHERE seq = ?', [(s,) for s in seqs])
+            for m in marcas:
+                fila, _ = self._fila(db, int(m.id))
+                if fila is not None:
+                    fila.update(m.cambios)
+                    self._guardar_fila(db, fila, m.cambios['revision'])
+        return [m.id for m in marcas]
+
+    def descartar(self, seqs):
+        with self._transaccion() as db:
+            db.executemany('DELETE FROM pendientes WHERE seq = ?', [(s,) for s in seqs])
+
+    # --- CAMBIOS DE LA HOJA ---
+    def revisiones_remotas(self):
+        """id -> revisión de la hoja, de las filas ya sincronizadas (sin altas por enviar)."""
+        with self._lock:
+            return dict(self._db.execute(
+                'SELECT id, revision_remota FROM vinos WHERE revision_remota IS NOT NULL'
+            ))
+
+    def _renumerar(self, db, viejo, nuevo):
+        """Mueve la fila local `viejo` y sus pendientes a `nuevo`."""
+        fila, _ = self._fila(db, viejo)
+        if fila is not None:
+            db.execute('DELETE FROM vinos WHERE id = ?', (viejo,))
+            self._guardar_fila(db, fila | {'id': nuevo}, None)
+        for seq, cambios in db.execute('SELECT seq, cambios FROM pendientes WHERE id = ?', (viejo,)).fetchall():
+            cambios = json.loads(cambios) if cambios else None
+            if cambios is not None and 'id' in cambios:
+                cambios['id'] = nuevo
+            db.execute(
+                'UPDATE pendientes SET id = ?, cambios = ? WHERE seq = ?',
+                (nuevo, None if cambios is None else json.dumps(cambios, ensure_ascii=False), seq),
+            )
+
+    def reconciliar(self, remotas, borradas, revision_hoja, secuencia=None, sello_hoja=''):
+        """
+        Aplica lo traído de la hoja: `remotas` = {id: (fila, revisión)} y
+        los ids `borradas`. Un alta local sin enviar cuyo id ya usa otra
+        botella en la hoja se renumera con `secuencia` (un `SecuenciaIds`).
+        `revision_hoja`/`sello_hoja` quedan como lo último visto de la hoja.
+        Devuelve (ids cambiados, cantidad de conflictos).
+        """
+        cambiados = []
+        conflictos = 0
+        with self._transaccion() as db:
+            locales = {}
+            for id_vino, tipo, cambios in db.execute('SELECT id, tipo, cambios FROM pendientes ORDER BY seq'):
+                locales.setdefault(id_vino, []).append((tipo, json.loads(cambios) if cambios else {}))
+            if secuencia is None:
+                secuencia = SecuenciaIds()
+            secuencia.observar([db.execute('SELECT MAX(id) FROM vinos').fetchone()[0], *locales, *remotas])
+
+            for id_vino, (fila, revision) in remotas.items():
+                propios = locales.get(id_vino)
+                alta_enviada = False
+                if propios and propios[0][0] == AGREGAR:
+                    if _misma_fila(propios[0][1], fila):
+                        # Un envío cortado ya la escribió: lo pendiente sigue como parche
+                        db.execute(
+                            'UPDATE pendientes SET tipo = ? WHERE id = ? AND tipo = ?',
+                            (PARCHEAR, id_vino, AGREGAR),
+                        )
+                        alta_enviada = True
+                    else:
+                        # Otro cliente usó el id para otra botella: la local se renumera
+                        nuevo = secuencia.siguiente()
+                        self._renumerar(db, id_vino, nuevo)
+                        cambiados.append(nuevo)
+                        conflictos += 1
+                        propios = None
+                if propios:
+                    if not alta_enviada:
+                        conflictos += 1
+                    if any(tipo == BORRAR for tipo, _ in propios):
+                        continue  # El borrado local se envía igual
+                    for _, cambios in propios:
+                        fila.update(cambios)
+                self._guardar_fila(db, fila, revision)
+                cambiados.append(id_vino)
+
+            for id_vino in borradas:
+                if id_vino in locales:
+                    conflictos += 1
+                    db.execute('DELETE FROM pendientes WHERE id = ?', (id_vino,))
+                db.execute('DELETE FROM vinos WHERE id = ?', (id_vino,))
+                cambiados.append(id_vino)
+
+            self._registrar_columnas(db, [f for f, _ in remotas.values()])
+            self._guardar_meta(db, 'revision_hoja', revision_hoja)
+            self._guardar_meta(db, 'sello_hoja', sello_hoja)
+            # Las revisiones locales siguen a las de la hoja
+            if revision_hoja > self.meta('revision', 0):
+                self._guardar_meta(db, 'revision', revision_hoja)
+        return cambiados, conflictos
+
+
+class SincronizadorReplica:
+    """
+    Hilo de fondo que mantiene `replica` al día con la hoja.
+
+    `hoja` puede ser la hoja o una función que la devuelva (se crea recién
+    en el hilo: sin red puede fallar). El `Inventario` no se toca desde
+    acá: `cambios(df)` devuelve, para su sondeo, las mutaciones de lo que
+    se trajo o se selló desde la última llamada, leídas de la réplica.
+    """
+    def __init__(self, replica, hoja, secuencia=None, intervalo=INTERVALO, umbral=UMBRAL_DELTA,
+                 comparacion=COMPARACION_COMPLETA, iniciar=True):
+        self.replica = replica
+        self._hoja = hoja
+        # Ids para renumerar altas locales que chocan con filas de otros clientes
+        self.secuencia = secuencia if secuencia is not None else SecuenciaIds()
+        self.intervalo = intervalo
+        self.umbral = umbral
+        self.comparacion = comparacion
+        self._ultima_comparacion = float('-inf')
+        self._recibidos = set()
+        self._recargar = False
+        # Un envío anterior pudo escribir altas antes de fallar (o antes de reiniciar)
+        self._envio_incompleto = True
+        self._ciclo = threading.Lock()
+        self._lock = threading.Lock()
+        self._despertar = threading.Event()
+        self._estado = {
+            'en_linea': None, 'ultimo_sync': None, 'ultimo_error': '',
+            'fallos': 0, 'traidas': 0, 'enviadas': 0, 'conflictos': 0,
+        }
+        replica.al_escribir = self.avisar
+        if iniciar:
+            self._despertar.set()
+            threading.Thread(target=self._bucle, daemon=True, name='sincronizador-replica').start()
+
+    def avisar(self):
+        """Despierta el hilo (hay algo nuevo en la bandeja)."""
+        self._despertar.set()
+
+    def _obtener_hoja(self):
+        return self._hoja() if callable(self._hoja) else self._hoja
+
+    def _anotar(self, ids):
+        with self._lock:
+            if len(self._recibidos) + len(ids) > self.umbral:
+                self._recargar = True
+                self._recibidos = set()
+            elif not self._recargar:
+                self._recibidos.update(int(i) for i in ids)
+
+    def traer(self, hoja, forzar=False):
+        """
+        Trae a la réplica las filas de la hoja con otra revisión. Devuelve
+        cuántas. Si la revisión y el sello de la hoja son los ya vistos no
+        lee nada más; con `forzar` compara las versiones igual (un envío
+        cortado puede no haber sellado).
+        """
+        revision, sello = hoja.revision()
+        vista = (self.replica.meta('revision_hoja'), self.replica.meta('sello_hoja', ''))
+        if not forzar and vista == (revision, sello):
+            return 0
+        self._ultima_comparacion = time.monotonic()
+
+        locales = self.replica.revisiones_remotas()
+        versiones = hoja.versiones() if locales else None
+        distintos = [] if versiones is None else [
+            i for i, (_, rev) in versiones.items() if locales.get(i) != rev
+        ]
+        remotas = None
+        if versiones is not None and len(distintos) <= self.umbral:
+            filas = _filas_de_frame(hoja.leer_filas([versiones[i][0] for i in distintos])) if distintos else {}
+            if list(filas) == distintos:
+                remotas = {i: (filas[i], versiones[i][1]) for i in distintos}
+                presentes = set(versiones)
+        if remotas is None:
+            # Primera vez, demasiadas filas distintas, o se borraron filas entre lecturas
+            filas = _filas_de_frame(hoja.leer(ttl=0))
+            remotas = {
+                i: (f, _entero(f.get('revision'))) for i, f in filas.items()
+                if locales.get(i) != _entero(f.get('revision'))
+            }
+            presentes = set(filas)
+
+        borradas = [i for i in locales if i not in presentes]
+        self.secuencia.observar(list(presentes))
+        cambiados, conflictos = self.replica.reconciliar(remotas, borradas, revision, self.secuencia, sello)
+        self._anotar(cambiados)
+        with self._lock:
+            self._estado['traidas'] += len(cambiados)
+            self._estado['conflictos'] += conflictos
+        return len(cambiados)
+
+    def enviar(self, hoja):
+        """Envía la bandeja a la hoja, un lote por llamada. Devuelve cuántas mutaciones."""
+        lote = self.replica.pendientes()
+        if not lote:
+            return 0
+        self._envio_incompleto = True
+        try:
+            selladas = aplicar_mutaciones(hoja, [m for _, m in lote])
+        except BloqueoSeguridad:
+            # La hoja quedaría vacía: esas bajas no se envían nunca
+            self.replica.descartar([s for s, m in lote if m.tipo == BORRAR])
+            raise
+        self._envio_incompleto = False
+        self._anotar(self.replica.confirmar([s for s, _ in lote], selladas))
+        with self._lock:
+            self._estado['enviadas'] += len(lote)
+        return len(lote)
+
+    def sincronizar(self):
+        """Un ciclo: traer de la hoja y vaciar la bandeja."""
+        with self._ciclo:
+            hoja = self._obtener_hoja()
+            # Tras un envío cortado las altas que llegaron se reconocen al traer
+            # (quedan como parche) y no se vuelven a agregar. Cada tanto se
+            # compara todo por si otra escritura selló la misma revisión.
+            vencida = time.monotonic() - self._ultima_comparacion >= self.comparacion
+            self.traer(hoja, forzar=self._envio_incompleto or vencida)
+            self._envio_incompleto = False
+            while self.enviar(hoja):
+                pass
+
+    def traer_inicial(self):
+        """Primera carga (bloqueante) de una réplica vacía; sin red no hace nada."""
+        try:
+            with self._ciclo:
+                self.traer(self._obtener_hoja())
+        except Exception as e:
+            self._registrar_error(e)
+
+    def _registrar_error(self, error):
+        with self._lock:
+            self._estado['en_linea'] = False
+            self._estado['fallos'] += 1
+            self._estado['ultimo_error'] = str(error) or type(error).__name__
+
+    def _bucle(self):
+        while True:
+            fallos = self._estado['fallos']
+            espera = min(ESPERA_MAXIMA, self.intervalo * 2 ** fallos) if fallos else self.intervalo
+            self._despertar.wait(espera)
+            self._despertar.clear()
+            try:
+                self.sincronizar()
+            except Exception as e:
+                self._registrar_error(e)
+                continue
+            with self._lock:
+                self._estado.update(en_linea=True, ultimo_sync=time.time(), ultimo_error='', fallos=0)
+
+    def cambios(self, df):
+        """
+        Mutaciones que llevan `df` (la instantánea) a lo que hay en la
+        réplica para los ids traídos o sellados desde la última llamada.
+        None si fueron tantos que conviene releer la réplica entera.
+        """
+        with self._lock:
+            ids, self._recibidos = self._recibidos, set()
+            recargar, self._recargar = self._recargar, False
+        if recargar:
+            return None
+        if not ids:
+            return []
+        locales = set(df['id'].astype(int).tolist()) if 'id' in df.columns else set()
+        filas = self.replica.filas(sorted(ids))
+        mutaciones = [Mutacion(BORRAR, i) for i in sorted(ids) if i not in filas and i in locales]
+        mutaciones += [
+            Mutacion(PARCHEAR if i in locales else AGREGAR, i, fila) for i, fila in filas.items()
+        ]
+        return mutaciones
+
+    def estado(self):
+        with self._lock:
+            estado = dict(self._estado)
+        estado['pendientes'] = self.replica.cantidad_pendientes()
+        return estado
@@ -0,0 +1,50 @@
+"""
+Punto de entrada con precalentamiento al iniciar el servidor:
+
+    streamlit run servidor.py
+
+Sirve la misma app que `streamlit run app.py`, pero la lectura del
+inventario (réplica, parseo e índices) y el sincronizador con la hoja
+arrancan junto con el servidor, antes de que exista la primera sesión.
+
+Además, las miniaturas del static serving salen con `Cache-Control:
+immutable`: su nombre es el hash del contenido, así que nunca cambian.
+"""
+from contextlib import asynccontextmanager
+
+import streamlit as st
+from starlette.middleware import Middleware
+
+from imagenes import CACHE_INMUTABLE
+
+RUTA_MINIATURAS = '/app/static/imagenes/'
+
+
+class CacheInmutable:
+    """Middleware ASGI: reemplaza el Cache-Control de las miniaturas servidas bien."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not scope['path'].startswith(RUTA_MINIATURAS):
+            await self.app(scope, receive, send)
+            return
+
+        async def enviar(mensaje):
+            if mensaje['type'] == 'http.response.start' and mensaje['status'] in (200, 304):
+                cabeceras = [(k, v) for k, v in mensaje.get('headers', []) if k.lower() != b'cache-control']
+                mensaje = mensaje | {'headers': cabeceras + [(b'cache-control', CACHE_INMUTABLE.encode())]}
+            await send(mensaje)
+
+        await self.app(scope, receive, enviar)
+
+
+@asynccontextmanager
+async def al_iniciar(_app):
+    # Import diferido: con el runtime ya iniciado, st.cache_resource es el del proceso
+    import recursos
+    recursos.precalentar()
+    yield
+
+
+app = st.App('app.py', lifespan=al_iniciar, middleware=[Middleware(CacheInmutable)])
@@ -0,0 +1,226 @@
+"""
+Lógica del Sommelier Virtual (sin Streamlit).
+
+`IndiceFacetas` codifica una vez por versión del inventario cada columna
+filtrable como un array de códigos enteros. Combinar filtros es un AND de
+máscaras booleanas y los conteos por valor salen de un `bincount`, sin
+volver a recorrer el DataFrame.
+
+`recomendar` puntúa solo las botellas filtradas (urgencia de consumo,
+puntos y diversidad respecto de lo bebido hace poco) y sortea ponderando
+por puntaje, sin generar un número al azar por candidata.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+FACETAS = ['uva_principal', 'bodega', 'anada', 'procedencia', 'gama', 'enologo']
+
+# Sin `anio_limite`, se estima la ventana de consumo como añada + esto
+VENTANA_POR_DEFECTO = 5
+# A partir de cuántos años restantes la urgencia es 0
+HORIZONTE_URGENCIA = 10
+# Sorteos que pueden repetir una botella ya elegida antes de sortear solo entre las que quedan
+REINTENTOS = 8
+# Botellas por bloque del sorteo: se elige un bloque por su peso y después una botella dentro
+BLOQUE = 512
+
+
+class IndiceFacetas:
+    def __init__(self, df):
+        self.df = df.reset_index(drop=True)
+        self.n = len(self.df)
+        self._codigos = {}
+        self._valores = {}
+        self._por_valor = {}
+        for col in FACETAS:
+            if col not in self.df.columns:
+                continue
+            codigos, valores = self._factorizar(self.df[col])
+            # intp: se usan como índices sin convertirlos en cada sorteo
+            self._codigos[col] = codigos.astype(np.intp)
+            self._valores[col] = list(valores)
+            self._por_valor[col] = {v: i for i, v in enumerate(self._valores[col])}
+        self._anio_limite = self._numerico('anio_limite')
+        self._anada = self._numerico('anada')
+        self._puntuacion = self._numerico('puntuacion')
+        # Lo que no depende de los pesos se calcula una vez por versión (y por año)
+        self._limite = np.where(
+            self._anio_limite > 0, self._anio_limite,
+            np.where(self._anada > 0, self._anada + VENTANA_POR_DEFECTO, np.nan)
+        ).astype(float)
+        self._puntos = np.clip(self._puntuacion / 10, 0, 1).astype(float)
+        self._urgencias = {}
+
+    @staticmethod
+    def _factorizar(serie):
+        """(códigos, valores ordenados). NaN queda con código -1 (como dropna())."""
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            # Los códigos ya existen: solo se quitan las categorías sin botellas y se ordena
+            serie = serie.cat.remove_unused_categories()
+            serie = serie.cat.reorder_categories(serie.cat.categories.sort_values())
+            return serie.cat.codes.to_numpy(), serie.cat.categories.tolist()
+        codigos, valores = pd.factorize(serie, sort=True)
+        return codigos, valores.tolist()
+
+    def _numerico(self, col):
+        if col not in self.df.columns:
+            return np.zeros(self.n, dtype=int)
+        return pd.to_numeric(self.df[col], errors='coerce').fillna(0).to_numpy()
+
+    def urgencia(self, anio_actual):
+        """Urgencia de consumo de cada botella (ver `puntuar`), una vez por año."""
+        if anio_actual not in self._urgencias:
+            urgencia = np.clip(1 - (self._limite - anio_actual) / HORIZONTE_URGENCIA, 0, 1)
+            urgencia[np.isnan(urgencia)] = 0.5
+            self._urgencias[anio_actual] = urgencia
+        return self._urgencias[anio_actual]
+
+    def opciones(self, col):
+        """Valores distintos (ordenados) de la faceta."""
+        return list(self._valores.get(col, []))
+
+    def _codigos_de(self, col, seleccion):
+        por_valor = self._por_valor.get(col, {})
+        return [por_valor[v] for v in seleccion if v in por_valor]
+
+    def mascara(self, filtros, anio_limite_max=None, excepto=None):
+        """
+        AND de todas las facetas con selección (`filtros`: col -> valores).
+        `anio_limite_max` agrega el filtro de vinos por vencer; `excepto`
+        ignora una faceta (para contar sus opciones).
+        """
+        m = np.ones(self.n, dtype=bool)
+        if anio_limite_max is not None:
+            m &= self._anio_limite <= anio_limite_max
+        for col, seleccion in filtros.items():
+            if not seleccion or col == excepto:
+                continue
+            # Valores que ya no existen (p.ej. se bebió la última) no filtran
+            codigos = self._codigos_de(col, seleccion)
+            if codigos:
+                m &= np.isin(self._codigos[col], codigos)
+        return m
+
+    def conteos(self, col, filtros, anio_limite_max=None):
+        """
+        Cuántas botellas tendría cada valor de `col` dadas las demás
+        selecciones. Devuelve {valor: cantidad}.
+        """
+        if col not in self._codigos:
+            return {}
+        m = self.mascara(filtros, anio_limite_max, excepto=col)
+        codigos = self._codigos[col][m]
+        cuenta = np.bincount(codigos[codigos >= 0], minlength=len(self._valores[col]))
+        return dict(zip(self._valores[col], cuenta.tolist()))
+
+    def filtrar(self, filtros, anio_limite_max=None):
+        """Filas que cumplen todos los filtros."""
+        return self.df[self.mascara(filtros, anio_limite_max)]
+
+
+# --- RECOMENDACIÓN ---
+@dataclass
+class PesosRecomendacion:
+    urgencia: float = 1.0
+    puntuacion: float = 1.0
+    diversidad: float = 0.5
+    # Menor temperatura = más determinista (siempre el mejor puntaje)
+    temperatura: float = 0.15
+
+
+def puntuar(facetas, mascara, anio_actual, pesos=PesosRecomendacion(), recientes=None):
+    """
+    Puntaje en [0, 1] de cada botella de `mascara`:
+    - urgencia: 1 si ya pasó (o es este año) el año límite, baja a 0 en
+      HORIZONTE_URGENCIA años. Sin límite se usa añada + VENTANA_POR_DEFECTO.
+    - puntuacion: puntos / 10.
+    - diversidad: 1 menos la proporción de botellas bebidas hace poco con la
+      misma uva y la misma bodega (`recientes`: col -> lista de valores).
+    """
+    return _puntuar(facetas, np.flatnonzero(mascara), anio_actual, pesos, recientes)
+
+
+def _puntuar(facetas, posiciones, anio_actual, pesos, recientes):
+    """`puntuar` sobre las posiciones de la máscara (solo esas filas se tocan)."""
+    total = pesos.urgencia + pesos.puntuacion + pesos.diversidad
+    if total <= 0:
+        return np.zeros(len(posiciones))
+    # Sin filtros se leen los arrays tal cual, sin copiarlos
+    filas = slice(None) if len(posiciones) == facetas.n else posiciones
+
+    puntajes = pesos.urgencia * facetas.urgencia(anio_actual)[filas]
+    puntajes += pesos.puntuacion * facetas._puntos[filas]
+    puntajes += pesos.diversidad
+    for col in ('uva_principal', 'bodega'):
+        valores = (recientes or {}).get(col) or []
+        if not pesos.diversidad or col not in facetas._codigos or not valores:
+            continue
+        # Penalización por código; el último lugar (código -1, sin dato) queda en 0
+        penalizacion = np.zeros(len(facetas._valores[col]) + 1)
+        codigos = np.asarray(facetas._codigos_de(col, valores), dtype=np.int64)
+        penalizacion[:-1] = np.bincount(codigos, minlength=len(facetas._valores[col]))
+        penalizacion *= pesos.diversidad * 0.5 / len(valores)
+        puntajes -= penalizacion[facetas._codigos[col][filas]]
+
+    puntajes /= total
+    return puntajes
+
+
+def _indice_al_azar(acumulado, rng):
+    """Índice con probabilidad proporcional a su peso (`acumulado`: suma acumulada)."""
+    i = int(np.searchsorted(acumulado, rng.random() * acumulado[-1], side='right'))
+    return min(i, len(acumulado) - 1)
+
+
+def _sin_reposicion(claves, n, rng):
+    """
+    Hasta `n` índices distintos; cada uno sale con probabilidad proporcional
+    a exp(clave) entre los que quedan (la misma distribución que Gumbel
+    top-k) con dos números al azar por intento en vez de uno por botella.
+    """
+    pesos = claves - claves.max()
+    np.exp(pesos, out=pesos)
+    # Suma por bloque (vectorizada) en vez de la suma acumulada de todas las botellas
+    inicios = np.arange(0, len(pesos), BLOQUE)
+    por_bloque = np.cumsum(np.add.reduceat(pesos, inicios))
+    elegidos = []
+    for _ in range(min(n, len(claves))):
+        for _ in range(REINTENTOS):
+            inicio = int(inicios[_indice_al_azar(por_bloque, rng)])
+            i = inicio + _indice_al_azar(np.cumsum(pesos[inicio:inicio + BLOQUE]), rng)
+            if i not in elegidos:
+                break
+        else:
+            # Lo ya elegido concentra casi todo el peso: se sortea entre lo que queda
+            resto = np.delete(np.arange(len(claves)), elegidos)
+            i = int(resto[_indice_al_azar(np.cumsum(np.exp(claves[resto] - claves[resto].max())), rng)])
+        elegidos.append(i)
+    return np.array(elegidos, dtype=np.intp)
+
+
+def sortear(facetas, mascara, n=1, anio_actual=None, pesos=PesosRecomendacion(),
+            recientes=None, semilla=None):
+    """
+    Sortea hasta `n` botellas distintas de `mascara` con probabilidad
+    proporcional a exp(puntaje / temperatura), sin reposición. Devuelve
+    (posiciones, puntajes) en `facetas.df`, en el orden en que salieron.
+    Con `semilla` el resultado es reproducible.
+    """
+    posiciones = np.flatnonzero(mascara)
+    if not len(posiciones) or n <= 0:
+        return posiciones[:0], np.zeros(0)
+    if anio_actual is None:
+        anio_actual = pd.Timestamp.now().year
+
+    puntajes = _puntuar(facetas, posiciones, anio_actual, pesos, recientes)
+    claves = puntajes / max(pesos.temperatura, 1e-6)
+    elegidos = _sin_reposicion(claves, n, np.random.default_rng(semilla))
+    return posiciones[elegidos], puntajes[elegidos]
+
+
+def recomendar(facetas, mascara, n=1, **opciones):
+    """`sortear` + las filas elegidas con su columna `puntaje`."""
+    posiciones, puntajes = sortear(facetas, mascara, n, **opciones)
+    return facetas.df.iloc[posiciones].assign(puntaje=puntajes)
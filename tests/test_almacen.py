@@ -0,0 +1,260 @@
+"""`HojaGSheets` contra una hoja de gspread simulada en memoria (sin red)."""
+import re
+
+import gspread
+import pandas as pd
+import pytest
+
+from almacen import AGREGAR, BORRAR, PARCHEAR, BloqueoSeguridad, HojaGSheets, Mutacion, aplicar_mutaciones
+
+
+def _columna(letras):
+    n = 0
+    for letra in letras:
+        n = n * 26 + ord(letra) - ord('A') + 1
+    return n
+
+
+def _rango(a1):
+    """'B3' / 'A2:A' / 'A4:D4' -> (fila, col, fila_fin, col_fin); None = hasta el final."""
+    partes = [re.fullmatch(r'([A-Z]+)(\d*)', p).groups() for p in a1.split(':')]
+    (c1, f1), (c2, f2) = partes[0], partes[-1]
+    return int(f1), _columna(c1), int(f2) if f2 else None, _columna(c2)
+
+
+def _recortar(valores):
+    while valores and valores[-1] in ('', []):
+        valores = valores[:-1]
+    return valores
+
+
+class HojaFalsa:
+    """Lo mínimo de `gspread.Worksheet` que usa `HojaGSheets`. Lee todo como texto, igual que Sheets."""
+    def __init__(self, libro, filas, id=7):
+        self.spreadsheet = libro
+        self.filas = [list(f) for f in filas]
+        self.id = id
+        self.col_count = len(self.filas[0])
+        self.llamadas = []
+
+    def _celda(self, fila, col):
+        if fila > len(self.filas) or col > len(self.filas[fila - 1]):
+            return ''
+        valor = self.filas[fila - 1][col - 1]
+        return '' if valor is None else str(valor)
+
+    def _escribir(self, fila, col, valor):
+        while len(self.filas) < fila:
+            self.filas.append([])
+        self.filas[fila - 1] += [''] * (col - len(self.filas[fila - 1]))
+        self.filas[fila - 1][col - 1] = valor
+
+    def row_values(self, fila):
+        self.llamadas.append(('row_values', fila))
+        return _recortar([self._celda(fila, c) for c in range(1, self.col_count + 1)])
+
+    def col_values(self, col):
+        self.llamadas.append(('col_values', col))
+        return _recortar([self._celda(f, col) for f in range(1, len(self.filas) + 1)])
+
+    def add_cols(self, n):
+        self.llamadas.append(('add_cols', n))
+        self.col_count += n
+
+    def batch_update(self, datos, value_input_option=None):
+        self.llamadas.append(('batch_update', [d['range'] for d in datos]))
+        for d in datos:
+            fila, col, _, _ = _rango(d['range'])
+            assert col <= self.col_count, f"{d['range']} fuera de la grilla"
+            self._escribir(fila, col, d['values'][0][0])
+
+    def append_rows(self, valores, value_input_option=None, table_range=None):
+        self.llamadas.append(('append_rows', len(valores)))
+        assert all(len(v) <= self.col_count for v in valores)
+        self.filas += [list(v) for v in valores]
+
+    def batch_get(self, rangos):
+        self.llamadas.append(('batch_get', list(rangos)))
+        datos = []
+        for a1 in rangos:
+            fila, col, fila_fin, col_fin = _rango(a1)
+            fila_fin = fila_fin or len(self.filas)
+            datos.append(_recortar([
+                _recortar([self._celda(f, c) for c in range(col, col_fin + 1)])
+                for f in range(fila, fila_fin + 1)
+            ]))
+        return datos
+
+
+class MetaFalsa:
+    def __init__(self):
+        self.valores = []
+        self.escrituras = []
+
+    def get(self, rango):
+        return [list(map(str, self.valores))] if self.valores else []
+
+    def update(self, range_name=None, values=None, raw=False):
+        self.escrituras.append((range_name, values, raw))
+        self.valores = values[0]
+
+
+class LibroFalso:
+    def __init__(self, filas):
+        self.hoja = HojaFalsa(self, filas)
+        self.meta = None
+        self.pedidos = []
+
+    def worksheet(self, titulo):
+        if self.meta is None:
+            raise gspread.WorksheetNotFound(titulo)
+        return self.meta
+
+    def add_worksheet(self, titulo, rows, cols):
+        assert titulo == '_meta' and self.meta is None
+        self.meta = MetaFalsa()
+        return self.meta
+
+    def batch_update(self, cuerpo):
+        self.pedidos.append(cuerpo)
+        for pedido in cuerpo['requests']:
+            rango = pedido['deleteDimension']['range']
+            assert rango['sheetId'] == self.hoja.id and rango['dimension'] == 'ROWS'
+            del self.hoja.filas[rango['startIndex']:rango['endIndex']]
+
+
+class ConexionFalsa:
+    """`GSheetsConnection`: `client._select_worksheet()` devuelve la hoja de gspread."""
+    def __init__(self, libro):
+        self.client = self
+        self.libro = libro
+        self.selecciones = 0
+
+    def _select_worksheet(self):
+        self.selecciones += 1
+        return self.libro.hoja
+
+
+@pytest.fixture
+def libro():
+    return LibroFalso([
+        ['id', 'nombre', 'anada'],
+        [1, 'Uno', 2019],
+        [2, 'Dos', 2020],
+        [3, 'Tres', 2018],
+    ])
+
+
+@pytest.fixture
+def hoja(libro):
+    return HojaGSheets(ConexionFalsa(libro))
+
+
+def filas(libro):
+    return [[str(v) for v in f] for f in libro.hoja.filas]
+
+
+def test_encabezado_se_lee_una_vez(hoja, libro):
+    hoja.parchear({1: {'nombre': 'Uno bis'}})
+    hoja.parchear({2: {'nombre': 'Dos bis'}})
+    assert [l for l in libro.hoja.llamadas if l[0] == 'row_values'] == [('row_values', 1)]
+    assert hoja.conn.selecciones == 1
+
+
+def test_columnas_faltantes_se_agregan_al_encabezado(hoja, libro):
+    hoja.agregar([{'id': 4, 'nombre': 'Cuatro', 'bodega': 'Zuccardi', 'notas': 'Fresco'}])
+    assert ('add_cols', 2) in libro.hoja.llamadas
+    assert ('batch_update', ['D1', 'E1']) in libro.hoja.llamadas
+    assert libro.hoja.filas[0] == ['id', 'nombre', 'anada', 'bodega', 'notas']
+    assert filas(libro)[-1] == ['4', 'Cuatro', '', 'Zuccardi', 'Fresco']
+
+
+def test_parche_escribe_solo_las_celdas_cambiadas(hoja, libro):
+    hoja.parchear({3: {'anada': 2022}, 1: {'nombre': 'Uno bis', 'anada': 2015}, 99: {'nombre': 'No existe'}})
+    escrituras = [l for l in libro.hoja.llamadas if l[0] == 'batch_update']
+    assert escrituras == [('batch_update', ['C4', 'B2', 'C2'])]
+    assert filas(libro)[1:] == [['1', 'Uno bis', '2015'], ['2', 'Dos', '2020'], ['3', 'Tres', '2022']]
+
+
+def test_filas_por_id_ignora_ids_invalidos(libro):
+    libro.hoja.filas[2][0] = ''
+    libro.hoja.filas.append(['abc', 'Basura', ''])
+    libro.hoja.filas.append(['7.0', 'Siete', ''])
+    hoja = HojaGSheets(ConexionFalsa(libro))
+    assert hoja._filas_por_id() == {1: 2, 3: 4, 7: 6}
+
+
+def test_bajas_de_abajo_hacia_arriba(hoja, libro):
+    libro.hoja.filas.append([4, 'Cuatro', 2021])
+    hoja.borrar([2, 4, 99])
+    (cuerpo,) = libro.pedidos
+    assert [p['deleteDimension']['range']['startIndex'] for p in cuerpo['requests']] == [4, 2]
+    assert [f[1] for f in libro.hoja.filas[1:]] == ['Uno', 'Tres']
+
+
+def test_borrar_todo_es_bloqueo(hoja, libro):
+    with pytest.raises(BloqueoSeguridad):
+        hoja.borrar([1, 2, 3])
+    assert libro.pedidos == [] and len(libro.hoja.filas) == 4
+
+
+def test_meta_se_crea_al_primer_sello(hoja, libro):
+    assert hoja.revision() == (0, '')
+    assert libro.meta is None  # Leer la revisión no crea la hoja auxiliar
+    hoja.sellar(1, '2024-01-01T00:00:00')
+    assert libro.meta.escrituras == [('A1:B1', [[1, '2024-01-01T00:00:00']], True)]
+    assert hoja.revision() == (1, '2024-01-01T00:00:00')
+
+
+def test_lote_mixto_una_escritura_por_tipo(hoja, libro):
+    selladas = aplicar_mutaciones(hoja, [
+        Mutacion(AGREGAR, 4, {'nombre': 'Cuatro', 'anada': 2021}),
+        Mutacion(PARCHEAR, 1, {'nombre': 'Uno bis'}),
+        Mutacion(BORRAR, 2),
+        Mutacion(PARCHEAR, 1, {'anada': 2016}),
+        Mutacion(PARCHEAR, 3, {}),
+    ])
+    tipos = [l[0] for l in libro.hoja.llamadas]
+    assert tipos.count('append_rows') == 1
+    assert tipos.count('batch_update') == 2  # Encabezado (revision, updated_at) + parches
+    assert len(libro.pedidos) == 1
+
+    encabezado = libro.hoja.filas[0]
+    assert encabezado == ['id', 'nombre', 'anada', 'revision', 'updated_at']
+    por_id = {f[0]: dict(zip(encabezado, f)) for f in filas(libro)[1:]}
+    assert set(por_id) == {'1', '3', '4'}
+    assert por_id['1']['nombre'] == 'Uno bis' and por_id['1']['anada'] == '2016'
+    assert por_id['1']['revision'] == por_id['4']['revision'] == '1'
+    assert por_id['3'].get('revision', '') == ''  # El parche vacío no sella la fila
+    assert por_id['4']['updated_at'] == libro.meta.valores[1]
+    assert {m.id: m.cambios.get('revision') for m in selladas} == {4: 1, 1: 1, 2: None, 3: None}
+
+
+def test_cada_lote_sube_la_revision(hoja, libro):
+    aplicar_mutaciones(hoja, [Mutacion(PARCHEAR, 1, {'nombre': 'Uno bis'})])
+    aplicar_mutaciones(hoja, [Mutacion(PARCHEAR, 3, {'nombre': 'Tres bis'})])
+    assert hoja.revision()[0] == 2
+    assert hoja.versiones() == {1: (2, 1), 2: (3, 0), 3: (4, 2)}
+
+
+def test_versiones_sin_columna_revision(hoja, libro):
+    assert hoja.versiones() == {1: (2, 0), 2: (3, 0), 3: (4, 0)}
+    assert ('batch_get', ['A2:A']) in libro.hoja.llamadas
+
+
+def test_versiones_ve_columnas_de_otro_cliente(hoja, libro):
+    assert hoja.versiones()[2] == (3, 0)
+    # Otro cliente sella la fila 2 y agrega la columna `revision`
+    otra = HojaGSheets(ConexionFalsa(libro))
+    aplicar_mutaciones(otra, [Mutacion(PARCHEAR, 2, {'nombre': 'Dos bis'})])
+    assert hoja.versiones()[2] == (3, 1)
+    assert ('batch_get', ['A2:A', 'D2:D']) in libro.hoja.llamadas
+
+
+def test_leer_filas_en_orden_y_completa_celdas(hoja, libro):
+    libro.hoja.filas[2] = [2, 'Dos']  # Sheets recorta las celdas vacías del final
+    df = hoja.leer_filas([4, 3])
+    assert ('batch_get', ['A4:C4', 'A3:C3']) in libro.hoja.llamadas
+    assert df['nombre'].tolist() == ['Tres', 'Dos']
+    assert df['anada'].iloc[0] == '2018' and pd.isna(df['anada'].iloc[1])
+    assert hoja.leer_filas([]).columns.tolist() == ['id', 'nombre', 'anada']
@@ -0,0 +1,83 @@
+"""`IndiceTexto`: búsqueda con errores de tipeo y mantenimiento fila a fila."""
+import pandas as pd
+import pytest
+
+from almacen import AGREGAR, BORRAR, PARCHEAR, Mutacion
+from busqueda import IndiceTexto
+from inventario import Inventario
+
+
+def vinos():
+    return pd.DataFrame({
+        'id': [1, 2, 3, 4],
+        'nombre': ['Adrianna Vineyard', 'Gran Enemigo Gualtallary', 'Nicasia', 'Angélica Zapata'],
+        'bodega': ['Catena Zapata', 'El Enemigo', 'Catena Zapata', 'Catena Zapata'],
+        'enologo': ['Alejandro Vigil', 'Alejandro Vigil', '', ''],
+        'uva_principal': ['Malbec', 'Blend', 'Malbec', 'Cabernet Sauvignon'],
+        'composicion_blend': ['', 'Cabernet Franc / Malbec', '', ''],
+        'procedencia': ['Gualtallary', 'Tupungato', 'Altamira', 'Agrelo'],
+        'nota_cata': ['Violetas y grafito', '', 'Fruta roja', ''],
+    })
+
+
+@pytest.fixture
+def inventario():
+    inventario = Inventario(vinos, indices={'texto': IndiceTexto})
+    inventario.obtener()
+    return inventario
+
+
+def estado(indice):
+    return indice._postings, indice._por_id, indice._trigramas
+
+
+def ids(resultados):
+    return [i for i, _ in resultados]
+
+
+def test_tolera_errores_de_tipeo(inventario):
+    indice = inventario.indice('texto')
+    assert set(ids(indice.buscar('gualtalari'))) == {1, 2}
+    assert ids(indice.buscar('viol')) == [1]
+    assert set(ids(indice.buscar('Angelica'))) == {4}
+    assert indice.buscar('xq') == []
+
+
+def test_primero_las_que_cubren_mas_palabras(inventario):
+    resultados = ids(inventario.indice('texto').buscar('catena malbec'))
+    # Las dos Malbec de Catena antes que la Cabernet; nombre pesa más que uva
+    assert set(resultados[:2]) == {1, 3}
+    assert resultados[2] == 4
+    # Un componente del corte también es una palabra de la botella
+    assert ids(inventario.indice('texto').buscar('franc')) == [2]
+
+
+def test_incremental_igual_a_reconstruir(inventario):
+    indice = inventario.indice('texto')
+    inventario.aplicar([
+        Mutacion(AGREGAR, 5, {'nombre': 'Zuccardi Aluvional', 'bodega': 'Zuccardi',
+                              'uva_principal': 'Malbec', 'procedencia': 'Paraje Altamira'}),
+        Mutacion(PARCHEAR, 1, {'nota_cata': 'Grafito y hierbas'}),
+        Mutacion(PARCHEAR, 2, {'enologo': 'Santiago Mayorga'}),
+        Mutacion(BORRAR, 3, {}),
+    ])
+    # Mismo objeto: se actualizó fila a fila, no se reconstruyó
+    assert inventario.indice('texto') is indice
+    desde_cero = IndiceTexto().construir(inventario.obtener().df)
+    assert estado(indice) == estado(desde_cero)
+
+    assert ids(indice.buscar('aluvional')) == [5]
+    # 'violetas' y 'nicasia' ya no están en ninguna botella: salen del vocabulario
+    assert indice.buscar('violetas') == [] and indice.variantes('nicasia') == []
+    assert ids(indice.buscar('mayorga')) == [2]
+    assert indice.buscar('mayorga') == desde_cero.buscar('mayorga')
+
+
+def test_borrar_y_volver_a_agregar(inventario):
+    indice = inventario.indice('texto')
+    fila = inventario.obtener().fila(3)
+    inventario.aplicar([Mutacion(BORRAR, 3, {})])
+    assert indice.buscar('nicasia') == []
+    inventario.aplicar([Mutacion(AGREGAR, 3, {c: fila[c] for c in vinos().columns if c != 'id'})])
+    assert ids(indice.buscar('nicasia')) == [3]
+    assert estado(indice) == estado(IndiceTexto().construir(inventario.obtener().df))
@@ -0,0 +1,86 @@
+"""`IndiceConsumo`: agregados del historial al consumir, restaurar y borrar."""
+import pandas as pd
+import pytest
+
+from almacen import AGREGAR, BORRAR, PARCHEAR, Mutacion
+from consumo import CONSUMIDO, IndiceConsumo, cambios_de_consumo
+from inventario import Inventario
+
+
+def vinos():
+    return pd.DataFrame({
+        'id': [1, 2, 3, 4, 5],
+        'nombre': ['Nicasia', 'Gran Enemigo', 'Corte', 'Aluvional', 'Sin fecha'],
+        'bodega': ['Catena Zapata', 'El Enemigo', 'Zuccardi', 'Zuccardi', 'Norton'],
+        'uva_principal': ['Malbec', 'Blend', 'Blend', 'Malbec', 'Malbec'],
+        'ubicacion': [CONSUMIDO, CONSUMIDO, 'Rack', CONSUMIDO, CONSUMIDO],
+        'fecha_consumo': ['2025-01-10T20:00:00', '2025-03-02T21:00:00', None, '2025-01-31T22:00:00', None],
+        'anio_limite': [2024, 2030, 2028, 2025, 2020],
+        'puntuacion': [8, 10, 0, 0, 6],
+    })
+
+
+@pytest.fixture
+def inventario():
+    inventario = Inventario(vinos, indices={'consumo': IndiceConsumo})
+    inventario.obtener()
+    return inventario
+
+
+def consumir(id_vino, fecha):
+    return Mutacion(PARCHEAR, id_vino, {'ubicacion': CONSUMIDO} | cambios_de_consumo('Rack', CONSUMIDO, fecha))
+
+
+def restaurar(id_vino):
+    return Mutacion(PARCHEAR, id_vino, {'ubicacion': 'Rack'} | cambios_de_consumo(CONSUMIDO, 'Rack'))
+
+
+def test_fecha_solo_al_entrar_o_salir_de_consumido():
+    assert cambios_de_consumo('Rack', CONSUMIDO, '2025-05-01')['fecha_consumo'] == '2025-05-01'
+    assert cambios_de_consumo('Rack', CONSUMIDO)['fecha_consumo'][:2] == '20'
+    assert cambios_de_consumo(CONSUMIDO, 'Rack') == {'fecha_consumo': None}
+    assert cambios_de_consumo(CONSUMIDO, CONSUMIDO) == {}
+    assert cambios_de_consumo('Rack', 'Cava Eléctrica') == {}
+
+
+def test_agregados_del_historial(inventario):
+    assert inventario.indice('consumo').resumen() == {
+        'total': 4,
+        'puntos_promedio': 8.0,  # La de 0 puntos no cuenta
+        'a_tiempo': 2,  # Enemigo y Aluvional; Nicasia se bebió en 2025 con límite 2024
+        'tarde': 1,
+        'sin_fecha': 1,
+        'por_mes': {'2025-01': 2, '2025-03': 1},
+        'por_uva': {'Malbec': 3, 'Blend': 1},
+        'por_bodega': {'Catena Zapata': 1, 'El Enemigo': 1, 'Zuccardi': 1, 'Norton': 1},
+    }
+
+
+def test_incremental_igual_a_reconstruir(inventario):
+    indice = inventario.indice('consumo')
+    inventario.aplicar([
+        consumir(3, '2025-03-15T20:00:00'),
+        restaurar(1),
+        Mutacion(BORRAR, 5, {}),
+        Mutacion(AGREGAR, 6, {'nombre': 'Cheval des Andes', 'bodega': 'Terrazas', 'uva_principal': 'Blend',
+                              'ubicacion': CONSUMIDO, 'fecha_consumo': '2024-12-24T22:00:00',
+                              'anio_limite': 2030, 'puntuacion': 9}),
+        # Cambiar el puntaje de una consumida mueve el promedio
+        Mutacion(PARCHEAR, 2, {'puntuacion': 9}),
+    ])
+    assert inventario.indice('consumo') is indice
+    resumen = indice.resumen()
+    assert resumen == IndiceConsumo().construir(inventario.obtener().df).resumen()
+    assert resumen['total'] == 4
+    assert resumen['por_mes'] == {'2024-12': 1, '2025-01': 1, '2025-03': 2}
+    assert resumen['por_uva'] == {'Blend': 3, 'Malbec': 1}
+    assert resumen['sin_fecha'] == 0
+    assert resumen['puntos_promedio'] == 9.0
+
+
+def test_restaurar_todo_vacia_los_agregados(inventario):
+    inventario.aplicar([restaurar(i) for i in (1, 2, 4, 5)])
+    resumen = inventario.indice('consumo').resumen()
+    assert resumen == IndiceConsumo().construir(inventario.obtener().df).resumen()
+    assert resumen['total'] == 0 and resumen['puntos_promedio'] is None
+    assert resumen['por_mes'] == resumen['por_uva'] == resumen['por_bodega'] == {}
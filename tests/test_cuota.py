@@ -0,0 +1,135 @@
+"""Cubeta de tokens y reintentos del `LimitadorCuota` con reloj y sueño simulados."""
+import json
+
+import pytest
+import requests
+from gspread.exceptions import APIError
+
+import cuota
+from cuota import ESCRITURA, LECTURA, CubetaTokens, ErrorHttp, LimitadorCuota, codigo_http
+
+
+class Reloj:
+    """Reloj monótono falso: `dormir` lo adelanta en vez de esperar."""
+    def __init__(self):
+        self.ahora = 0.0
+        self.siestas = []
+
+    def __call__(self):
+        return self.ahora
+
+    def dormir(self, segundos):
+        self.siestas.append(segundos)
+        self.ahora += segundos
+
+
+def error_api(codigo, retry_after=None):
+    respuesta = requests.Response()
+    respuesta.status_code = codigo
+    respuesta._content = json.dumps({'error': {'code': codigo, 'message': 'Quota exceeded'}}).encode()
+    if retry_after is not None:
+        respuesta.headers['Retry-After'] = str(retry_after)
+    return APIError(respuesta)
+
+
+def fallar(*errores, resultado='ok'):
+    """Función que lanza `errores` en orden y después devuelve `resultado`."""
+    pendientes = list(errores)
+    def funcion():
+        if pendientes:
+            raise pendientes.pop(0)
+        return resultado
+    return funcion
+
+
+@pytest.fixture
+def reloj():
+    return Reloj()
+
+
+@pytest.fixture(autouse=True)
+def jitter_maximo(monkeypatch):
+    # Sin azar: el jitter siempre toma el tope del intervalo
+    monkeypatch.setattr(cuota.random, 'uniform', lambda a, b: b)
+
+
+def limitador(reloj, **kwargs):
+    return LimitadorCuota(dormir=reloj.dormir, reloj=reloj, **kwargs)
+
+
+def test_cubeta_rafaga_y_cola(reloj):
+    cubeta = CubetaTokens(3, por_segundo=2, reloj=reloj)
+    assert [cubeta.reservar() for _ in range(5)] == [0, 0, 0, 0.5, 1.0]
+
+
+def test_cubeta_se_repone_hasta_su_capacidad(reloj):
+    cubeta = CubetaTokens(2, por_segundo=1, reloj=reloj)
+    cubeta.reservar(), cubeta.reservar(), cubeta.reservar()
+    reloj.ahora += 0.5
+    assert cubeta.reservar() == 1.5  # Aún debe el token de la reserva anterior
+    reloj.ahora += 60
+    assert [cubeta.reservar() for _ in range(3)] == [0, 0, 1.0]
+
+
+def test_codigo_http_de_cada_tipo_de_error():
+    assert codigo_http(error_api(429)) == 429
+    assert codigo_http(ErrorHttp(503)) == 503
+    assert codigo_http(ValueError('x')) is None
+
+
+def test_espacia_las_llamadas_fuera_de_la_rafaga(reloj):
+    lim = limitador(reloj, por_minuto=60, rafaga=2)
+    for _ in range(4):
+        lim.llamar(LECTURA, fallar())
+    assert reloj.siestas == [1.0, 1.0]
+    # Lecturas y escrituras tienen cubetas separadas
+    lim.llamar(ESCRITURA, fallar())
+    assert reloj.siestas == [1.0, 1.0]
+    assert lim.estadisticas() == {
+        'llamadas': 5, 'demoradas': 2, 'reintentadas': 0, 'fallidas': 0, 'segundos_espera': 2.0,
+    }
+
+
+def test_reintenta_429_con_backoff_exponencial(reloj):
+    lim = limitador(reloj, rafaga=10, espera_base=1.0)
+    funcion = fallar(error_api(429), error_api(429), error_api(503))
+    assert lim.llamar(ESCRITURA, funcion) == 'ok'
+    assert reloj.siestas == [1.0, 2.0, 4.0]
+    stats = lim.estadisticas()
+    assert (stats['llamadas'], stats['reintentadas'], stats['fallidas']) == (4, 3, 0)
+
+
+def test_backoff_tiene_tope(reloj):
+    lim = limitador(reloj, rafaga=10, reintentos=6, espera_maxima=5.0)
+    lim.llamar(LECTURA, fallar(*[error_api(429)] * 6))
+    assert reloj.siestas == [1.0, 2.0, 4.0, 5.0, 5.0, 5.0]
+
+
+def test_respeta_retry_after(reloj):
+    lim = limitador(reloj, rafaga=10, espera_maxima=30.0)
+    lim.llamar(LECTURA, fallar(error_api(429, retry_after=7), error_api(429, retry_after=120)))
+    assert reloj.siestas == [7.0, 30.0]
+
+
+def test_agota_los_reintentos(reloj):
+    lim = limitador(reloj, rafaga=10, reintentos=2)
+    with pytest.raises(APIError):
+        lim.llamar(ESCRITURA, fallar(*[error_api(429)] * 3))
+    assert reloj.siestas == [1.0, 2.0]
+    stats = lim.estadisticas()
+    assert (stats['llamadas'], stats['reintentadas'], stats['fallidas']) == (3, 2, 1)
+
+
+@pytest.mark.parametrize('error', [error_api(403), error_api(400), KeyError('id')])
+def test_no_reintenta_errores_definitivos(reloj, error):
+    lim = limitador(reloj)
+    with pytest.raises(type(error)):
+        lim.llamar(ESCRITURA, fallar(error))
+    assert reloj.siestas == []
+    assert lim.estadisticas()['fallidas'] == 1
+
+
+def test_reintenta_errores_de_red(reloj):
+    lim = limitador(reloj)
+    assert lim.llamar(LECTURA, fallar(requests.ConnectionError(), requests.Timeout())) == 'ok'
+    assert lim.estadisticas()['reintentadas'] == 2
@@ -0,0 +1,117 @@
+"""`EscritorDiferido`: lotes por ráfaga, estado `ocupado` y bloqueo de bajas."""
+import threading
+
+import pandas as pd
+import pytest
+
+from almacen import AGREGAR, BORRAR, PARCHEAR, BloqueoSeguridad, HojaEnMemoria, Mutacion
+from cuota import ErrorHttp
+from escritor import ERROR, OK, PENDIENTE, EscritorDiferido
+from inventario import Inventario
+
+
+class HojaFrenada(HojaEnMemoria):
+    """Las escrituras esperan a `soltar` para poder ver el escritor a mitad de un lote."""
+    def __init__(self, df):
+        super().__init__(df)
+        self.soltar = threading.Event()
+        self.escribiendo = threading.Event()
+
+    def agregar(self, filas):
+        self.escribiendo.set()
+        assert self.soltar.wait(5)
+        super().agregar(filas)
+
+
+def vinos():
+    return pd.DataFrame({
+        'id': [1, 2, 3],
+        'nombre': ['Nicasia', 'Gran Enemigo', 'Cheval des Andes'],
+        'bodega': ['Catena Zapata', 'El Enemigo', 'Terrazas'],
+        'anada': [2021, 2019, 2018],
+        'ubicacion': ['Cava Eléctrica', 'Rack', 'Rack'],
+    })
+
+
+def alta(id_vino, nombre='Nuevo'):
+    return Mutacion(AGREGAR, id_vino, {'nombre': nombre, 'bodega': 'X', 'anada': 2020, 'ubicacion': 'Rack'})
+
+
+@pytest.fixture
+def hoja():
+    return HojaEnMemoria(vinos())
+
+
+def escritor_de(hoja, espera=0.05):
+    inventario = Inventario(hoja.leer)
+    inventario.obtener()
+    return EscritorDiferido(hoja, inventario, espera=espera), inventario
+
+
+def test_rafaga_en_un_solo_lote(hoja):
+    escritor, inventario = escritor_de(hoja, espera=0.3)
+    tickets = [
+        escritor.enviar([alta(4)]),
+        escritor.enviar([alta(5), Mutacion(PARCHEAR, 1, {'ubicacion': 'Consumido'})]),
+        escritor.enviar([Mutacion(PARCHEAR, 2, {'ubicacion': 'Consumido'})]),
+    ]
+    assert escritor.esperar(5)
+    assert [escritor.estado(t) for t in tickets] == [(OK, '')] * 3
+    # Una escritura por tipo y un solo sello para las tres llamadas
+    escrituras = [l for l in hoja.llamadas if l[0] in ('agregar', 'parchear', 'borrar')]
+    assert escrituras == [('agregar', 2), ('parchear', 2)]
+    assert hoja.meta[0] == 1
+    assert sorted(hoja.df['id']) == [1, 2, 3, 4, 5]
+    # La instantánea queda con la revisión que se escribió
+    assert inventario.obtener().fila(4)['revision'] == 1
+
+
+def test_ocupado_mientras_hay_algo_sin_escribir():
+    hoja = HojaFrenada(vinos())
+    escritor, inventario = escritor_de(hoja)
+    assert not escritor.ocupado
+
+    ticket = escritor.enviar([alta(4, 'Angélica Zapata')])
+    # En memoria se ve en el acto, antes de llegar a la hoja
+    assert inventario.obtener().fila(4)['nombre'] == 'Angélica Zapata'
+    assert escritor.ocupado
+    assert hoja.escribiendo.wait(5)
+    assert escritor.ocupado and escritor.estado(ticket) == (PENDIENTE, '')
+    assert not escritor.esperar(0.05)
+
+    hoja.soltar.set()
+    assert escritor.esperar(5)
+    assert not escritor.ocupado
+    assert escritor.estado(ticket) == (OK, '')
+
+
+def test_error_invalida_la_instantanea(hoja):
+    escritor, inventario = escritor_de(hoja)
+    hoja.errores = [ErrorHttp(400, 'rango inválido')]
+    ticket = escritor.enviar([alta(4)])
+    assert escritor.esperar(5)
+    assert escritor.estado(ticket) == (ERROR, 'rango inválido')
+    # Se vuelve a leer la hoja: el alta que no llegó desaparece
+    assert inventario.obtener().fila(4) is None
+
+
+def test_no_deja_la_hoja_vacia(hoja):
+    escritor, inventario = escritor_de(hoja)
+    version = inventario.version
+    with pytest.raises(BloqueoSeguridad):
+        escritor.enviar([Mutacion(BORRAR, i, {}) for i in (1, 2, 3)])
+    # Nada se aplicó ni se encoló
+    assert inventario.version == version
+    assert not escritor.ocupado
+    assert len(hoja.df) == 3
+
+
+def test_bajas_parciales_y_con_altas(hoja):
+    escritor, inventario = escritor_de(hoja)
+    escritor.enviar([Mutacion(BORRAR, i, {}) for i in (1, 2)])
+    assert escritor.esperar(5)
+    assert hoja.df['id'].tolist() == [3]
+    # Borrar la última se bloquea aunque el lote agregue otra
+    with pytest.raises(BloqueoSeguridad):
+        escritor.enviar([alta(4), Mutacion(BORRAR, 3, {})])
+    assert inventario.obtener().fila(4) is None
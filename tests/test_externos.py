@@ -0,0 +1,97 @@
+"""`ClienteWeb` sin red (`ClienteLocal`) con su caché en disco."""
+import io
+
+import pytest
+from PIL import Image
+
+import cache_disco
+import externos
+from cache_disco import CacheDisco
+from externos import ClienteLocal
+
+
+def png(color='red'):
+    salida = io.BytesIO()
+    Image.new('RGB', (4, 4), color).save(salida, format='PNG')
+    return salida.getvalue()
+
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 1_000_000.0
+
+    def time(self):
+        return self.ahora
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(cache_disco, 'time', reloj)
+    return reloj
+
+
+@pytest.fixture
+def cliente(reloj):
+    cliente = ClienteLocal(
+        busquedas={
+            'Catena Zapata Malbec': [
+                {'image': 'http://a/1.png'}, {'image': 'http://a/2.html'},
+                {'image': 'http://a/1.png'}, {'image': 'http://a/404.png'},
+            ],
+            'enologo Catena Zapata': [{'body': 'Alejandro Vigil'}],
+        },
+        archivos={
+            'http://a/1.png': (png(), 'image/png'),
+            'http://a/2.html': (b'<html>', 'text/html'),
+        },
+        cache=CacheDisco(':memory:'),
+    )
+    yield cliente
+    cliente._pool.shutdown()
+
+
+def test_busqueda_repetida_sale_de_la_cache(cliente):
+    assert cliente.buscar_texto('enologo Catena Zapata') == ['Alejandro Vigil']
+    # Misma consulta salvo mayúsculas/acentos/espacios: misma clave
+    assert cliente.buscar_texto('  Enólogo CATENA zapata ') == ['Alejandro Vigil']
+    assert cliente.llamadas == [('text', 'enologo Catena Zapata')]
+    assert cliente.cache.estadisticas()['aciertos'] == 1
+
+
+def test_busqueda_vacia_vence_pronto(cliente, reloj):
+    assert cliente.buscar_texto('vino inexistente') == []
+    assert cliente.buscar_texto('vino inexistente') == []
+    assert cliente.llamadas == [('text', 'vino inexistente')]
+    reloj.ahora += externos.TTL_VACIOS + 1
+    cliente.buscar_texto('vino inexistente')
+    assert len(cliente.llamadas) == 2
+
+
+def test_resultados_duran_una_semana(cliente, reloj):
+    cliente.buscar_texto('enologo Catena Zapata')
+    reloj.ahora += externos.TTL_VACIOS + 1
+    cliente.buscar_texto('enologo Catena Zapata')
+    assert len(cliente.llamadas) == 1
+    reloj.ahora += externos.TTL_BUSQUEDAS
+    cliente.buscar_texto('enologo Catena Zapata')
+    assert len(cliente.llamadas) == 2
+
+
+def test_candidatas_validas_en_orden(cliente):
+    candidatas = cliente.buscar_candidatas('Catena Zapata Malbec')
+    assert [(c.url, c.mime) for c in candidatas] == [('http://a/1.png', 'image/png')]
+    # Sin duplicados: cada URL se pidió una sola vez
+    descargas = sorted(u for m, u in cliente.llamadas if m == 'descargar')
+    assert descargas == ['http://a/1.png', 'http://a/2.html', 'http://a/404.png']
+
+
+def test_descargas_fallidas_no_se_cachean(cliente):
+    resultados = cliente.descargar_varias({'ok': 'http://a/1.png', 'falta': 'http://a/404.png'})
+    assert resultados['ok'][0].blob == png() and resultados['ok'][1] == ''
+    assert resultados['falta'][0] is None and 'HTTPError' in resultados['falta'][1]
+
+    cliente.descargar_varias({'ok': 'http://a/1.png', 'falta': 'http://a/404.png'})
+    descargas = [u for m, u in cliente.llamadas if m == 'descargar']
+    assert descargas.count('http://a/1.png') == 1
+    assert descargas.count('http://a/404.png') == 2
@@ -0,0 +1,96 @@
+"""URLs de las miniaturas (static serving o servidor propio) y pool de procesos reutilizable."""
+import io
+import urllib.error
+import urllib.request
+
+import pytest
+from PIL import Image
+
+import imagenes
+from imagenes import (
+    CACHE_INMUTABLE, AlmacenImagenes, PoolImagenes, hash_de, iniciar_servidor_miniaturas, procesar_lote,
+    url_estatica,
+)
+
+
+@pytest.fixture
+def almacen(tmp_path):
+    return AlmacenImagenes(tmp_path)
+
+
+@pytest.fixture
+def servidor(almacen):
+    servidor = iniciar_servidor_miniaturas(almacen, 0)
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
+
+
+def png(color):
+    salida = io.BytesIO()
+    Image.new('RGB', (20, 20), color).save(salida, format='PNG')
+    return salida.getvalue()
+
+
+def pedir(servidor, ruta, **cabeceras):
+    host, puerto = servidor.server_address
+    return urllib.request.urlopen(urllib.request.Request(f"http://{host}:{puerto}{ruta}", headers=cabeceras))
+
+
+def test_escucha_solo_en_localhost(servidor):
+    assert servidor.server_address[0] == '127.0.0.1'
+
+
+def test_miniatura_inmutable_sin_cors(servidor, almacen):
+    h = almacen.guardar(png('red'))
+    ruta = f"/{h[:2]}/{h}_mini.jpg"
+
+    with pedir(servidor, ruta) as r:
+        assert r.headers['Cache-Control'] == CACHE_INMUTABLE
+        assert r.headers['Content-Type'] == 'image/jpeg'
+        assert 'Access-Control-Allow-Origin' not in r.headers
+        assert r.read() == almacen.leer(h)
+
+    with pytest.raises(urllib.error.HTTPError) as e:
+        pedir(servidor, ruta, **{'If-None-Match': f'"{h}_mini"'})
+    assert e.value.code == 304
+    assert e.value.headers['Cache-Control'] == CACHE_INMUTABLE
+
+
+@pytest.mark.parametrize('ruta', ['/ab/abc_enorme.jpg', '/zz/ab12_mini.jpg', '/../secreto', '/ab/ab12_mini.jpg'])
+def test_rutas_invalidas_o_inexistentes(servidor, ruta):
+    with pytest.raises(urllib.error.HTTPError) as e:
+        pedir(servidor, ruta)
+    assert e.value.code == 404
+
+
+def test_url_estatica_solo_dentro_de_static(tmp_path):
+    estatico = tmp_path / 'static'
+    assert url_estatica(estatico / 'imagenes', estatico) == 'app/static/imagenes'
+    assert url_estatica(estatico / 'fotos' / 'v2', estatico) == 'app/static/fotos/v2'
+    # Un volumen persistente fuera de static/ no tiene URL: van data URIs
+    assert url_estatica(tmp_path / 'volumen', estatico) is None
+    assert url_estatica(estatico / '..' / 'otro', estatico) is None
+
+
+def test_pool_compartido_se_levanta_una_vez(almacen, monkeypatch):
+    monkeypatch.setattr(imagenes, 'MINIMO_POOL_NUEVO', 6)
+    pool = PoolImagenes(procesos=2)
+    colores = ['red', 'green', 'blue', 'white', 'black', 'yellow', 'navy', 'olive']
+    try:
+        # Lote chico sin pool en marcha: en el mismo proceso, sin levantarlo
+        procesar_lote(almacen, [(c, png(c)) for c in colores[:5]], pool=pool)
+        assert not pool.activo
+
+        resultados = procesar_lote(almacen, [(c, png(c)) for c in colores[:6]], pool=pool)
+        assert [r.hash for r in resultados] == [hash_de(png(c)) for c in colores[:6]]
+        ejecutor = pool.ejecutor()
+
+        # Ya levantado, los lotes chicos también lo usan (el mismo)
+        resultados = procesar_lote(almacen, [(c, png(c)) for c in colores[4:]], pool=pool)
+        assert pool.ejecutor() is ejecutor
+        assert not any(r.error for r in resultados)
+        assert all(almacen.existe(hash_de(png(c))) for c in colores)
+    finally:
+        pool.cerrar(esperar=True)
+    assert not pool.activo
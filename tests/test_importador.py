@@ -0,0 +1,182 @@
+"""Importación de planillas: alias, conversión de tipos, lotes y vinos repetidos."""
+import io
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from almacen import AGREGAR, PARCHEAR, SecuenciaIds
+from importador import (
+    DUPLICAR, FUSIONAR, OMITIR, POR_DEFECTO, importar, leer_en_lotes, normalizar_lote,
+    resolver_columnas,
+)
+from inventario import IndiceHuellas
+
+CSV = """Nombre,Winery,Vintage,Uva,Enologo,Puntos
+Gran Enemigo,El Enemigo,2019,Cabernet Franc,,9
+Malbec Argentino,Catena Zapata,2020,Malbec,Alejandro Vigil,10
+Corte,Zuccardi,2018,Malbec / Cabernet,,
+Sin año,Norton,abc,Malbec,,7.8
+Nicasia,Catena Zapata,2021,Malbec,,8
+"""
+
+
+def csv(texto=CSV):
+    return io.StringIO(texto)
+
+
+def xlsx(filas):
+    libro = Workbook()
+    for fila in filas:
+        libro.active.append(fila)
+    salida = io.BytesIO()
+    libro.save(salida)
+    salida.seek(0)
+    return salida
+
+
+def normalizar(df):
+    df = df.rename(columns=str.lower)
+    return normalizar_lote(df, resolver_columnas(df.columns))
+
+
+@pytest.fixture
+def existentes():
+    return pd.DataFrame({
+        'id': [1, 2],
+        'nombre': ['Malbec Argentino', 'Otro'],
+        'bodega': ['Catena Zapata', 'Norton'],
+        'anada': [2020, 2015],
+        'enologo': ['', 'Jorge Riccitelli'],
+        'gama': ['Ícono', ''],
+        'procedencia': ['', ''],
+        'detalle': ['', ''],
+        'composicion_blend': ['', ''],
+    })
+
+
+def fila_de(existentes):
+    return lambda i: existentes.set_index('id').loc[i].to_dict()
+
+
+# --- ALIAS Y TIPOS ---
+def test_alias_en_orden_de_prioridad():
+    resueltas = resolver_columnas(['name', 'nombre', 'tipo', 'uva', 'otra'])
+    assert resueltas['nombre'] == ['nombre', 'name']
+    assert resueltas['variedad'] == ['uva', 'tipo']
+    assert resueltas['bodega'] == []
+    # Si la columna prioritaria está vacía se usa la siguiente
+    salida = normalizar(pd.DataFrame({'nombre': [None, 'A'], 'name': ['B', 'C']}))
+    assert salida['nombre'].tolist() == ['B', 'A']
+
+
+def test_conversion_de_tipos_y_valores_por_defecto():
+    salida = normalizar(pd.read_csv(csv(), dtype=str))
+    assert salida['anada'].tolist() == [2019, 2020, 2018, POR_DEFECTO['anada'], 2021]
+    # Decimales truncados; vacíos con el valor por defecto
+    assert salida['puntuacion'].tolist() == [9, 10, POR_DEFECTO['puntuacion'], 7, 8]
+    assert salida['anio_limite'].eq(POR_DEFECTO['anio_limite']).all()
+    assert salida['enologo'].tolist() == ['', 'Alejandro Vigil', '', '', '']
+    assert salida['ubicacion'].eq('Por Clasificar').all()
+
+
+def test_cortes_y_texto_limpio():
+    salida = normalizar(pd.DataFrame({
+        'nombre': ['  Corte  ', 'Varietal'],
+        'variedad': ['Malbec / Cabernet', ' Syrah '],
+        'anada': [2018.0, '2020'],
+    }))
+    assert salida['nombre'].tolist() == ['Corte', 'Varietal']
+    assert salida['uva_principal'].tolist() == ['Blend', 'Syrah']
+    assert salida['composicion_blend'].tolist() == ['Malbec / Cabernet', '']
+    assert salida['anada'].tolist() == [2018, 2020]
+
+
+def test_descarta_filas_vacias():
+    salida = normalizar(pd.DataFrame({'nombre': ['A', None, 'B'], 'bodega': [None, None, 'X']}))
+    assert salida.index.tolist() == [0, 2]
+    assert salida['bodega'].tolist() == [POR_DEFECTO['bodega'], 'X']
+
+
+# --- LECTURA POR LOTES ---
+def test_csv_por_lotes():
+    lotes = list(leer_en_lotes(csv(), 'vinos.csv', tam_lote=2))
+    assert [len(lote) for lote in lotes] == [2, 2, 1]
+    assert list(lotes[0].columns) == ['nombre', 'winery', 'vintage', 'uva', 'enologo', 'puntos']
+
+
+def test_xlsx_por_lotes():
+    archivo = xlsx([
+        ['Nombre', 'Bodega', 'Añada'],
+        ['A', 'X', 2019],
+        [None, None, None],
+        ['B', 'Y', 2020],
+    ])
+    lotes = list(leer_en_lotes(archivo, 'vinos.xlsx', tam_lote=2))
+    assert [len(lote) for lote in lotes] == [2, 1]
+    assert list(lotes[0].columns) == ['nombre', 'bodega', 'añada']
+
+
+def test_importar_ids_consecutivos_y_progreso():
+    avance = []
+    mutaciones, resumen = importar(csv(), 'vinos.csv', SecuenciaIds(100), tam_lote=2,
+                                   progreso=avance.append)
+    assert avance == [2, 4, 5]
+    assert [m.tipo for m in mutaciones] == [AGREGAR] * 5
+    assert [m.id for m in mutaciones] == [101, 102, 103, 104, 105]
+    assert resumen['nuevos'] == 5
+    # `imagen_url` no llega a la hoja
+    assert all('imagen_url' not in m.cambios for m in mutaciones)
+
+
+def test_importar_xlsx_igual_que_csv():
+    filas = pd.read_csv(csv(), dtype=str)
+    archivo = xlsx([list(filas.columns)] + filas.where(filas.notna(), None).values.tolist())
+    desde_csv, _ = importar(csv(), 'vinos.csv', SecuenciaIds(), tam_lote=2)
+    desde_xlsx, _ = importar(archivo, 'vinos.xlsx', SecuenciaIds(), tam_lote=2)
+    assert [m.cambios for m in desde_xlsx] == [m.cambios for m in desde_csv]
+
+
+# --- VINOS REPETIDOS ---
+def test_omitir(existentes):
+    mutaciones, resumen = importar(csv(), 'vinos.csv', SecuenciaIds(2), tam_lote=2,
+                                   indice_huellas=IndiceHuellas().construir(existentes),
+                                   modo_duplicados=OMITIR)
+    assert (resumen['nuevos'], resumen['omitidos'], resumen['fusionados']) == (4, 1, 0)
+    assert 'Malbec Argentino' not in [m.cambios['nombre'] for m in mutaciones]
+    assert [m.id for m in mutaciones] == [3, 4, 5, 6]
+
+
+def test_fusionar_completa_solo_campos_vacios(existentes):
+    mutaciones, resumen = importar(csv(), 'vinos.csv', SecuenciaIds(2), tam_lote=2,
+                                   indice_huellas=IndiceHuellas().construir(existentes),
+                                   modo_duplicados=FUSIONAR, fila_existente=fila_de(existentes))
+    assert (resumen['nuevos'], resumen['omitidos'], resumen['fusionados']) == (4, 0, 1)
+    (parche,) = [m for m in mutaciones if m.tipo == PARCHEAR]
+    # El enólogo faltaba; la gama ya estaba cargada y no se pisa
+    assert (parche.id, parche.cambios) == (1, {'enologo': 'Alejandro Vigil'})
+
+
+def test_fusionar_sin_nada_que_completar_no_genera_parche(existentes):
+    existentes.at[0, 'enologo'] = 'Otro enólogo'
+    mutaciones, resumen = importar(csv(), 'vinos.csv', SecuenciaIds(2),
+                                   indice_huellas=IndiceHuellas().construir(existentes),
+                                   modo_duplicados=FUSIONAR, fila_existente=fila_de(existentes))
+    assert resumen['fusionados'] == 1
+    assert all(m.tipo == AGREGAR for m in mutaciones)
+
+
+def test_duplicar(existentes):
+    mutaciones, resumen = importar(csv(), 'vinos.csv', SecuenciaIds(2),
+                                   indice_huellas=IndiceHuellas().construir(existentes),
+                                   modo_duplicados=DUPLICAR)
+    assert (resumen['nuevos'], resumen['omitidos'], resumen['fusionados']) == (5, 0, 0)
+    assert [m.cambios['nombre'] for m in mutaciones].count('Malbec Argentino') == 1
+
+
+def test_repetidos_con_otra_escritura(existentes):
+    # Mayúsculas, acentos y espacios no cuentan para la huella
+    texto = "nombre,bodega,anada\n  MALBEC argentino ,Catena  Zapata,2020.0\n"
+    _, resumen = importar(csv(texto), 'vinos.csv', SecuenciaIds(2),
+                          indice_huellas=IndiceHuellas().construir(existentes))
+    assert (resumen['nuevos'], resumen['omitidos']) == (0, 1)
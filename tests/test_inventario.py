@@ -0,0 +1,81 @@
+"""Migración de las fotos legado (Hex en `imagen_data`) al almacén de imágenes."""
+import io
+import shutil
+
+import pandas as pd
+import pytest
+from PIL import Image
+
+from almacen import PARCHEAR
+from imagenes import AlmacenImagenes, hash_de
+from inventario import migrar_imagenes_legado
+
+
+def foto(color):
+    salida = io.BytesIO()
+    Image.new('RGB', (8, 8), color).save(salida, format='PNG')
+    return salida.getvalue()
+
+
+@pytest.fixture
+def imagenes(tmp_path):
+    return AlmacenImagenes(tmp_path / 'imagenes')
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({
+        'id': [1, 2, 3],
+        'nombre': ['Con foto', 'Sin foto', 'Hex roto'],
+        'imagen_data': [foto('red').hex(), '', 'zz'],
+        'imagen_hash': [None, None, None],
+    })
+
+
+def test_por_defecto_conserva_el_hex(df, imagenes):
+    h = hash_de(foto('red'))
+    (parche,) = migrar_imagenes_legado(df, imagenes)
+    assert (parche.tipo, parche.id) == (PARCHEAR, 1)
+    assert parche.cambios == {'imagen_hash': h, 'tipo_imagen': 'image/jpeg'}
+    assert df['imagen_hash'].tolist() == [h, None, None]
+    assert imagenes.existe(h)
+
+
+def test_ya_migrada_no_genera_parches(df, imagenes):
+    migrar_imagenes_legado(df, imagenes)
+    assert migrar_imagenes_legado(df, imagenes) == []
+
+
+def test_tras_un_redeploy_se_regenera_desde_el_hex(df, imagenes):
+    migrar_imagenes_legado(df, imagenes)
+    h = df.at[0, 'imagen_hash']
+    shutil.rmtree(imagenes.raiz)  # static/ no sobrevive al redeploy
+    assert migrar_imagenes_legado(df, imagenes) == []
+    assert imagenes.existe(h)
+
+
+def test_vaciar_borra_el_hex_de_la_hoja(df, imagenes):
+    (parche,) = migrar_imagenes_legado(df, imagenes, vaciar=True)
+    assert parche.cambios['imagen_data'] == ''
+    assert parche.cambios['imagen_hash'] == hash_de(foto('red'))
+
+
+def test_copia_de_la_app_restaura_su_hash(df, imagenes):
+    # Foto nueva desde la app: hash del original, en la hoja su miniatura
+    h = imagenes.guardar(foto('blue'))
+    copia = imagenes.copia_hex(h)
+    df.at[0, 'imagen_hash'] = h
+    df.at[0, 'imagen_data'] = copia
+    shutil.rmtree(imagenes.raiz)
+    assert migrar_imagenes_legado(df, imagenes) == []
+    assert df.at[0, 'imagen_hash'] == h
+    assert all(imagenes.existe(h, t) for t in ('original', 'medio', 'mini'))
+    # Con almacén persistente la copia se borra de la hoja
+    (parche,) = migrar_imagenes_legado(df, imagenes, vaciar=True)
+    assert parche.cambios == {'imagen_data': ''}
+
+
+def test_copia_hex_respeta_el_limite_de_la_celda(imagenes):
+    h = imagenes.guardar(foto('green'))
+    assert bytes.fromhex(imagenes.copia_hex(h)) == imagenes.leer(h, 'mini')
+    assert imagenes.copia_hex('0' * 64) is None
@@ -0,0 +1,91 @@
+"""Paginado en el servidor: búsqueda, orden estable, límites de página y selección por id."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from almacen import PARCHEAR, Mutacion
+from inventario import Inventario
+from paginado import filtrar_texto, ordenar, pagina, reubicar_seleccion, texto_busqueda
+
+
+def vinos():
+    return pd.DataFrame({
+        'id': [1, 2, 3, 4, 5, 6, 7],
+        'nombre': ['Nicasia', 'Gran Enemigo', 'Aluvional', 'Angélica Zapata', 'Corte', 'Otro', 'Último'],
+        'bodega': ['Catena Zapata', 'El Enemigo', 'Zuccardi', 'Catena Zapata', None, 'Zuccardi', 'Norton'],
+        'anada': [2021, 2019, 2019, 2018, 2020, 2019, 2022],
+        'puntuacion': [8.0, 9.0, np.nan, 8.0, 9.0, np.nan, 7.0],
+    })
+
+
+def ids(df):
+    return df['id'].tolist()
+
+
+@pytest.fixture
+def df():
+    return vinos()
+
+
+@pytest.mark.parametrize('numero, esperado', [(1, [1, 2, 3]), (3, [7]), (0, [1, 2, 3]), (99, [7]), (-5, [1, 2, 3])])
+def test_limites_de_pagina(df, numero, esperado):
+    filas, numero_real, total = pagina(df, numero, 3)
+    assert ids(filas) == esperado
+    assert total == 3
+    assert 1 <= numero_real <= total
+
+
+def test_pagina_exacta_y_vacia(df):
+    assert pagina(df, 2, 7)[1:] == (1, 1)
+    assert pagina(df.iloc[:6], 2, 3)[1:] == (2, 2)
+    filas, numero, total = pagina(df.iloc[:0], 4, 25)
+    assert filas.empty and (numero, total) == (1, 1)
+
+
+def test_orden_estable_y_vacios_al_final(df):
+    # A igual añada se mantiene el orden de la hoja, en los dos sentidos
+    assert ids(ordenar(df, 'anada')) == [4, 2, 3, 6, 5, 1, 7]
+    assert ids(ordenar(df, 'anada', descendente=True)) == [7, 1, 5, 2, 3, 6, 4]
+    assert ids(ordenar(df, 'puntuacion')) == [7, 1, 4, 2, 5, 3, 6]
+    assert ids(ordenar(df, 'puntuacion', descendente=True)) == [2, 5, 1, 4, 7, 3, 6]
+    # Sin columna (o una que no existe) queda como está
+    assert ids(ordenar(df, None)) == ids(ordenar(df, 'no_existe')) == ids(df)
+
+
+def test_orden_de_categorias_alfabetico(df):
+    df['bodega'] = df['bodega'].astype('category')
+    # Categoría agregada en caliente (queda al final de las categorías)
+    df['bodega'] = df['bodega'].cat.add_categories(['Achaval Ferrer'])
+    df.loc[6, 'bodega'] = 'Achaval Ferrer'
+    assert ids(ordenar(df, 'bodega')) == [7, 1, 4, 2, 3, 6, 5]
+    assert ids(ordenar(df, 'bodega', descendente=True)) == [3, 6, 2, 1, 4, 7, 5]
+
+
+def test_ordenar_un_subconjunto_filtrado(df):
+    texto = texto_busqueda(df)
+    vista = ordenar(filtrar_texto(df, 'zapata', texto), 'anada')
+    assert ids(vista) == [4, 1]
+    assert ids(filtrar_texto(df, '  ANGELICA   catena ', texto)) == [4]
+    assert ids(filtrar_texto(df, '', texto)) == ids(df)
+    assert filtrar_texto(df, 'zapata malbec', texto).empty
+
+
+def test_seleccion_sobrevive_a_un_guardado():
+    inventario = Inventario(vinos)
+    vista = ordenar(inventario.obtener().df, 'anada')
+    filas, _, _ = pagina(vista, 1, 4)
+    # Se seleccionan la 2ª y 4ª fila de la página y se guardan como ids
+    seleccion = ids(filas.iloc[[1, 3]])
+    assert seleccion == [2, 6]
+
+    # Guardar cambia la añada de una botella: las filas se mueven
+    inventario.aplicar([Mutacion(PARCHEAR, 4, {'anada': 2023})])
+    filas, _, _ = pagina(ordenar(inventario.obtener().df, 'anada'), 1, 4)
+    assert ids(filas) == [2, 3, 6, 5]
+    posiciones = reubicar_seleccion(seleccion, ids(filas))
+    assert posiciones == [0, 2]
+    assert ids(filas.iloc[posiciones]) == seleccion
+
+    # Una seleccionada que ya no está en la página no se marca
+    assert reubicar_seleccion([2, 99], ids(filas)) == [0]
+    assert reubicar_seleccion([], ids(filas)) == []
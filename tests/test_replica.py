@@ -0,0 +1,219 @@
+"""Réplica local + sincronización contra `HojaEnMemoria` (sin red)."""
+import pandas as pd
+import pytest
+
+from almacen import AGREGAR, BORRAR, PARCHEAR, BloqueoSeguridad, HojaEnMemoria, Mutacion, aplicar_mutaciones
+from cuota import ErrorHttp
+from replica import ReplicaLocal, SincronizadorReplica
+
+
+@pytest.fixture
+def hoja():
+    return HojaEnMemoria(pd.DataFrame({
+        'id': [1, 2, 3, 4, 5],
+        'nombre': ['Uno', 'Dos', 'Tres', 'Cuatro', 'Cinco'],
+        'ubicacion': ['Cava Eléctrica'] * 3 + ['Por Clasificar'] * 2,
+        'uva_principal': ['Malbec', 'Malbec', 'Syrah', 'Merlot', 'Malbec'],
+        'anada': [2019, 2020, 2018, 2021, 2017],
+    }))
+
+
+@pytest.fixture
+def replica():
+    return ReplicaLocal(':memory:')
+
+
+@pytest.fixture
+def sync(replica, hoja):
+    sincronizador = SincronizadorReplica(replica, hoja, iniciar=False)
+    sincronizador.traer_inicial()
+    return sincronizador
+
+
+def nombres(df):
+    return dict(zip(df['id'].astype(int), df['nombre']))
+
+
+def test_primera_carga_trae_la_hoja(replica, sync):
+    assert replica.sincronizada
+    assert nombres(replica.leer()) == {1: 'Uno', 2: 'Dos', 3: 'Tres', 4: 'Cuatro', 5: 'Cinco'}
+    assert replica.ids_donde(ubicacion='Por Clasificar') == [4, 5]
+    assert replica.ids_donde(uva_principal='Malbec', ubicacion='Cava Eléctrica') == [1, 2]
+    with pytest.raises(ValueError):
+        replica.ids_donde(nombre='Uno')
+
+
+def test_escrituras_locales_se_envian(replica, hoja, sync):
+    aplicar_mutaciones(replica, [
+        Mutacion(AGREGAR, 6, {'nombre': 'Seis', 'ubicacion': 'Otro'}),
+        Mutacion(PARCHEAR, 1, {'nombre': 'Uno bis'}),
+        Mutacion(BORRAR, 2),
+    ])
+    assert replica.cantidad_pendientes() == 3
+    assert hoja.llamadas.count(('agregar', 1)) == 0
+
+    sync.sincronizar()
+    assert replica.cantidad_pendientes() == 0
+    assert nombres(hoja.df) == {1: 'Uno bis', 3: 'Tres', 4: 'Cuatro', 5: 'Cinco', 6: 'Seis'}
+    # La réplica guarda la revisión con que quedaron en la hoja
+    revision, _ = hoja.revision()
+    assert replica.revisiones_remotas()[6] == revision
+    assert replica.revisiones_remotas()[1] == revision
+
+
+def test_sin_conexion_la_bandeja_espera(replica, hoja, sync):
+    aplicar_mutaciones(replica, [Mutacion(PARCHEAR, 1, {'nombre': 'Sin red'})])
+    hoja.errores = [ErrorHttp(503)]
+    with pytest.raises(ErrorHttp):
+        sync.sincronizar()
+    assert replica.cantidad_pendientes() == 1
+    assert nombres(replica.leer())[1] == 'Sin red'
+    assert nombres(hoja.df)[1] == 'Uno'
+
+    sync.sincronizar()
+    assert replica.cantidad_pendientes() == 0
+    assert nombres(hoja.df)[1] == 'Sin red'
+
+
+def test_parche_remoto(replica, hoja, sync):
+    aplicar_mutaciones(hoja, [Mutacion(PARCHEAR, 3, {'nombre': 'Tres remoto'})])
+    assert sync.traer(hoja) == 1
+    assert nombres(replica.leer())[3] == 'Tres remoto'
+    # Solo se leyó la fila que cambió
+    assert ('leer_filas', 1) in hoja.llamadas
+
+
+def test_alta_remota(replica, hoja, sync):
+    aplicar_mutaciones(hoja, [Mutacion(AGREGAR, 9, {'nombre': 'Nueve', 'ubicacion': 'Otro'})])
+    sync.traer(hoja)
+    assert nombres(replica.leer())[9] == 'Nueve'
+    assert replica.ids_donde(ubicacion='Otro') == [9]
+
+
+def test_baja_remota_descarta_parches_locales(replica, hoja, sync):
+    aplicar_mutaciones(replica, [Mutacion(PARCHEAR, 4, {'nombre': 'Cuatro local'})])
+    aplicar_mutaciones(hoja, [Mutacion(BORRAR, 4)])
+
+    sync.sincronizar()
+    assert 4 not in nombres(replica.leer())
+    assert 4 not in nombres(hoja.df)
+    assert replica.cantidad_pendientes() == 0
+    assert sync.estado()['conflictos'] == 1
+
+
+def test_fusion_gana_lo_local(replica, hoja, sync):
+    aplicar_mutaciones(replica, [Mutacion(PARCHEAR, 1, {'nombre': 'Uno local'})])
+    aplicar_mutaciones(hoja, [Mutacion(PARCHEAR, 1, {'nombre': 'Uno remoto', 'anada': 2001})])
+
+    sync.sincronizar()
+    # Las celdas locales pisan a las remotas; las demás remotas se conservan
+    fila = hoja.df.set_index('id').loc[1]
+    assert fila['nombre'] == 'Uno local'
+    assert int(fila['anada']) == 2001
+    local = replica.filas([1])[1]
+    assert (local['nombre'], local['anada']) == ('Uno local', 2001)
+    assert sync.estado()['conflictos'] == 1
+
+
+def test_choque_de_ids_renumera_el_alta_local(replica, hoja, sync):
+    # Sin red se agrega la botella 6; otro cliente ya agregó otra con el mismo id
+    aplicar_mutaciones(replica, [Mutacion(AGREGAR, 6, {'nombre': 'LOCAL', 'ubicacion': 'Otro'})])
+    aplicar_mutaciones(hoja, [Mutacion(AGREGAR, 6, {'nombre': 'REMOTE', 'ubicacion': 'Cava Eléctrica'})])
+
+    sync.sincronizar()
+    en_hoja = nombres(hoja.df)
+    assert en_hoja[6] == 'REMOTE'
+    assert sorted(n for n in en_hoja.values() if n in ('LOCAL', 'REMOTE')) == ['LOCAL', 'REMOTE']
+    nuevo = next(i for i, n in en_hoja.items() if n == 'LOCAL')
+    assert nuevo > 6
+    assert nombres(replica.leer()) == en_hoja
+    assert replica.cantidad_pendientes() == 0
+
+    # El inventario recibe la botella remota en el 6 y la local con su id nuevo
+    anterior = pd.DataFrame({'id': [1, 2, 3, 4, 5, 6], 'nombre': ['x'] * 5 + ['LOCAL']})
+    cambios = {m.id: m for m in sync.cambios(anterior)}
+    assert cambios[6].tipo == PARCHEAR and cambios[6].cambios['nombre'] == 'REMOTE'
+    assert cambios[nuevo].tipo == AGREGAR and cambios[nuevo].cambios['nombre'] == 'LOCAL'
+
+
+def test_envio_cortado_no_duplica_altas(replica, hoja, sync):
+    aplicar_mutaciones(replica, [
+        Mutacion(AGREGAR, 6, {'nombre': 'Seis', 'anada': 2022}),
+        Mutacion(PARCHEAR, 1, {'nombre': 'Uno bis'}),
+    ])
+    # El alta llega a la hoja y el parche falla: se reintenta todo el lote
+    parchear = hoja._parchear
+
+    def cortar(cambios_por_id):
+        raise ErrorHttp(503)
+    hoja._parchear = cortar
+    with pytest.raises(ErrorHttp):
+        sync.sincronizar()
+    hoja._parchear = parchear
+
+    sync.sincronizar()
+    assert (hoja.df['id'].astype(int) == 6).sum() == 1
+    assert nombres(hoja.df)[1] == 'Uno bis'
+    assert replica.cantidad_pendientes() == 0
+    assert sync.estado()['conflictos'] == 0
+
+
+class RevisionVieja:
+    """La hoja vista por un cliente que leyó la revisión antes de que otro sellara."""
+    def __init__(self, hoja):
+        self.hoja = hoja
+        self.vista = hoja.revision()
+
+    def revision(self):
+        return self.vista
+
+    def __getattr__(self, nombre):
+        return getattr(self.hoja, nombre)
+
+
+def test_dos_clientes_sellan_la_misma_revision(hoja):
+    a = SincronizadorReplica(ReplicaLocal(':memory:'), hoja, iniciar=False)
+    b = SincronizadorReplica(ReplicaLocal(':memory:'), hoja, iniciar=False)
+    a.traer_inicial(), b.traer_inicial()
+    revision, _ = hoja.revision()
+
+    aplicar_mutaciones(a.replica, [Mutacion(PARCHEAR, 1, {'nombre': 'Uno de A'})])
+    aplicar_mutaciones(b.replica, [Mutacion(PARCHEAR, 2, {'nombre': 'Dos de B'})])
+    vista_b = RevisionVieja(hoja)
+    a.sincronizar()
+    a.sincronizar()  # A ya vio su propia revisión
+    # B leyó la revisión antes que A sellara: ambos sellan la misma
+    b.enviar(vista_b)
+    assert hoja.revision()[0] == revision + 1
+
+    a.sincronizar()
+    b.sincronizar()
+    assert nombres(a.replica.leer()) == nombres(b.replica.leer()) == nombres(hoja.df)
+    assert nombres(hoja.df)[1] == 'Uno de A' and nombres(hoja.df)[2] == 'Dos de B'
+
+
+def test_comparacion_periodica(replica, hoja, sync):
+    sync.sincronizar()
+    # Un cambio en la hoja que no pasó por el sello (revisión y sello iguales)
+    hoja.df.loc[hoja.df['id'] == 3, ['nombre', 'revision']] = ['Tres sin sello', 99]
+    sync.sincronizar()
+    assert nombres(replica.leer())[3] == 'Tres'
+    sync.comparacion = 0
+    sync.sincronizar()
+    assert nombres(replica.leer())[3] == 'Tres sin sello'
+
+
+def test_bloqueo_de_seguridad_local(replica, sync):
+    with pytest.raises(BloqueoSeguridad):
+        aplicar_mutaciones(replica, [Mutacion(BORRAR, i) for i in range(1, 6)])
+    assert len(replica.leer()) == 5
+
+
+def test_persiste_en_disco(tmp_path, hoja):
+    ruta = tmp_path / 'replica.sqlite'
+    SincronizadorReplica(ReplicaLocal(ruta), hoja, iniciar=False).traer_inicial()
+    aplicar_mutaciones(ReplicaLocal(ruta), [Mutacion(PARCHEAR, 2, {'nombre': 'Dos bis'})])
+
+    reabierta = ReplicaLocal(ruta)
+    assert nombres(reabierta.leer())[2] == 'Dos bis'
+    assert reabierta.cantidad_pendientes() == 1
@@ -0,0 +1,181 @@
+"""Sommelier: conteos de facetas y sorteo ponderado (reproducibilidad, distribución y orden)."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import sommelier
+from consumo import consumidos_recientes
+from sommelier import IndiceFacetas, PesosRecomendacion, puntuar, recomendar, sortear
+
+ANIO = 2025
+
+
+@pytest.fixture
+def facetas():
+    return IndiceFacetas(pd.DataFrame({
+        'id': [10, 11, 12, 13, 14, 15],
+        'nombre': ['Vencido', 'Joven', 'Sin datos', 'Top', 'Syrah', 'Otro Malbec'],
+        'uva_principal': ['Malbec', 'Malbec', 'Syrah', 'Cabernet', 'Syrah', 'Malbec'],
+        'bodega': ['Catena', 'Catena', 'Zuccardi', 'Achaval', 'Zuccardi', 'Norton'],
+        'anada': [2015, 2023, 0, 2019, 2020, 2018],
+        'anio_limite': [2024, 2035, 0, 2027, 2030, 2026],
+        'puntuacion': [7, 7, 0, 10, 6, 8],
+    }))
+
+
+def todas(facetas):
+    return np.ones(facetas.n, dtype=bool)
+
+
+def frecuencias(facetas, mascara, pesos, sorteos=4000, **opciones):
+    cuenta = np.zeros(facetas.n)
+    for semilla in range(sorteos):
+        posiciones, _ = sortear(facetas, mascara, 1, ANIO, pesos, semilla=semilla, **opciones)
+        cuenta[posiciones[0]] += 1
+    return cuenta / sorteos
+
+
+def test_misma_semilla_mismo_resultado(facetas):
+    a = sortear(facetas, todas(facetas), 3, ANIO, semilla=42)
+    b = sortear(facetas, todas(facetas), 3, ANIO, semilla=42)
+    np.testing.assert_array_equal(a[0], b[0])
+    np.testing.assert_array_equal(a[1], b[1])
+    elegidos = {tuple(sortear(facetas, todas(facetas), 3, ANIO, semilla=s)[0]) for s in range(20)}
+    assert len(elegidos) > 1
+
+
+def test_urgencia_y_puntos(facetas):
+    puntajes = puntuar(facetas, todas(facetas), ANIO, PesosRecomendacion(diversidad=0))
+    # Vencido (urgencia 1) > Joven (urgencia 0) con los mismos puntos
+    assert puntajes[0] == pytest.approx((1 + 0.7) / 2)
+    assert puntajes[1] == pytest.approx((0 + 0.7) / 2)
+    # Sin límite ni añada: urgencia neutra
+    assert puntajes[2] == pytest.approx(0.5 / 2)
+
+
+def test_diversidad_penaliza_lo_bebido_hace_poco(facetas):
+    pesos = PesosRecomendacion(urgencia=0, puntuacion=0, diversidad=1)
+    recientes = {'uva_principal': ['Malbec', 'Malbec'], 'bodega': ['Catena', 'Norton']}
+    puntajes = puntuar(facetas, todas(facetas), ANIO, pesos, recientes)
+    np.testing.assert_allclose(puntajes, [0.25, 0.25, 1, 1, 1, 0.25])
+
+
+@pytest.fixture(params=[sommelier.BLOQUE, 2], ids=['un_bloque', 'varios_bloques'])
+def bloque(request, monkeypatch):
+    monkeypatch.setattr(sommelier, 'BLOQUE', request.param)
+    return request.param
+
+
+def test_distribucion_sigue_al_puntaje(facetas, bloque):
+    pesos = PesosRecomendacion(temperatura=0.2)
+    puntajes = puntuar(facetas, todas(facetas), ANIO, pesos)
+    esperada = np.exp(puntajes / pesos.temperatura)
+    esperada /= esperada.sum()
+    np.testing.assert_allclose(frecuencias(facetas, todas(facetas), pesos), esperada, atol=0.03)
+
+
+def test_temperatura_alta_es_casi_uniforme(facetas):
+    pesos = PesosRecomendacion(temperatura=1000)
+    np.testing.assert_allclose(frecuencias(facetas, todas(facetas), pesos), 1 / facetas.n, atol=0.03)
+
+
+def test_temperatura_baja_ordena_por_puntaje(facetas, bloque):
+    pesos = PesosRecomendacion(temperatura=1e-6)
+    posiciones, puntajes = sortear(facetas, todas(facetas), facetas.n, ANIO, pesos, semilla=0)
+    assert list(puntajes) == sorted(puntajes, reverse=True)
+    assert posiciones[0] == 3  # 'Top': 10 puntos y dentro de la ventana
+
+
+def test_pesos_no_alteran_la_urgencia_cacheada(facetas):
+    pesos = PesosRecomendacion(urgencia=2, puntuacion=0, diversidad=0)
+    primera = puntuar(facetas, todas(facetas), ANIO, pesos)
+    puntuar(facetas, facetas.mascara({'uva_principal': ['Malbec']}), ANIO, PesosRecomendacion())
+    np.testing.assert_allclose(puntuar(facetas, todas(facetas), ANIO, pesos), primera)
+    # Otro año, otra urgencia
+    assert puntuar(facetas, todas(facetas), ANIO + 5, pesos)[1] > primera[1]
+
+
+def test_respeta_la_mascara_y_n(facetas, bloque):
+    mascara = facetas.mascara({'uva_principal': ['Malbec']})
+    for semilla in range(50):
+        posiciones, _ = sortear(facetas, mascara, 2, ANIO, semilla=semilla)
+        assert len(set(posiciones)) == 2
+        assert set(posiciones) <= {0, 1, 5}
+    posiciones, _ = sortear(facetas, mascara, 10, ANIO, semilla=1)
+    assert sorted(posiciones) == [0, 1, 5]
+    vacia = facetas.mascara({'uva_principal': ['Syrah'], 'bodega': ['Catena']})
+    assert len(sortear(facetas, vacia, 3, ANIO, semilla=1)[0]) == 0
+
+
+def test_recomendar_devuelve_filas_en_el_orden_del_sorteo(facetas):
+    posiciones, puntajes = sortear(facetas, todas(facetas), 4, ANIO, semilla=7)
+    elegidos = recomendar(facetas, todas(facetas), n=4, anio_actual=ANIO, semilla=7)
+    assert elegidos['id'].tolist() == facetas.df['id'].iloc[posiciones].tolist()
+    np.testing.assert_allclose(elegidos['puntaje'], puntajes)
+
+
+def test_recientes_por_fecha_de_consumo():
+    df = pd.DataFrame({
+        'id': [1, 2, 3, 4, 5, 6],
+        'ubicacion': ['Consumido'] * 5 + ['Cava Eléctrica'],
+        'fecha_consumo': ['2025-03-01T20:00:00', None, '2024-12-31T23:00:00', '2025-03-01T20:00:00',
+                          '2025-01-15T21:30:00', '2025-06-01T00:00:00'],
+    })
+    # Sin fecha cuenta como lo más viejo; a igual fecha manda el orden de la hoja
+    assert consumidos_recientes(df, 4)['id'].tolist() == [3, 5, 1, 4]
+    assert consumidos_recientes(df.drop(columns='fecha_consumo'), 2)['id'].tolist() == [4, 5]
+
+
+# --- FACETAS ---
+def inventario_grande(categorias):
+    rng = np.random.default_rng(3)
+    n = 600
+    df = pd.DataFrame({
+        'id': np.arange(n),
+        'uva_principal': rng.choice(['Malbec', 'Syrah', 'Cabernet Franc', 'Blend', None], n),
+        'bodega': rng.choice(['Catena', 'Zuccardi', 'Norton', 'Achaval', 'El Enemigo'], n),
+        'anada': rng.choice([2015, 2018, 2019, 2020, 2021], n),
+        'procedencia': rng.choice(['Gualtallary', 'Altamira', 'Agrelo', None], n),
+        'anio_limite': rng.integers(2020, 2035, n),
+    })
+    if categorias:
+        for col in ('uva_principal', 'bodega', 'procedencia'):
+            df[col] = df[col].astype('category')
+        # Categoría sin botellas (p.ej. se bebió la última)
+        df['bodega'] = df['bodega'].cat.add_categories(['Sin botellas'])
+    return df
+
+
+@pytest.mark.parametrize('categorias', [False, True])
+@pytest.mark.parametrize('anio_limite_max', [None, 2026])
+def test_conteos_iguales_a_value_counts(categorias, anio_limite_max):
+    df = inventario_grande(categorias)
+    facetas = IndiceFacetas(df)
+    filtros = {
+        'uva_principal': ['Malbec', 'Blend', 'Inexistente'],
+        'bodega': ['Catena', 'Zuccardi'],
+        'anada': [2019, 2020, 2021],
+        'procedencia': [],
+    }
+    base = df['anio_limite'] <= anio_limite_max if anio_limite_max else pd.Series(True, index=df.index)
+    for col in ('uva_principal', 'bodega', 'anada', 'procedencia'):
+        # Cada faceta se cuenta con las demás selecciones, no con la propia
+        filtrado = df[base & np.logical_and.reduce(
+            [df[c].isin(v) for c, v in filtros.items() if v and c != col] + [np.ones(len(df), dtype=bool)]
+        )]
+        esperados = filtrado[col].value_counts()
+        conteos = facetas.conteos(col, filtros, anio_limite_max)
+        assert list(conteos) == facetas.opciones(col) == sorted(df[col].dropna().unique().tolist())
+        assert conteos == {v: int(esperados.get(v, 0)) for v in conteos}
+        assert sum(conteos.values()) == filtrado[col].notna().sum()
+
+    mascara = facetas.mascara(filtros, anio_limite_max)
+    esperado = base & np.logical_and.reduce([df[c].isin(v) for c, v in filtros.items() if v])
+    np.testing.assert_array_equal(mascara, esperado.to_numpy())
+    assert facetas.filtrar(filtros, anio_limite_max)['id'].tolist() == df['id'][esperado].tolist()
+
+
+def test_valor_que_ya_no_existe_no_filtra():
+    facetas = IndiceFacetas(inventario_grande(True))
+    assert facetas.mascara({'bodega': ['Sin botellas', 'Inexistente']}).all()
+    assert 'Sin botellas' not in facetas.conteos('bodega', {})
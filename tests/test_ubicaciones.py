@@ -0,0 +1,86 @@
+"""`IndiceOcupacion`: botellas por mueble al día con altas, movimientos y bajas."""
+import pandas as pd
+import pytest
+
+from almacen import AGREGAR, BORRAR, PARCHEAR, Mutacion
+from inventario import Inventario
+from ubicaciones import CAPACIDADES_BASE, IndiceOcupacion, cargar_capacidades
+
+CAPACIDADES = {'Cava Eléctrica': 3, 'Mueble Norte - Bandejas': 2, 'Mueble Norte - Botelleros': 4}
+
+
+def ocupacion():
+    return IndiceOcupacion(CAPACIDADES)
+
+
+def vinos():
+    return pd.DataFrame({
+        'id': [1, 2, 3, 4, 5],
+        'nombre': ['A', 'B', 'C', 'D', 'E'],
+        'ubicacion': ['Cava Eléctrica', 'Cava Eléctrica', 'Mueble Norte - Bandejas',
+                      'Consumido', 'Por Clasificar'],
+    })
+
+
+@pytest.fixture
+def inventario():
+    inventario = Inventario(vinos, indices={'ocupacion': ocupacion})
+    inventario.obtener()
+    return inventario
+
+
+def por_ubicacion(indice):
+    return {u: ids for u, ids in indice._ids.items() if ids}
+
+
+def test_botellas_y_libres_por_mueble(inventario):
+    indice = inventario.indice('ocupacion')
+    assert indice.ids_en('Cava Eléctrica') == {1, 2}
+    assert (indice.botellas('Mueble Norte - Bandejas'), indice.libres('Mueble Norte - Bandejas')) == (1, 1)
+    # Sin capacidad configurada no se controla
+    assert indice.botellas('Consumido') == 1 and indice.libres('Consumido') is None
+    filas = {f['ubicacion']: f for f in indice.ocupacion()}
+    assert filas['Cava Eléctrica']['llenado'] == pytest.approx(2 / 3)
+    assert filas['Mueble Norte - Botelleros']['mueble'] == 'Mueble Norte'
+    assert indice.sugerir_lugar() == 'Mueble Norte - Botelleros'
+
+
+def test_incremental_igual_a_reconstruir(inventario):
+    indice = inventario.indice('ocupacion')
+    inventario.aplicar([
+        Mutacion(AGREGAR, 6, {'nombre': 'F', 'ubicacion': 'Mueble Norte - Bandejas'}),
+        Mutacion(PARCHEAR, 5, {'ubicacion': 'Cava Eléctrica'}),
+        Mutacion(PARCHEAR, 1, {'ubicacion': 'Consumido'}),
+        Mutacion(PARCHEAR, 3, {'nombre': 'C bis'}),  # No cambia de lugar
+        Mutacion(BORRAR, 2, {}),
+    ])
+    assert inventario.indice('ocupacion') is indice
+    assert por_ubicacion(indice) == por_ubicacion(ocupacion().construir(inventario.obtener().df))
+    assert indice.ids_en('Cava Eléctrica') == {5}
+    assert indice.ids_en('Consumido') == {1, 4}
+    assert indice.libres('Mueble Norte - Bandejas') == 0
+    assert indice.ocupacion() == ocupacion().construir(inventario.obtener().df).ocupacion()
+
+
+def test_sugerir_lugar_con_muebles_llenos(inventario):
+    indice = inventario.indice('ocupacion')
+    inventario.aplicar([
+        Mutacion(AGREGAR, 10 + n, {'nombre': 'X', 'ubicacion': 'Mueble Norte - Botelleros'})
+        for n in range(4)
+    ])
+    # El menos lleno: Bandejas (1/2) antes que la cava (2/3)
+    assert indice.sugerir_lugar() == 'Mueble Norte - Bandejas'
+    assert indice.sugerir_lugar(excluir={'Mueble Norte - Bandejas'}) == 'Cava Eléctrica'
+    excluidos = {'Mueble Norte - Bandejas', 'Cava Eléctrica'}
+    assert indice.sugerir_lugar(excluir=excluidos) is None
+    inventario.aplicar([Mutacion(BORRAR, 10, {})])
+    assert indice.sugerir_lugar(excluir=excluidos) == 'Mueble Norte - Botelleros'
+
+
+def test_capacidades_desde_el_entorno():
+    assert cargar_capacidades('') == CAPACIDADES_BASE
+    capacidades = cargar_capacidades('{"Cava Eléctrica": 48, "Sótano": "100"}')
+    assert (capacidades['Cava Eléctrica'], capacidades['Sótano']) == (48, 100)
+    # Un JSON mal formado no impide arrancar
+    assert cargar_capacidades('{"Cava Eléctrica": 48') == CAPACIDADES_BASE
+    assert cargar_capacidades('[1, 2]') == CAPACIDADES_BASE
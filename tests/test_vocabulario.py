@@ -0,0 +1,92 @@
+"""`IndiceVocabulario`: formas canónicas, cortes y mantenimiento fila a fila."""
+import pandas as pd
+import pytest
+
+from almacen import AGREGAR, BORRAR, PARCHEAR, Mutacion
+from inventario import Inventario
+from vocabulario import UVAS_BASE_ESTANDAR, IndiceVocabulario, partes_blend
+
+
+def vocabulario():
+    return IndiceVocabulario(base={'uva_principal': UVAS_BASE_ESTANDAR})
+
+
+def vinos():
+    return pd.DataFrame({
+        'id': [1, 2, 3, 4],
+        'nombre': ['Nicasia', 'Gran Enemigo', 'Corte', 'Otro'],
+        'bodega': ['Catena Zapata', 'El Enemigo', 'Zuccardi', 'zuccardi '],
+        'enologo': ['', 'Alejandro Vigil', 'Sebastián Zuccardi', ''],
+        'uva_principal': ['malbec', 'Blend', 'Blend', 'Syrah'],
+        'composicion_blend': ['', 'Cabernet Franc / Malbec', 'Malbec, Merlot,Petit Verdot', ''],
+        'procedencia': ['Altamira', 'Gualtallary', 'Altamira', ''],
+        'gama': ['', '', '', ''],
+    })
+
+
+@pytest.fixture
+def inventario():
+    inventario = Inventario(vinos, indices={'vocabulario': vocabulario})
+    inventario.obtener()
+    return inventario
+
+
+def estado(indice):
+    return {c: (dict(v.formas), list(v.claves)) for c, v in indice._campos.items()}
+
+
+@pytest.mark.parametrize('texto, partes', [
+    ('Malbec / Merlot', ['Malbec', 'Merlot']),
+    ('Malbec, Merlot,Petit  Verdot', ['Malbec', 'Merlot', 'Petit Verdot']),
+    ('Cabernet Franc/Malbec/', ['Cabernet Franc', 'Malbec']),
+    ('', []),
+    (None, []),
+])
+def test_partes_blend(texto, partes):
+    assert partes_blend(texto) == partes
+
+
+def test_componentes_del_corte_son_uvas(inventario):
+    indice = inventario.indice('vocabulario')
+    for uva in ('Merlot', 'Petit Verdot', 'Cabernet Franc'):
+        assert indice.conocido('uva_principal', uva)
+    # Malbec: una como uva principal y dos dentro de cortes
+    assert indice._campos['uva_principal'].usos('malbec') == 3
+    # La forma estándar gana aunque en la hoja se haya escrito en minúsculas
+    assert indice.normalizar('uva_principal', ' MALBEC ') == 'Malbec'
+    assert indice.valores('uva_principal')[0] == 'Malbec'
+
+
+def test_sugerir_y_normalizar(inventario):
+    indice = inventario.indice('vocabulario')
+    assert indice.sugerir('bodega', 'zu') == ['Zuccardi']
+    assert indice.normalizar('bodega', 'ZUCCARDI') == 'Zuccardi'
+    assert indice.normalizar('bodega', 'Bodega Nueva') == 'Bodega Nueva'
+    assert indice.sugerir('procedencia', 'a') == ['Altamira']
+    assert indice.valores('gama') == []
+
+
+def test_incremental_igual_a_reconstruir(inventario):
+    indice = inventario.indice('vocabulario')
+    inventario.aplicar([
+        Mutacion(AGREGAR, 5, {'nombre': 'Nuevo', 'bodega': 'Norton', 'uva_principal': 'Blend',
+                              'composicion_blend': 'Malbec/Bonarda', 'gama': 'Reserva'}),
+        Mutacion(PARCHEAR, 3, {'composicion_blend': 'Malbec, Cabernet Franc'}),
+        Mutacion(PARCHEAR, 2, {'enologo': 'Santiago Mayorga'}),
+        Mutacion(BORRAR, 4, {}),
+    ])
+    assert inventario.indice('vocabulario') is indice
+    desde_cero = vocabulario().construir(inventario.obtener().df)
+    assert estado(indice) == estado(desde_cero)
+
+    uvas = indice._campos['uva_principal']
+    # Merlot solo estaba en el corte que cambió; como es estándar se sigue ofreciendo
+    assert uvas.usos('merlot') == 0 and indice.conocido('uva_principal', 'Merlot')
+    assert (uvas.usos('malbec'), uvas.usos('cabernet franc'), uvas.usos('bonarda')) == (4, 2, 1)
+    assert uvas.usos('syrah') == 0  # Solo la usaba la botella borrada
+    # Un valor no estándar sin usos sale del vocabulario
+    assert not indice.conocido('enologo', 'Alejandro Vigil')
+    assert indice.sugerir('bodega', 'zu') == ['Zuccardi']
+    assert indice.valores('gama') == ['Reserva']
+    for campo in ('uva_principal', 'bodega', 'enologo', 'procedencia', 'gama'):
+        assert indice.valores(campo) == desde_cero.valores(campo)
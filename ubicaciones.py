@@ -0,0 +1,125 @@
+"""
+Ocupación de los muebles de la bodega (sin Streamlit).
+
+`IndiceOcupacion` mantiene ubicación -> ids de las botellas que están ahí,
+al día con cada alta, movimiento, consumo y baja (es un `IndiceIncremental`),
+así el mapa y la sugerencia de lugar libre no agrupan el frame en cada rerun.
+
+Las capacidades se pueden ajustar con la variable de entorno
+VINOTECA_CAPACIDADES (JSON {"ubicación": botellas}).
+"""
+import json
+import logging
+import os
+import threading
+
+from inventario import IndiceIncremental
+
+logger = logging.getLogger('vinoteca.ubicaciones')
+
+# Botellas que entran en cada mueble; las ubicaciones sin capacidad no se controlan
+CAPACIDADES_BASE = {
+    'Cava Eléctrica': 24,
+    'Mueble Norte - Botelleros': 36,
+    'Mueble Norte - Bandejas': 24,
+    'Mueble Este - Bandejas': 24,
+    'Mueble Este - Cajonera': 12,
+    'Mueble Este - X Grande': 30,
+    'Mueble Este - Media X': 15,
+    'Mueble Sur - Retícula Superior': 20,
+    'Mueble Sur - X Izquierda': 15,
+    'Mueble Sur - X Centro': 15,
+    'Mueble Sur - X Derecha': 15,
+}
+
+
+def cargar_capacidades(texto=None):
+    """
+    CAPACIDADES_BASE con los cambios de `texto` (por defecto
+    VINOTECA_CAPACIDADES). Si no es un JSON {"ubicación": botellas} válido
+    se avisa en el log y se usan las de base: la app arranca igual.
+    """
+    texto = os.environ.get('VINOTECA_CAPACIDADES', '') if texto is None else texto
+    capacidades = dict(CAPACIDADES_BASE)
+    if not texto.strip():
+        return capacidades
+    try:
+        cambios = json.loads(texto)
+        if not isinstance(cambios, dict):
+            raise ValueError('se esperaba un objeto {"ubicación": botellas}')
+        capacidades.update({str(u): int(n) for u, n in cambios.items()})
+    except (TypeError, ValueError) as e:
+        logger.warning('VINOTECA_CAPACIDADES inválido (%s); se usan las capacidades por defecto', e)
+        return dict(CAPACIDADES_BASE)
+    return capacidades
+
+
+CAPACIDADES = cargar_capacidades()
+
+
+def mueble_de(ubicacion):
+    """'Mueble Norte - Bandejas' -> 'Mueble Norte' (para agrupar el mapa)."""
+    return ubicacion.split(' - ')[0]
+
+
+class IndiceOcupacion(IndiceIncremental):
+    def __init__(self, capacidades=None):
+        self.capacidades = dict(CAPACIDADES if capacidades is None else capacidades)
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def construir(self, df):
+        ids = {}
+        if not df.empty and {'id', 'ubicacion'} <= set(df.columns):
+            # Una sola agrupación por lectura completa; después, fila a fila
+            id_por_pos = df['id'].to_numpy()
+            for ubicacion, posiciones in df.groupby('ubicacion', observed=True, sort=False).indices.items():
+                ids[ubicacion] = set(int(i) for i in id_por_pos[posiciones])
+        self._ids = ids
+        return self
+
+    def actualizar(self, id_vino, antes, despues):
+        with self._lock:
+            if antes is not None:
+                lugar = self._ids.get(antes.get('ubicacion'))
+                if lugar is not None:
+                    lugar.discard(id_vino)
+            if despues is not None and isinstance(despues.get('ubicacion'), str):
+                self._ids.setdefault(despues['ubicacion'], set()).add(id_vino)
+
+    def ids_en(self, ubicacion):
+        with self._lock:
+            return set(self._ids.get(ubicacion, ()))
+
+    def botellas(self, ubicacion):
+        with self._lock:
+            return len(self._ids.get(ubicacion, ()))
+
+    def libres(self, ubicacion):
+        """Lugares libres (None si la ubicación no tiene capacidad configurada)."""
+        capacidad = self.capacidades.get(ubicacion)
+        return None if capacidad is None else capacidad - self.botellas(ubicacion)
+
+    def ocupacion(self):
+        """Una fila por mueble con capacidad: botellas, capacidad, libres y % lleno."""
+        with self._lock:
+            return [
+                {
+                    'ubicacion': u,
+                    'mueble': mueble_de(u),
+                    'botellas': len(self._ids.get(u, ())),
+                    'capacidad': capacidad,
+                    'libres': max(0, capacidad - len(self._ids.get(u, ()))),
+                    'llenado': min(1.0, len(self._ids.get(u, ())) / capacidad) if capacidad else 1.0,
+                }
+                for u, capacidad in self.capacidades.items()
+            ]
+
+    def sugerir_lugar(self, excluir=()):
+        """El mueble con capacidad menos lleno que tenga lugar (None si está todo lleno)."""
+        candidatos = [
+            f for f in self.ocupacion() if f['libres'] > 0 and f['ubicacion'] not in excluir
+        ]
+        if not candidatos:
+            return None
+        return min(candidatos, key=lambda f: f['llenado'])['ubicacion']
@@ -0,0 +1,163 @@
+"""
+Vocabulario de los campos del formulario (sin Streamlit).
+
+`IndiceVocabulario` guarda, por campo, los valores distintos con cuántas
+botellas los usan y un índice de prefijos (claves normalizadas ordenadas).
+Sirve para las opciones de autocompletado y para normalizar lo que se
+escribe a la forma ya usada ("malbec " -> "Malbec", "zuccardi" ->
+"Zuccardi"), así un mismo valor no se parte en varias facetas.
+
+Es un `IndiceIncremental`: se cuenta una vez por lectura completa y
+después se mantiene con cada mutación.
+"""
+import bisect
+import re
+import threading
+from collections import Counter
+
+from inventario import IndiceIncremental, normalizar_texto
+
+CAMPOS_VOCABULARIO = ['uva_principal', 'bodega', 'enologo', 'procedencia', 'gama']
+UVAS_BASE_ESTANDAR = [
+    'Malbec', 'Cabernet Sauvignon', 'Merlot', 'Syrah', 'Chardonnay',
+    'Pinot Noir', 'Torrontés', 'Bonarda', 'Petit Verdot', 'Cabernet Franc',
+    'Blend', 'Otro'
+]
+MAX_SUGERENCIAS = 8
+# "Malbec, Merlot" (formulario) o "Malbec/Cabernet Franc" (importador)
+SEPARADOR_BLEND = r'[,/]'
+
+
+def limpiar_valor(valor):
+    """Texto sin espacios sobrantes ('' para vacíos / NaN)."""
+    if not isinstance(valor, str):
+        return ''
+    return re.sub(r'\s+', ' ', valor).strip()
+
+
+def partes_blend(texto):
+    """Componentes de un corte, limpios ('Malbec / Merlot' -> ['Malbec', 'Merlot'])."""
+    if not isinstance(texto, str):
+        return []
+    return [v for v in map(limpiar_valor, re.split(SEPARADOR_BLEND, texto)) if v]
+
+
+def _valores_de_fila(fila, campo):
+    # Los componentes de un corte también son uvas usadas
+    valores = [limpiar_valor(fila.get(campo))]
+    if campo == 'uva_principal':
+        valores += partes_blend(fila.get('composicion_blend'))
+    return [v for v in valores if v]
+
+
+class _Campo:
+    """clave normalizada -> Counter(forma escrita -> usos), y claves ordenadas."""
+    def __init__(self, base=()):
+        self.formas = {}
+        self.claves = []
+        # Formas estándar: ganan aunque otra grafía se use más
+        self.base = {}
+        self.cache = None
+        for valor in base:
+            clave = normalizar_texto(valor)
+            self.base[clave] = valor
+            self._alta_clave(clave)
+
+    def _alta_clave(self, clave):
+        if clave not in self.formas:
+            self.formas[clave] = Counter()
+            bisect.insort(self.claves, clave)
+
+    def sumar(self, valor, n=1):
+        clave = normalizar_texto(valor)
+        if not clave or not n:
+            return
+        self._alta_clave(clave)
+        formas = self.formas[clave]
+        formas[valor] += n
+        if formas[valor] <= 0:
+            del formas[valor]
+            if not formas and clave not in self.base:
+                del self.formas[clave]
+                del self.claves[bisect.bisect_left(self.claves, clave)]
+        self.cache = None
+
+    def canonica(self, clave):
+        if clave in self.base:
+            return self.base[clave]
+        formas = self.formas.get(clave)
+        return formas.most_common(1)[0][0] if formas else None
+
+    def usos(self, clave):
+        return sum(self.formas.get(clave, {}).values())
+
+
+class IndiceVocabulario(IndiceIncremental):
+    """
+    `base` = {campo: valores estándar} que se ofrecen aunque ninguna botella
+    los use todavía (p.ej. las uvas más comunes).
+    """
+    def __init__(self, base=None, campos=CAMPOS_VOCABULARIO):
+        self._base = dict(base or {})
+        self._campos = {c: _Campo(self._base.get(c, ())) for c in campos}
+        self._lock = threading.Lock()
+
+    def construir(self, df):
+        for campo, vocab in self._campos.items():
+            if campo not in df.columns:
+                continue
+            # value_counts cuenta una vez por valor distinto (categorías: por código)
+            for valor, n in df[campo].value_counts().items():
+                vocab.sumar(limpiar_valor(valor), int(n))
+            if campo == 'uva_principal' and 'composicion_blend' in df.columns:
+                partes = df['composicion_blend'].dropna().astype(str).str.split(SEPARADOR_BLEND, regex=True).explode()
+                for valor, n in partes.map(limpiar_valor).value_counts().items():
+                    vocab.sumar(valor, int(n))
+        return self
+
+    def actualizar(self, id_vino, antes, despues):
+        with self._lock:
+            for campo, vocab in self._campos.items():
+                for fila, signo in ((antes, -1), (despues, 1)):
+                    if fila is not None:
+                        for valor in _valores_de_fila(fila, campo):
+                            vocab.sumar(valor, signo)
+
+    def valores(self, campo):
+        """Formas canónicas del campo, de la más usada a la menos (empates: alfabético)."""
+        with self._lock:
+            vocab = self._campos[campo]
+            if vocab.cache is None:
+                orden = sorted(vocab.claves, key=lambda c: -vocab.usos(c))
+                vocab.cache = [vocab.canonica(c) for c in orden]
+            return list(vocab.cache)
+
+    def sugerir(self, campo, prefijo, limite=MAX_SUGERENCIAS):
+        """Valores cuya forma normalizada empieza con `prefijo`, los más usados primero."""
+        prefijo = normalizar_texto(prefijo)
+        with self._lock:
+            vocab = self._campos[campo]
+            desde = bisect.bisect_left(vocab.claves, prefijo)
+            hasta = bisect.bisect_left(vocab.claves, prefijo + '\uffff')
+            claves = sorted(vocab.claves[desde:hasta], key=lambda c: -vocab.usos(c))
+            return [vocab.canonica(c) for c in claves[:limite]]
+
+    def conocido(self, campo, valor):
+        with self._lock:
+            return normalizar_texto(valor) in self._campos[campo].formas
+
+    def normalizar(self, campo, valor):
+        """La forma ya usada de `valor` si existe; si no, `valor` limpio."""
+        valor = limpiar_valor(valor)
+        if not valor or campo not in self._campos:
+            return valor
+        with self._lock:
+            return self._campos[campo].canonica(normalizar_texto(valor)) or valor
+
+    def normalizar_frame(self, df):
+        """`normalizar` sobre las columnas del vocabulario (una vez por valor distinto)."""
+        for campo in self._campos:
+            if campo in df.columns:
+                formas = {v: self.normalizar(campo, v) for v in df[campo].dropna().unique()}
+                df[campo] = df[campo].map(formas)
+        return df